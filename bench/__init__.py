@@ -0,0 +1,4 @@
+"""
+Benchmarks for the tagger engine: a synthetic MP3/WAV corpus generator
+(bench.corpus) and a timing harness (python -m bench).
+"""
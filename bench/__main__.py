@@ -0,0 +1,2 @@
+from .harness import main
+raise SystemExit(main())
@@ -0,0 +1,86 @@
+"""
+Synthetic corpus generator for the benchmarks.
+
+Builds a folder tree of valid-enough audio without any encoder:
+  - MP3: a run of silent MPEG-1 Layer III frames (128 kbps, 44.1 kHz)
+  - WAV: 16-bit PCM of a given length, streamed to disk in blocks
+Files can be given an existing ID3 tag (optionally with a cover) so the
+"re-tag" paths are exercised, and spread over a tree of depth x fanout
+folders to stress the scanner.
+"""
+
+import os
+import struct
+from io import BytesIO
+from mutagen.id3 import ID3, TIT2, TPE1, TALB, TRCK, APIC
+# MPEG-1 Layer III, 128 kbps, 44.1 kHz, joint stereo, no CRC: 417-byte frames
+MP3_FRAME = bytes([0xFF, 0xFB, 0x90, 0x64]) + b'\x00' * 413
+MP3_FRAMES_PER_SEC = 44100 / 1152
+WRITE_BLOCK = 1024 * 1024
+def existing_tag(n, cover_kb=0):
+    """Serialized ID3v2.3 tag like one a previous tagger would leave behind."""
+    tag = ID3()
+    tag.add(TIT2(encoding=3, text=[f"Track {n}"]))
+    tag.add(TPE1(encoding=3, text=["Old Artist"]))
+    tag.add(TALB(encoding=3, text=["Old Album"]))
+    tag.add(TRCK(encoding=3, text=[str(n)]))
+    if cover_kb:
+        tag.add(APIC(encoding=3, mime='image/jpeg', type=3, desc='Cover', data=os.urandom(cover_kb * 1024)))
+    f = BytesIO()
+    tag.save(f, v2_version=3)
+    return f.getvalue()
+def write_mp3(path, seconds, tag=b''):
+    frames = max(1, int(seconds * MP3_FRAMES_PER_SEC))
+    block = MP3_FRAME * max(1, WRITE_BLOCK // len(MP3_FRAME))
+    per_block = len(block) // len(MP3_FRAME)
+    with open(path, 'wb') as f:
+        f.write(tag)
+        while frames > 0:
+            n = min(frames, per_block)
+            f.write(block if n == per_block else MP3_FRAME * n)
+            frames -= n
+def write_wav(path, seconds, tag=b'', rate=44100, channels=2):
+    data_size = int(seconds * rate) * channels * 2
+    fmt = struct.pack('<HHIIHH', 1, channels, rate, rate * channels * 2, channels * 2, 16)
+    chunks_size = 4 + (8 + len(fmt)) + (8 + data_size)
+    id3 = b''
+    if tag:
+        id3 = b'id3 ' + struct.pack('<I', len(tag)) + tag + (b'\x00' if len(tag) % 2 else b'')
+    with open(path, 'wb') as f:
+        f.write(b'RIFF' + struct.pack('<I', chunks_size + len(id3)) + b'WAVE')
+        f.write(b'fmt ' + struct.pack('<I', len(fmt)) + fmt)
+        f.write(b'data' + struct.pack('<I', data_size))
+        block = b'\x00' * WRITE_BLOCK
+        left = data_size
+        while left > 0:
+            f.write(block[:min(left, WRITE_BLOCK)])
+            left -= WRITE_BLOCK
+        f.write(id3)
+def leaf_dirs(root, depth, fanout):
+    dirs = [root]
+    for level in range(depth):
+        dirs = [os.path.join(d, f"d{level}_{i:02d}") for d in dirs for i in range(fanout)]
+    return dirs
+def build_corpus(root, mp3=100, wav=20, mp3_seconds=30, wav_seconds=10, depth=2, fanout=3,
+                 existing_tags=True, cover_kb=0, folder_covers=True):
+    """
+    Create the corpus under `root` and return a summary dict. Files are
+    spread round-robin over the leaf folders; with folder_covers each leaf
+    gets a cover.jpg of cover_kb KB (random bytes, never decoded).
+    """
+    dirs = leaf_dirs(root, depth, fanout)
+    for d in dirs:
+        os.makedirs(d, exist_ok=True)
+        if folder_covers and cover_kb:
+            with open(os.path.join(d, 'cover.jpg'), 'wb') as f:
+                f.write(os.urandom(cover_kb * 1024))
+    total_bytes = 0
+    for n in range(mp3):
+        path = os.path.join(dirs[n % len(dirs)], f"track_{n:06d}.mp3")
+        write_mp3(path, mp3_seconds, existing_tag(n + 1, cover_kb) if existing_tags else b'')
+        total_bytes += os.path.getsize(path)
+    for n in range(wav):
+        path = os.path.join(dirs[n % len(dirs)], f"stem_{n:06d}.wav")
+        write_wav(path, wav_seconds, existing_tag(n + 1, cover_kb) if existing_tags else b'')
+        total_bytes += os.path.getsize(path)
+    return {'root': root, 'mp3': mp3, 'wav': wav, 'folders': len(dirs), 'bytes': total_bytes}
@@ -0,0 +1,227 @@
+"""
+Timing harness: python -m bench [options]
+
+Generates a synthetic corpus (see bench.corpus) and times the engine stages
+on it, each in a fresh child process so peak RSS and I/O counters belong to
+that stage alone:
+  gather     TaggerEngine.gather_files() over the tree
+  apply_mp3  apply_meta() on every MP3
+  apply_wav  apply_meta() on every WAV
+  verify     verify_file_tags() on every file
+  run        a full TaggerEngine.run() (--workers / --executor)
+Stages run in that order on the same corpus, so `run` re-tags files that
+already carry the benchmark tags (the common "re-run" case).
+
+Reports files/sec, MB read and written (Linux /proc/self/io) and peak RSS.
+With --baseline, a stage slower than the baseline by more than --tolerance
+makes the exit code 1, so it can gate CI.
+
+Cold start is measured too: fresh interpreters import the config, the
+engine, the CLI (--help) and the GUI module. The import cost on top of a
+bare interpreter must stay within --startup-budget-ms, and the headless
+entry points must not load tkinter or PIL.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import argparse
+import subprocess
+import multiprocessing
+from .corpus import build_corpus
+STAGES = ('gather', 'apply_mp3', 'apply_wav', 'verify', 'run')
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Cold-start probes: (name, python -c code, headless); headless ones must not import tkinter or PIL
+STARTUP_PROBES = [
+    ('interpreter', 'pass', True),
+    ('config', 'import tagger.config', True),
+    ('engine', 'import tagger.engine', True),
+    ('cli_help', 'import sys, tagger.cli\ntry:\n    tagger.cli.main(["--help"])\nexcept SystemExit:\n    pass', True),
+    ('gui_import', 'import mp3tagger', False),
+]
+GUI_ONLY_MODULES = ('tkinter', 'PIL')
+BENCH_FIELDS = {'TPE1': 'Bench Artist', 'TALB': 'Bench Album', 'TCON': 'Ambient', 'TDRC': '2024'}
+def io_counters():
+    """(bytes read, bytes written) by this process so far, or (None, None) off Linux."""
+    try:
+        with open('/proc/self/io') as f:
+            values = dict(line.split(':', 1) for line in f)
+        return int(values['rchar']), int(values['wchar'])
+    except (OSError, KeyError, ValueError):
+        return None, None
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # KiB on Linux, bytes on macOS
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+def _config(root, workers=1, executor='thread'):
+    from tagger.engine import TagConfig
+    return TagConfig(fields=dict(BENCH_FIELDS), folder=root, auto_number=True, workers=workers,
+                     executor=executor, manifest_path='', journal_dir='', embed_cover=True)
+def _stage(name, root, workers, executor):
+    """Run one stage in this process; returns the number of files it handled."""
+    from tagger.engine import TaggerEngine
+    engine = TaggerEngine(_config(root, workers, executor))
+    if name == 'gather':
+        return len(engine.gather_files())
+    if name == 'run':
+        return engine.run().total
+    files = engine.gather_files()
+    if name == 'verify':
+        for path in files:
+            engine.verify_file_tags(path, BENCH_FIELDS)
+        return len(files)
+    ext = '.mp3' if name == 'apply_mp3' else '.wav'
+    files = [p for p in files if p.lower().endswith(ext)]
+    covers = engine.make_cover_cache()
+    for path in files:
+        engine.apply_meta(path, BENCH_FIELDS, cover=covers.for_file(path))
+    return len(files)
+def _child(name, root, workers, executor, queue):
+    r0, w0 = io_counters()
+    t0 = time.perf_counter()
+    try:
+        count = _stage(name, root, workers, executor)
+        error = None
+    except Exception as e:
+        count, error = 0, f"{type(e).__name__} - {e}"
+    seconds = time.perf_counter() - t0
+    r1, w1 = io_counters()
+    queue.put({
+        'stage': name, 'files': count, 'seconds': round(seconds, 4),
+        'files_per_sec': round(count / seconds, 1) if seconds > 0 else None,
+        'mb_read': round((r1 - r0) / 1e6, 2) if r0 is not None else None,
+        'mb_written': round((w1 - w0) / 1e6, 2) if w0 is not None else None,
+        'peak_rss_mb': round(peak_rss_mb(), 1) if peak_rss_mb() is not None else None,
+        'error': error,
+    })
+def run_stage(name, root, workers=1, executor='thread'):
+    """Time one stage in a spawned child process and return its result dict."""
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_child, args=(name, root, workers, executor, queue))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
+def _probe(code, headless):
+    """Wall time (ms) of one fresh interpreter running `code`, and any GUI modules it loaded."""
+    check = (f"\nimport sys\nprint('LEAKED:' + ','.join(sorted({{m.split('.')[0] for m in sys.modules}} & {set(GUI_ONLY_MODULES)!r})))"
+             if headless else "")
+    t0 = time.perf_counter()
+    out = subprocess.run([sys.executable, '-c', code + check], cwd=REPO_ROOT, capture_output=True, text=True)
+    ms = (time.perf_counter() - t0) * 1000
+    if out.returncode:
+        raise RuntimeError(out.stderr.strip().splitlines()[-1] if out.stderr.strip() else f"exit {out.returncode}")
+    leaked = [line[7:] for line in out.stdout.splitlines() if line.startswith('LEAKED:')]
+    return ms, (leaked[-1].split(',') if leaked and leaked[-1] else [])
+def cold_start(runs=5):
+    """Best-of-`runs` cold start per probe: {name: {ms, import_ms, leaked, error}}."""
+    results = {}
+    for name, code, headless in STARTUP_PROBES:
+        try:
+            samples = [_probe(code, headless) for _ in range(runs)]
+            results[name] = {'ms': round(min(ms for ms, _ in samples), 1), 'leaked': samples[0][1], 'error': None}
+        except (OSError, RuntimeError) as e:
+            results[name] = {'ms': None, 'leaked': [], 'error': str(e)}
+    base = results['interpreter']['ms'] or 0
+    for r in results.values():
+        r['import_ms'] = None if r['ms'] is None else round(max(0.0, r['ms'] - base), 1)
+    return results
+def startup_problems(startup, budget_ms):
+    problems = []
+    for name, r in startup.items():
+        if r['leaked']:
+            problems.append(f"{name} imported {', '.join(r['leaked'])}")
+        if name != 'interpreter' and r['import_ms'] is not None and r['import_ms'] > budget_ms:
+            problems.append(f"{name} took {r['import_ms']:.0f} ms over the interpreter (budget {budget_ms:.0f} ms)")
+    return problems
+def compare(results, baseline, tolerance):
+    """Names of stages whose files/sec dropped more than `tolerance` below the baseline."""
+    base = {r['stage']: r for r in baseline.get('stages', [])}
+    slower = []
+    for r in results:
+        old = base.get(r['stage'])
+        if old and old.get('files_per_sec') and r['files_per_sec'] is not None:
+            if r['files_per_sec'] < old['files_per_sec'] * (1 - tolerance):
+                slower.append(r['stage'])
+    return slower
+def _fmt(value, spec):
+    return '-' if value is None else format(value, spec)
+def build_parser():
+    p = argparse.ArgumentParser(prog='python -m bench', description='Benchmark the tagger engine on a synthetic corpus.')
+    p.add_argument('--dir', help='Build the corpus here (default: a temp dir, removed afterwards).')
+    p.add_argument('--mp3', type=int, default=200, help='Number of MP3 files (default 200).')
+    p.add_argument('--wav', type=int, default=50, help='Number of WAV files (default 50).')
+    p.add_argument('--mp3-seconds', type=float, default=30, help='Length of each MP3 (default 30).')
+    p.add_argument('--wav-seconds', type=float, default=10, help='Length of each WAV (default 10).')
+    p.add_argument('--depth', type=int, default=2, help='Folder tree depth (default 2).')
+    p.add_argument('--fanout', type=int, default=4, help='Subfolders per folder (default 4).')
+    p.add_argument('--existing-tags', action=argparse.BooleanOptionalAction, default=True,
+                   help='Give the files an existing ID3 tag first.')
+    p.add_argument('--cover-kb', type=int, default=0, help='Size of the folder covers and existing APIC frames in KB.')
+    p.add_argument('--workers', type=int, default=1, help='Workers for the full run stage.')
+    p.add_argument('--executor', choices=('thread', 'process'), default='thread')
+    p.add_argument('--stages', default=','.join(STAGES), help='Comma-separated stages to run.')
+    p.add_argument('--json', metavar='PATH', help='Write the results as JSON.')
+    p.add_argument('--baseline', metavar='JSON', help='Compare against an earlier --json result.')
+    p.add_argument('--tolerance', type=float, default=0.2, help='Allowed files/sec drop vs. the baseline (default 0.2).')
+    p.add_argument('--keep', action='store_true', help='Keep the generated corpus.')
+    p.add_argument('--startup', action=argparse.BooleanOptionalAction, default=True, help='Measure cold start (default on).')
+    p.add_argument('--startup-runs', type=int, default=5, help='Interpreters started per probe; the fastest counts (default 5).')
+    p.add_argument('--startup-budget-ms', type=float, default=250, help='Allowed import time per probe over a bare interpreter (default 250).')
+    return p
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    stages = [s.strip() for s in args.stages.split(',') if s.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        build_parser().error(f"unknown stages: {', '.join(sorted(unknown))}")
+    root = os.path.abspath(args.dir) if args.dir else tempfile.mkdtemp(prefix='tagger-bench-')
+    try:
+        t0 = time.perf_counter()
+        corpus = build_corpus(root, args.mp3, args.wav, args.mp3_seconds, args.wav_seconds, args.depth,
+                              args.fanout, args.existing_tags, args.cover_kb)
+        print(f"Corpus: {corpus['mp3']} MP3 + {corpus['wav']} WAV in {corpus['folders']} folders, "
+              f"{corpus['bytes'] / 1e6:.1f} MB ({time.perf_counter() - t0:.1f}s) at {root}")
+        results = []
+        print(f"{'stage':<10} {'files':>7} {'sec':>9} {'files/s':>9} {'MB read':>9} {'MB written':>10} {'peak RSS':>9}")
+        for name in stages:
+            r = run_stage(name, root, args.workers, args.executor)
+            results.append(r)
+            print(f"{name:<10} {r['files']:>7} {r['seconds']:>9.3f} {_fmt(r['files_per_sec'], '>9.1f')} "
+                  f"{_fmt(r['mb_read'], '>9.1f')} {_fmt(r['mb_written'], '>10.1f')} {_fmt(r['peak_rss_mb'], '>8.1f')}M")
+            if r['error']:
+                print(f"  error: {r['error']}")
+    finally:
+        if not args.keep and not args.dir:
+            shutil.rmtree(root, ignore_errors=True)
+    report = {'corpus': {k: v for k, v in corpus.items() if k != 'root'}, 'workers': args.workers,
+              'executor': args.executor, 'stages': results}
+    problems = []
+    if args.startup:
+        startup = report['startup'] = cold_start(max(1, args.startup_runs))
+        print(f"{'cold start':<12} {'ms':>8} {'import ms':>10}")
+        for name, r in startup.items():
+            print(f"{name:<12} {_fmt(r['ms'], '>8.1f')} {_fmt(r['import_ms'], '>10.1f')}" + (f"  error: {r['error']}" if r['error'] else ""))
+        problems = startup_problems(startup, args.startup_budget_ms)
+        for problem in problems:
+            print(f"Startup budget: {problem}.")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    status = 1 if problems or any(r['error'] for r in results) else 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            slower = compare(results, json.load(f), args.tolerance)
+        for name in slower:
+            print(f"Regression: {name} is more than {args.tolerance:.0%} slower than the baseline.")
+        if slower:
+            status = 1
+    return status
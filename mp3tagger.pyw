@@ -43,6 +43,11 @@ and applying it to all .mp3 files in a selected directory. It supports:
   - A built-in dark color theme
   - Displaying a banner image at the top (32:9 aspect)
   - Optional immersive dark title-bar on Windows 10/11
+  - A headless engine (tagger package) shared with the command line
+
+The tagging logic lives in tagger/engine.py; this window only collects the
+settings into a TagConfig and shows the engine's log and progress. Keep the
+tagger folder next to this script.
 
 Instructions for Users:
 1. Install Python:
@@ -61,38 +66,46 @@ Instructions for Users:
    - Run: python mp3tag.py (or double-click mp3tag.pyw on Windows).
    - Select a music folder, fill metadata fields, and click "Tag Files" to apply tags.
 
+4. Headless / scripted runs (no Tk needed):
+   - Run: python -m tagger /path/to/album --profile my_profile.json --auto-number
+   - Every profile field and option has a matching flag; see python -m tagger --help.
+
 Dependencies:
     pip install mutagen pillow
 Usage:
     python mp3tag.py
+    python -m tagger FOLDER_OR_FILE [--profile JSON] [options]
 """
 
 import os
+import sys
+import time
 import threading
-import json
+from collections import deque, OrderedDict
 import random
 import re
-import ctypes
 import tkinter as tk
 from tkinter import filedialog, messagebox
 from tkinter.scrolledtext import ScrolledText
 from tkinter import ttk
-from PIL import Image, ImageTk
-from mutagen.id3 import (
-    ID3, TPE1, TPE2, TDRC, TRCK, TCON,
-    TPUB, TSSE, WXXX, TCOP, TCOM,
-    TPE3, TXXX, TALB, APIC
-)
-from mutagen.wave import WAVE
-from mutagen import MutagenError
-import wave # Standard library for WAV handling
-import struct
-from io import BytesIO
-import shutil # For safe file replace
+# Only the light config module at startup; the engine (mutagen) and PIL load on first use
+from tagger.config import PROFILE_PATH, FIELDS, EXECUTORS, TagConfig, load_profile, save_profile
+from tagger.covers import read_cover
 # Windows DWM attribute for dark mode
 DWMWA_USE_IMMERSIVE_DARK_MODE = 20 # Windows 10 1903+, Win11
-# Default profile path
-PROFILE_PATH = os.path.join(os.path.expanduser("~"), ".mp3_tagger_profile.json")
+# Log widget: flush interval and number of lines kept on screen
+LOG_FLUSH_MS = 100
+LOG_MAX_LINES = 5000
+# Banner: final (LANCZOS) render once resizing pauses this long, fast previews at most this often while
+# dragging, and how many rendered widths are kept
+BANNER_SETTLE_MS = 150
+BANNER_PREVIEW_MS = 50
+BANNER_CACHE_SIZE = 4
+# Preview table: row height, and how often rows the reader finished are redrawn
+PREVIEW_ROW_PX = 20
+PREVIEW_REFRESH_MS = 50
+PREVIEW_COLUMNS = (('file', 'File', 260), ('trck', 'Track', 60), ('talb', 'Album', 140), ('tpe1', 'Artist', 140),
+                   ('new_trck', 'New Track', 70), ('new_talb', 'New Album', 140), ('new_tpe1', 'New Artist', 140))
 class Tooltip:
     def __init__(self, widget, text):
         self.widget = widget
@@ -111,6 +124,185 @@ class Tooltip:
         if self.tooltip:
             self.tooltip.destroy()
             self.tooltip = None
+class LogPump:
+    """
+    Batches log lines and progress from any thread into the Tk log widget.
+    Worker threads only append to a buffer; at most one flush per interval_ms
+    is scheduled on the Tk loop, which inserts all pending lines at once and
+    trims the widget to the last max_lines (a ring buffer). Progress is
+    coalesced to the latest value and applied at the same rate. If a log
+    file is open, every line is also written there in full.
+    """
+    def __init__(self, widget, on_progress=None, max_lines=LOG_MAX_LINES, interval_ms=LOG_FLUSH_MS):
+        self.widget = widget
+        self.on_progress = on_progress
+        self.max_lines = max_lines
+        self.interval_ms = interval_ms
+        self._lock = threading.Lock()
+        self._pending = deque(maxlen=max_lines)
+        self._dropped = 0
+        self._progress = None
+        self._scheduled = False
+        self._file = None
+    def write(self, message):
+        with self._lock:
+            if len(self._pending) == self.max_lines:
+                self._dropped += 1
+            self._pending.append(message)
+            if self._file:
+                self._file.write(message + '\n')
+            self._schedule()
+    def progress(self, done, total):
+        with self._lock:
+            self._progress = (done, total)
+            self._schedule()
+    def _schedule(self):
+        # Caller holds the lock
+        if not self._scheduled:
+            self._scheduled = True
+            self.widget.after(self.interval_ms, self.flush)
+    def flush(self):
+        """Apply pending lines and progress now (Tk thread only)."""
+        with self._lock:
+            lines = list(self._pending)
+            self._pending.clear()
+            dropped, self._dropped = self._dropped, 0
+            progress, self._progress = self._progress, None
+            self._scheduled = False
+            if self._file:
+                self._file.flush()
+        if progress and self.on_progress:
+            self.on_progress(*progress)
+        if not lines:
+            return
+        if dropped:
+            lines.insert(0, f"… {dropped} lines not shown …")
+        w = self.widget
+        w.config(state='normal')
+        w.insert('end', '\n'.join(lines) + '\n')
+        excess = int(w.index('end-1c').split('.')[0]) - 1 - self.max_lines
+        if excess > 0:
+            w.delete('1.0', f'{excess + 1}.0')
+        w.yview('end')
+        w.config(state='disabled')
+    def clear(self):
+        with self._lock:
+            self._pending.clear()
+            self._dropped = 0
+        self.widget.config(state='normal')
+        self.widget.delete('1.0', 'end')
+        self.widget.config(state='disabled')
+    def open_file(self, path):
+        """Append every following line to `path` until close_file()."""
+        f = open(path, 'a', encoding='utf-8')
+        with self._lock:
+            self._file = f
+    def close_file(self):
+        with self._lock:
+            f, self._file = self._file, None
+        if f:
+            f.close()
+class PreviewWindow(tk.Toplevel):
+    """
+    Virtualized file preview over a tagger.preview.PreviewModel. The Treeview
+    only ever holds as many rows as fit in the window; scrolling moves a
+    window over the model and rewrites those rows in place, so 100k files
+    cost no more widgets than 30. Rows not read yet show '…' and are filled
+    in as the model's reader gets to them.
+    """
+    def __init__(self, master, model, title):
+        super().__init__(master)
+        self.model = model
+        self.first = 0
+        self._items = []
+        self._refresh_job = None
+        self.title(f"Preview - {title}")
+        self.geometry("900x520")
+        self.configure(bg=master.bg_color)
+        master.style.configure('Preview.Treeview', rowheight=PREVIEW_ROW_PX, background=master.entry_bg,
+                               fieldbackground=master.entry_bg, foreground=master.fg_color)
+        frame = ttk.Frame(self)
+        frame.pack(fill='both', expand=True, padx=8, pady=(8, 0))
+        self.tree = ttk.Treeview(frame, columns=[c for c, _, _ in PREVIEW_COLUMNS], show='headings',
+                                 selectmode='none', style='Preview.Treeview')
+        for column, heading, width in PREVIEW_COLUMNS:
+            self.tree.heading(column, text=heading, anchor='w')
+            self.tree.column(column, width=width, anchor='w', stretch=column == 'file')
+        self.tree.tag_configure('changed', foreground='#ffd479')
+        self.tree.tag_configure('error', foreground='#ff7b7b')
+        self.scroll = ttk.Scrollbar(frame, orient='vertical', command=self._on_scrollbar)
+        self.scroll.pack(side='right', fill='y')
+        self.tree.pack(side='left', fill='both', expand=True)
+        self.status = ttk.Label(self, text=f"{len(model)} files. Highlighted rows will change.")
+        self.status.pack(fill='x', padx=8, pady=6)
+        self.tree.bind('<Configure>', self._on_configure)
+        for sequence in ('<MouseWheel>', '<Button-4>', '<Button-5>'):
+            self.tree.bind(sequence, self._on_wheel)
+        for key, move in (('<Up>', (-1, 'units')), ('<Down>', (1, 'units')), ('<Prior>', (-1, 'pages')), ('<Next>', (1, 'pages'))):
+            self.bind(key, lambda event, move=move: self._on_scrollbar('scroll', *move))
+        self.bind('<Home>', lambda event: self.show_from(0))
+        self.bind('<End>', lambda event: self.show_from(len(self.model)))
+        model.on_loaded = self._loaded
+        self.protocol('WM_DELETE_WINDOW', self.close)
+    def _on_configure(self, event):
+        # The heading takes about one row
+        rows = max(1, event.height // PREVIEW_ROW_PX - 1)
+        while len(self._items) < rows:
+            self._items.append(self.tree.insert('', 'end', values=()))
+        if len(self._items) > rows:
+            self.tree.delete(*self._items[rows:])
+            del self._items[rows:]
+        self.show_from(self.first)
+    def _on_scrollbar(self, action, amount, unit=None):
+        if action == 'moveto':
+            self.show_from(int(float(amount) * len(self.model)))
+        else:
+            step = len(self._items) if unit == 'pages' else 1
+            self.show_from(self.first + int(amount) * step)
+    def _on_wheel(self, event):
+        if event.num == 4 or event.delta > 0:
+            self.show_from(self.first - 3)
+        else:
+            self.show_from(self.first + 3)
+        return 'break'
+    def show_from(self, first):
+        """Show the rows starting at index `first` (clamped) and ask the reader for them."""
+        total, rows = len(self.model), len(self._items)
+        self.first = max(0, min(first, total - rows))
+        self._draw()
+        self.scroll.set(*((self.first / total, (self.first + rows) / total) if total else (0, 1)))
+        self.model.request(self.first, rows)
+    def _draw(self):
+        for k, item in enumerate(self._items):
+            i = self.first + k
+            if i >= len(self.model):
+                self.tree.item(item, values=(), tags=())
+                continue
+            row = self.model.row(i)
+            if row is None:
+                self.tree.item(item, values=(self.model.name(i),) + ('…',) * 6, tags=())
+            elif row[2]:
+                self.tree.item(item, values=(self.model.name(i), '', row[2]), tags=('error',))
+            else:
+                current, planned, _ = row
+                self.tree.item(item, values=(self.model.name(i),) + current + planned,
+                               tags=('changed',) if current != planned else ())
+    def _loaded(self):
+        # Reader thread: keep at most one redraw pending on the Tk loop
+        if self._refresh_job is None:
+            try:
+                self._refresh_job = self.after(PREVIEW_REFRESH_MS, self._refresh)
+            except (RuntimeError, tk.TclError):
+                pass # window closed meanwhile
+    def _refresh(self):
+        self._refresh_job = None
+        self._draw()
+    def close(self):
+        self.model.on_loaded = lambda: None
+        self.model.close()
+        if self._refresh_job is not None:
+            self.after_cancel(self._refresh_job)
+        self.destroy()
 class MP3TaggerGUI(tk.Tk):
     def __init__(self):
         super().__init__()
@@ -136,6 +328,9 @@ class MP3TaggerGUI(tk.Tk):
         self.style.configure('Horizontal.TProgressbar', troughcolor=self.entry_bg, background='#888888')
         # Immersive dark title-bar on Windows
         try:
+            if sys.platform != 'win32':
+                raise OSError("not Windows")
+            import ctypes
             self.update_idletasks()
             hwnd = ctypes.windll.user32.GetParent(self.winfo_id())
             val = ctypes.c_int(1)
@@ -149,14 +344,17 @@ class MP3TaggerGUI(tk.Tk):
             pass
         # Menu bar
         self._build_menubar()
-        # Top banner (resizes with window width)
-        self.banner_img_orig = self._load_banner_image()
-        if self.banner_img_orig:
-            self._render_banner()
+        # Top banner (resizes with window width); decoded after the first frame is shown
+        self.banner_img_orig = None
+        self._banner_cache = OrderedDict() # width -> PhotoImage, least recently used first
+        self._banner_width = None
+        self._banner_job = None
+        self._banner_preview_at = 0.0
         self.bind('<Configure>', self._on_resize)
         # Main frame
         main = ttk.Frame(self)
         main.pack(fill='both', expand=True)
+        self._main = main
         main.grid_columnconfigure(0, weight=1)
         # Directory
         dir_frame = ttk.Frame(main)
@@ -180,27 +378,10 @@ class MP3TaggerGUI(tk.Tk):
         reset_btn.pack(side='left', padx=4)
         Tooltip(reset_btn, "Clear all metadata fields to blank.")
         # Fields
-        fields = [
-            ("Contributing Artist", "TPE1"),
-            ("Album Artist", "TPE2"),
-            ("Year", "TDRC"),
-            ("Track Number", "TRCK"),
-            ("Genre", "TCON"),
-            ("Publisher", "TPUB"),
-            ("Encoded by", "TSSE"),
-            ("Author URL", "WXXX"),
-            ("Copyright", "TCOP"),
-            ("Composers", "TCOM"),
-            ("Conductors", "TPE3"),
-            ("Group Description", "TXXX:Group Description"),
-            ("Mood", "TXXX:Mood"),
-            ("Album", "TALB"),
-            ("Parental Rating Reason", "TXXX:Parental Rating Reason"),
-        ]
         self.vars = {}
         form = ttk.Frame(main)
         form.grid(row=2, column=0, sticky='ew', padx=8)
-        for label_text, tag_key in fields:
+        for label_text, tag_key in FIELDS:
             row = ttk.Frame(form)
             row.pack(fill='x', pady=2)
             ttk.Label(row, text=label_text+":", width=22, anchor='w').pack(side='left')
@@ -217,6 +398,22 @@ class MP3TaggerGUI(tk.Tk):
         auto_num_chk = ttk.Checkbutton(opt_row1, text="Auto-number tracks", variable=self.auto_number)
         auto_num_chk.pack(side='left', padx=(0,8))
         Tooltip(auto_num_chk, "Automatically assign track numbers based on file order (e.g., 1/10, 2/10).")
+        self.skip_unchanged = tk.BooleanVar(value=False)
+        skip_chk = ttk.Checkbutton(opt_row1, text="Skip unchanged", variable=self.skip_unchanged)
+        skip_chk.pack(side='left', padx=(0,8))
+        Tooltip(skip_chk, "Leave files alone whose tags already match. Files untouched since the last run are skipped without being opened.")
+        self.use_index = tk.BooleanVar(value=False)
+        index_chk = ttk.Checkbutton(opt_row1, text="Use library index", variable=self.use_index)
+        index_chk.pack(side='left', padx=(0,8))
+        Tooltip(index_chk, "Remember the folder's file list between runs and only rescan subfolders that changed (faster on big or network libraries).")
+        self.resume = tk.BooleanVar(value=True)
+        resume_chk = ttk.Checkbutton(opt_row1, text="Resume", variable=self.resume)
+        resume_chk.pack(side='left', padx=(0,8))
+        Tooltip(resume_chk, "If a run with the same fields and folder was cancelled or crashed, continue after the last file it finished.")
+        self.backup = tk.BooleanVar(value=False)
+        backup_chk = ttk.Checkbutton(opt_row1, text="Back up tags", variable=self.backup)
+        backup_chk.pack(side='left', padx=(0,8))
+        Tooltip(backup_chk, "Save the original tags of every rewritten file (not the audio) so the run can be undone with python -m tagger --restore.")
         # Row 2: Number options and Embed
         opt_row2 = ttk.Frame(opts)
         opt_row2.pack(fill='x')
@@ -229,6 +426,10 @@ class MP3TaggerGUI(tk.Tk):
         self.offset_spin = ttk.Spinbox(opt_row2, from_=1, to=9999, textvariable=self.track_offset, width=5)
         self.offset_spin.pack(side='left', padx=(4,12))
         Tooltip(self.offset_spin, "Starting number for auto-numbering (e.g., 1 for 1/total, 2 for 2/total).")
+        self.album_mode = tk.BooleanVar(value=False)
+        album_chk = ttk.Checkbutton(opt_row2, text="Per-album", variable=self.album_mode)
+        album_chk.pack(side='left', padx=(0,8))
+        Tooltip(album_chk, "Treat every folder as its own album: numbering restarts in each folder and folders are tagged in parallel.")
         self.embed_cover = tk.BooleanVar(value=True)
         embed_chk = ttk.Checkbutton(opt_row2, text="Embed cover", variable=self.embed_cover)
         embed_chk.pack(side='left', padx=(0,8))
@@ -242,11 +443,24 @@ class MP3TaggerGUI(tk.Tk):
         self.verify_writes = tk.BooleanVar(value=True)
         verify_chk = ttk.Checkbutton(opt_row3, text="Verify save", variable=self.verify_writes)
         verify_chk.pack(side='left', padx=(0,8))
-        Tooltip(verify_chk, "After saving, read back tags to confirm they were written correctly.")
+        Tooltip(verify_chk, "After saving, re-parse the written tag to confirm the values are correct (profile option verify_readback re-reads the file from disk).")
         self.force_v23 = tk.BooleanVar(value=True)
         v23_chk = ttk.Checkbutton(opt_row3, text="ID3v2.3", variable=self.force_v23)
         v23_chk.pack(side='left', padx=(0,8))
         Tooltip(v23_chk, "Use ID3v2.3 format for compatibility with older players/Windows (v2.4 may not work everywhere).")
+        ttk.Label(opt_row3, text="Workers:").pack(side='left')
+        self.workers = tk.IntVar(value=1)
+        workers_spin = ttk.Spinbox(opt_row3, from_=1, to=64, textvariable=self.workers, width=4)
+        workers_spin.pack(side='left', padx=(4,8))
+        Tooltip(workers_spin, "Number of files tagged at the same time. 1 tags one file after another.")
+        self.executor = tk.StringVar(value='thread')
+        executor_box = ttk.Combobox(opt_row3, textvariable=self.executor, values=EXECUTORS, state='readonly', width=8)
+        executor_box.pack(side='left')
+        Tooltip(executor_box, "Parallel mode: threads (light, shared memory) or processes (uses all CPU cores).")
+        self.adaptive_io = tk.BooleanVar(value=False)
+        adaptive_chk = ttk.Checkbutton(opt_row3, text="Adaptive I/O", variable=self.adaptive_io)
+        adaptive_chk.pack(side='left', padx=(8,0))
+        Tooltip(adaptive_chk, "For music on a network drive: run as many file operations at once as the drive keeps up with, measured as it goes (up to 32, on threads).")
         # Single-file mode
         single = ttk.Frame(main)
         single.grid(row=4, column=0, sticky='ew', padx=8, pady=(0,6))
@@ -265,6 +479,7 @@ class MP3TaggerGUI(tk.Tk):
         self.single_path = None
         self.single_cover = (None, None)
         self.batch_cover = (None, None)
+        self._profile_config = TagConfig()
         # Progress + actions
         act = ttk.Frame(main)
         act.grid(row=5, column=0, sticky='ew', padx=8)
@@ -273,6 +488,9 @@ class MP3TaggerGUI(tk.Tk):
         self.run_btn = ttk.Button(act, text="Tag Files", command=self.start_tagging, width=16)
         self.run_btn.pack(side='left')
         Tooltip(self.run_btn, "Start tagging the selected folder or file.")
+        preview_btn = ttk.Button(act, text="Preview", command=self.preview_files, width=10)
+        preview_btn.pack(side='left', padx=(8,0))
+        Tooltip(preview_btn, "List the files with their current track, album and artist next to what tagging will set. Nothing is written.")
         self.cancel_btn = ttk.Button(act, text="Cancel", command=self.cancel_tagging, width=10)
         self.cancel_btn.pack(side='left', padx=(8,0))
         self.cancel_btn.state(['disabled'])
@@ -283,19 +501,38 @@ class MP3TaggerGUI(tk.Tk):
         main.grid_rowconfigure(6, weight=1)
         self.log = ScrolledText(log_frame, height=8, state='disabled', bg=self.entry_bg, fg=self.fg_color)
         self.log.pack(fill='both', expand=True)
+        self.log_pump = LogPump(self.log, on_progress=self._show_progress)
+        # Controls collection for enable/disable
+        self._collect_controls()
+        # Draw the window first, then load the banner and the last profile
+        self.after_idle(self.after, 0, self._deferred_startup)
+    def _deferred_startup(self):
         # Auto-load last profile
         if os.path.exists(PROFILE_PATH):
             self.load_profile(PROFILE_PATH, silent=True)
-        # Controls collection for enable/disable
-        self._collect_controls()
+        # Never render wider than the screen, so that is all the detail worth keeping
+        threading.Thread(target=self._load_banner_async, args=(self.winfo_screenwidth(),), daemon=True).start()
+    def _load_banner_async(self, max_width):
+        img = self._load_banner_image(max_width)
+        if img:
+            try:
+                self.after(0, self._show_banner, img)
+            except RuntimeError:
+                pass # window closed meanwhile
+    def _show_banner(self, img):
+        self.banner_img_orig = img
+        self._render_banner()
     def _build_menubar(self):
         menubar = tk.Menu(self)
         file_menu = tk.Menu(menubar, tearoff=False)
         file_menu.add_command(label="Open Folder…", command=self.select_directory)
         file_menu.add_command(label="Open File…", command=self.select_single_file)
+        file_menu.add_command(label="Preview Files", command=self.preview_files)
         file_menu.add_separator()
         file_menu.add_command(label="Load Profile…", command=self.load_profile)
         file_menu.add_command(label="Save Profile…", command=self.save_profile)
+        file_menu.add_command(label="Log to File…", command=self.select_log_file)
+        file_menu.add_command(label="Run Job List…", command=self.run_job_list)
         file_menu.add_separator()
         file_menu.add_command(label="Exit", command=self.destroy)
         menubar.add_cascade(label="File", menu=file_menu)
@@ -305,7 +542,7 @@ class MP3TaggerGUI(tk.Tk):
             "MP3/WAV Batch Tagger — built with ❤️ for The Kraken"))
         menubar.add_cascade(label="Help", menu=help_menu)
         self.config(menu=menubar)
-    def _load_banner_image(self):
+    def _load_banner_image(self, max_width=None):
         script_dir = os.path.dirname(os.path.abspath(__file__))
         imgs = [f for f in os.listdir(script_dir) if re.match(r'banner\d+\.png$', f, flags=re.IGNORECASE)]
         if not imgs:
@@ -313,26 +550,58 @@ class MP3TaggerGUI(tk.Tk):
         choice = random.choice(imgs)
         path = os.path.join(script_dir, choice)
         try:
-            return Image.open(path)
+            # PIL is only needed (and imported) when there is a banner to show
+            from PIL import Image
+            img = Image.open(path)
+            img.load() # decode here, off the Tk thread
+            if img.mode not in ('RGB', 'RGBA'):
+                img = img.convert('RGBA') # palette images would only resize with nearest-neighbour
+            if max_width and img.width > max_width:
+                # Downscale once to the largest size we can show; every later resize starts from this
+                img = img.resize((max_width, max(1, round(img.height * max_width / img.width))), Image.LANCZOS)
+            return img
         except Exception as e:
             print(f"Banner load failed {path}: {e}")
             return None
-    def _render_banner(self):
+    def _render_banner(self, preview=False):
+        """Show the banner at the window width: LANCZOS (cached per width), or a quick bilinear preview."""
+        if not preview:
+            self._banner_job = None
         if not self.banner_img_orig:
             return
+        from PIL import Image, ImageTk
         w = self.winfo_width() or 600
         h = max(80, int(w * 9 / 32)) # 32:9 strip
-        img_resized = self.banner_img_orig.resize((w, h), Image.LANCZOS)
-        self.banner_photo = ImageTk.PhotoImage(img_resized)
+        photo = None if preview else self._banner_cache.get(w)
+        if photo is not None:
+            self._banner_cache.move_to_end(w)
+        else:
+            img_resized = self.banner_img_orig.resize((w, h), Image.BILINEAR if preview else Image.LANCZOS)
+            photo = ImageTk.PhotoImage(img_resized)
+            if not preview:
+                self._banner_cache[w] = photo
+                if len(self._banner_cache) > BANNER_CACHE_SIZE:
+                    self._banner_cache.popitem(last=False)
+        self._banner_width = w
+        self.banner_photo = photo
         if not hasattr(self, 'banner_label'):
             self.banner_label = ttk.Label(self, image=self.banner_photo)
-            self.banner_label.pack(fill='x')
+            self.banner_label.pack(fill='x', before=self._main)
         else:
             self.banner_label.configure(image=self.banner_photo)
             self.banner_label.image = self.banner_photo
     def _on_resize(self, event):
-        if event.widget is self:
-            self._render_banner()
+        # <Configure> also fires for moves and height changes; only a new width needs a new banner
+        if event.widget is not self or not self.banner_img_orig or event.width == self._banner_width:
+            return
+        now = time.monotonic()
+        if now - self._banner_preview_at >= BANNER_PREVIEW_MS / 1000:
+            self._banner_preview_at = now
+            self._render_banner(preview=True)
+        # Debounce: the full-quality render happens once the size settles
+        if self._banner_job:
+            self.after_cancel(self._banner_job)
+        self._banner_job = self.after(BANNER_SETTLE_MS, self._render_banner)
     def _collect_controls(self):
         self._controls = []
         for child in self.winfo_children():
@@ -375,6 +644,12 @@ class MP3TaggerGUI(tk.Tk):
                 pass
         for chk in (self.only_fill_missing, self.auto_number):
             chk.set(False if on else chk.get())
+    def _show_progress(self, done, total):
+        # total is 0 while the engine tags a folder it is still scanning
+        if total:
+            self.progress.configure(mode='determinate', maximum=total, value=done)
+        else:
+            self.progress.configure(mode='indeterminate', maximum=100, value=done % 100)
     def select_directory(self):
         folder = filedialog.askdirectory()
         if folder:
@@ -395,10 +670,7 @@ class MP3TaggerGUI(tk.Tk):
         path = filedialog.askopenfilename(filetypes=types, title='Choose cover image')
         if path:
             try:
-                with open(path, 'rb') as f:
-                    data = f.read()
-                mime = 'image/png' if path.lower().endswith('png') else 'image/jpeg'
-                self.single_cover = (data, mime)
+                self.single_cover = read_cover(path)
                 self.log_message(f"Selected cover: {os.path.basename(path)}")
             except Exception as e:
                 messagebox.showerror('Cover Error', f'Failed to read image: {e}')
@@ -407,253 +679,169 @@ class MP3TaggerGUI(tk.Tk):
         path = filedialog.askopenfilename(filetypes=types, title='Choose cover image for all')
         if path:
             try:
-                with open(path, 'rb') as f:
-                    data = f.read()
-                mime = 'image/png' if path.lower().endswith('png') else 'image/jpeg'
-                self.batch_cover = (data, mime)
+                self.batch_cover = read_cover(path)
                 self.log_message(f"Selected cover for batch: {os.path.basename(path)}")
             except Exception as e:
                 messagebox.showerror('Cover Error', f'Failed to read image: {e}')
+    def select_log_file(self):
+        path = filedialog.asksaveasfilename(defaultextension='.log', filetypes=[('Log', '*.log'), ('Text', '*.txt')],
+                                            title='Append the full run log to (cancel to turn off)')
+        self._profile_config.log_file = path or ''
+        self.log_message(f"Full log: {path}" if path else "Full log file turned off.")
     def log_message(self, message):
-        def _append():
-            self.log.config(state='normal')
-            self.log.insert('end', message + '\n')
-            self.log.yview('end')
-            self.log.config(state='disabled')
-        self.after(0, _append)
-    def start_tagging(self):
+        self.log_pump.write(message)
+    def _check_target(self):
         if self.single_mode.get():
             if not self.single_path or not os.path.isfile(self.single_path):
                 messagebox.showerror('Error', 'Pick a valid audio file for single-file mode.')
-                return
+                return False
         else:
             if not hasattr(self, 'folder') or not os.path.isdir(self.folder):
                 messagebox.showerror('Error', 'Select a valid music folder first.')
-                return
-        self.progress['value'] = 0
+                return False
+        return True
+    def start_tagging(self):
+        if not self._check_target():
+            return
+        self._show_progress(0, 1)
         self.cancel_event = threading.Event()
+        cfg = self._build_config()
         self._set_controls_enabled(False)
-        self.log.config(state='normal'); self.log.delete('1.0', 'end'); self.log.config(state='disabled')
-        threading.Thread(target=self._worker_apply, daemon=True).start()
+        self.log_pump.clear()
+        if cfg.log_file:
+            try:
+                self.log_pump.open_file(cfg.log_file)
+                self.log_message(f"=== {time.strftime('%Y-%m-%d %H:%M:%S')} {cfg.target} ===")
+            except OSError as e:
+                self.log_message(f"Log file not opened: {e}")
+        threading.Thread(target=self._worker_apply, args=(cfg,), daemon=True).start()
+    def run_job_list(self):
+        path = filedialog.askopenfilename(filetypes=[('Job lists', '*.txt *.jsonl'), ('All files', '*.*')], title='Run job list')
+        if not path:
+            return
+        try:
+            from tagger.jobqueue import load_jobs
+            jobs = load_jobs(path)
+        except (OSError, ValueError) as e:
+            messagebox.showerror('Error', f'Failed to read job list: {type(e).__name__} - {e}')
+            return
+        self._show_progress(0, 1)
+        self.cancel_event = threading.Event()
+        cfg = self._build_config()
+        # The form is the base config of every job; its cover was picked for one album
+        cfg.cover = (None, None)
+        self._set_controls_enabled(False)
+        self.log_pump.clear()
+        if cfg.log_file:
+            try:
+                self.log_pump.open_file(cfg.log_file)
+                self.log_message(f"=== {time.strftime('%Y-%m-%d %H:%M:%S')} {path} ===")
+            except OSError as e:
+                self.log_message(f"Log file not opened: {e}")
+        threading.Thread(target=self._worker_jobs, args=(cfg, jobs, path), daemon=True).start()
+    def preview_files(self):
+        if not self._check_target():
+            return
+        cfg = self._build_config()
+        self.log_message(f"Preview: listing {cfg.target}…")
+        threading.Thread(target=self._worker_preview, args=(cfg,), daemon=True).start()
+    def _worker_preview(self, cfg):
+        try:
+            from tagger.engine import TaggerEngine
+            from tagger.preview import PreviewModel
+            engine = TaggerEngine(cfg, log=self.log_message)
+            model = PreviewModel(engine, engine.gather_files())
+            self.log_message(f"Preview: {len(model)} files.")
+            self.after(0, lambda: PreviewWindow(self, model, cfg.target))
+        except Exception as e:
+            self.log_message(f"Error in preview: {type(e).__name__} - {e}")
     def cancel_tagging(self):
         if hasattr(self, 'cancel_event'):
             self.cancel_event.set()
             self.log_message("Cancellation requested… finishing current file.")
-    def _gather_files(self):
-        if self.single_mode.get() and self.single_path:
-            return [self.single_path]
-        files = []
-        for root, _, names in os.walk(self.folder):
-            for f in names:
-                ext = os.path.splitext(f)[1].lower()
-                if ext in ('.mp3', '.wav'):
-                    files.append(os.path.join(root, f))
-        files.sort(key=lambda p: p.lower())
-        return files
-    def _worker_apply(self):
+    def _build_config(self):
+        """Snapshot the form into a TagConfig for the headless engine."""
+        # Options without a widget (e.g. padding_reserve) come from the last loaded profile
+        cfg = self._profile_config.copy()
+        single = self.single_mode.get()
+        cfg.fields = {k: v.get().strip() for k, v in self.vars.items()}
+        cfg.folder = getattr(self, 'folder', '')
+        cfg.single_path = self.single_path or ''
+        cfg.single_mode = single
+        cfg.auto_number = self.auto_number.get()
+        cfg.only_fill_missing = self.only_fill_missing.get()
+        cfg.album_mode = self.album_mode.get()
+        cfg.track_offset = max(1, int(self.track_offset.get() or 1))
+        cfg.embed_cover = self.embed_cover.get()
+        cfg.verify_writes = self.verify_writes.get()
+        cfg.force_v23 = self.force_v23.get()
+        cfg.workers = max(1, int(self.workers.get() or 1))
+        cfg.skip_unchanged = self.skip_unchanged.get()
+        cfg.use_index = self.use_index.get()
+        cfg.resume = self.resume.get()
+        cfg.backup = self.backup.get()
+        cfg.executor = self.executor.get()
+        cfg.adaptive_io = self.adaptive_io.get()
+        cfg.cover = self.single_cover if single else self.batch_cover
+        return cfg
+    def _apply_config(self, cfg):
+        self._profile_config = cfg.copy()
+        for key, var in self.vars.items():
+            var.set(cfg.fields.get(key, ''))
+        self.auto_number.set(cfg.auto_number)
+        self.only_fill_missing.set(cfg.only_fill_missing)
+        self.album_mode.set(cfg.album_mode)
+        self.embed_cover.set(cfg.embed_cover)
+        self.verify_writes.set(cfg.verify_writes)
+        self.force_v23.set(cfg.force_v23)
+        self.track_offset.set(cfg.track_offset)
+        self.single_mode.set(cfg.single_mode)
+        self.workers.set(cfg.workers)
+        self.skip_unchanged.set(cfg.skip_unchanged)
+        self.use_index.set(cfg.use_index)
+        self.resume.set(cfg.resume)
+        self.backup.set(cfg.backup)
+        self.executor.set(cfg.executor)
+        self.adaptive_io.set(cfg.adaptive_io)
+        if cfg.folder:
+            self.folder = cfg.folder
+            self.dir_label.config(text=cfg.folder)
+        if cfg.single_path:
+            self.single_path = cfg.single_path
+            self.single_file_label.config(text=os.path.basename(cfg.single_path))
+    def _worker_apply(self, cfg):
         try:
-            files = self._gather_files()
-            total = len(files)
-            if total == 0:
-                self.log_message("No audio files found.")
-                self._finish_worker()
-                return
-            self.after(0, lambda: (self.progress.configure(maximum=total), None))
-            base_md = {k: v.get().strip() for k, v in self.vars.items()}
-            auto = self.auto_number.get()
-            fill_missing_only = self.only_fill_missing.get()
-            offset = max(1, int(self.track_offset.get() or 1))
-            embed = self.embed_cover.get()
-            cover_bytes, cover_mime = (None, None)
-            if self.single_mode.get():
-                if self.single_cover[0]:
-                    cover_bytes, cover_mime = self.single_cover
-                elif embed:
-                    cover_bytes, cover_mime = self._find_cover_art(os.path.dirname(self.single_path))
-            else:
-                if self.batch_cover[0]:
-                    cover_bytes, cover_mime = self.batch_cover
-                elif embed:
-                    cover_bytes, cover_mime = self._find_cover_art(self.folder)
-            if cover_bytes:
-                self.log_message(f"Cover art found ({cover_mime}); will embed.")
-            elif embed:
-                self.log_message("No cover art found to embed.")
-            for i, path in enumerate(files, start=1):
-                if self.cancel_event.is_set():
-                    self.log_message("Cancelled by user.")
-                    break
-                md = dict(base_md)
-                if auto and not self.single_mode.get():
-                    if fill_missing_only:
-                        try:
-                            if path.lower().endswith('.wav'):
-                                existing = (WAVE(path).tags or ID3()).get('TRCK')
-                            else:
-                                existing = ID3(path).get('TRCK')
-                            has_track = bool(existing and getattr(existing, 'text', [''])[0])
-                        except Exception:
-                            has_track = False
-                        if not has_track:
-                            md['TRCK'] = f"{offset + i - 1}/{total + offset - 1}"
-                    else:
-                        md['TRCK'] = f"{offset + i - 1}/{total + offset - 1}"
-                try:
-                    self.apply_meta(path, md, cover=(cover_bytes, cover_mime))
-                    self.log_message(f"[{i}/{total}] Tagged: {os.path.basename(path)}")
-                except (MutagenError, OSError, ValueError) as e:
-                    self.log_message(f"Error tagging {os.path.basename(path)}: {type(e).__name__} - {e}")
-                except Exception as e:
-                    self.log_message(f"Unexpected error tagging {os.path.basename(path)}: {type(e).__name__} - {e}")
-                finally:
-                    self.after(0, lambda v=i: self.progress.configure(value=v))
+            from tagger.engine import TaggerEngine
+            engine = TaggerEngine(cfg, log=self.log_message,
+                                  progress=self.log_pump.progress, cancel_event=self.cancel_event)
+            engine.run()
             self._finish_worker()
         except Exception as e:
             self.log_message(f"Fatal error: {e}")
             self._finish_worker()
-    def _finish_worker(self):
-        self.after(0, lambda: (self._set_controls_enabled(True), messagebox.showinfo("Done", "Tagging complete!")))
-    def apply_meta(self, file_path, metadata, cover=(None, None)):
-        ext = os.path.splitext(file_path)[1].lower()
-        id3 = ID3()
-        def set_frame(key, frame):
-            id3.delall(key)
-            id3.add(frame)
-        # Standard frames
-        if metadata.get('TPE1'): set_frame('TPE1', TPE1(encoding=3, text=[metadata['TPE1']]))
-        if metadata.get('TPE2'): set_frame('TPE2', TPE2(encoding=3, text=[metadata['TPE2']]))
-        if metadata.get('TDRC'): set_frame('TDRC', TDRC(encoding=3, text=[metadata['TDRC']]))
-        if metadata.get('TRCK'): set_frame('TRCK', TRCK(encoding=3, text=[metadata['TRCK']]))
-        if metadata.get('TCON'): set_frame('TCON', TCON(encoding=3, text=[metadata['TCON']]))
-        if metadata.get('TPUB'): set_frame('TPUB', TPUB(encoding=3, text=[metadata['TPUB']]))
-        if metadata.get('TSSE'): set_frame('TSSE', TSSE(encoding=3, text=[metadata['TSSE']]))
-        if metadata.get('WXXX'):
-            id3.delall('WXXX')
-            id3.add(WXXX(encoding=3, desc='Author URL', url=metadata['WXXX']))
-        if metadata.get('TCOP'): set_frame('TCOP', TCOP(encoding=3, text=[metadata['TCOP']]))
-        if metadata.get('TALB'): set_frame('TALB', TALB(encoding=3, text=[metadata['TALB']]))
-        for desc in ['Group Description', 'Mood', 'Parental Rating Reason']:
-            key = f"TXXX:{desc}"
-            if metadata.get(key):
-                id3.delall(key)
-                id3.add(TXXX(encoding=3, desc=desc, text=[metadata[key]]))
-        if metadata.get('TCOM'): set_frame('TCOM', TCOM(encoding=3, text=[metadata['TCOM']]))
-        if metadata.get('TPE3'): set_frame('TPE3', TPE3(encoding=3, text=[metadata['TPE3']]))
-        # Embed cover art if provided
-        cover_bytes, cover_mime = cover
-        if cover_bytes and cover_mime:
-            id3.delall('APIC')
-            id3.add(APIC(encoding=3, mime=cover_mime, type=3, desc='Cover', data=cover_bytes))
-        if ext == '.wav':
-            # Read audio data
-            try:
-                with wave.open(file_path, 'rb') as w:
-                    params = w.getparams()
-                    audio_data = w.readframes(params.nframes)
-            except wave.Error as e:
-                raise ValueError(f"WAV read failed: {e}")
-            # Serialize ID3 to bytes
-            f = BytesIO()
-            v2_ver = 3 if self.force_v23.get() else 4
-            id3.save(f, v2_version=v2_ver)
-            tag_data = f.getvalue()
-            # Prepare padded chunk
-            pad = b'\x00' if len(tag_data) % 2 == 1 else b''
-            chunk_id = b'id3 '
-            chunk_size_bytes = struct.pack('<I', len(tag_data))
-            id3_chunk = chunk_id + chunk_size_bytes + tag_data + pad
-            # Write new WAV file
-            temp_path = file_path + '.tmp'
-            with wave.open(temp_path, 'wb') as w:
-                w.setparams(params)
-                w.writeframes(audio_data)
-            # Append ID3 chunk
-            with open(temp_path, 'ab') as f:
-                f.write(id3_chunk)
-            # Update RIFF size
-            with open(temp_path, 'r+b') as f:
-                f.seek(4)
-                riff_size = struct.unpack('<I', f.read(4))[0]
-                new_riff_size = riff_size + len(id3_chunk)
-                f.seek(4)
-                f.write(struct.pack('<I', new_riff_size))
-            os.replace(temp_path, file_path)
-        else: # MP3
-            try:
-                audio = ID3(file_path)
-            except MutagenError:
-                audio = ID3()
-            audio.update(id3)
-            v2_ver = 3 if self.force_v23.get() else 4
-            audio.save(file_path, v2_version=v2_ver)
-        # Optional verification
-        if self.verify_writes.get():
-            ok, msg = self._verify_file_tags(file_path, metadata)
-            if not ok:
-                raise ValueError(f"Verify failed: {msg}")
-    def _verify_file_tags(self, file_path, expected):
-        """Read file and confirm a subset of written tags match expected values."""
+    def _worker_jobs(self, cfg, jobs, path):
         try:
-            ext = os.path.splitext(file_path)[1].lower()
-            if ext == '.wav':
-                tag = WAVE(file_path).tags or ID3()
-            else:
-                tag = ID3(file_path)
-            # Build checks
-            def get_text(t, key):
-                if key.startswith('TXXX:'):
-                    desc = key.split(':',1)[1]
-                    for f in t.getall('TXXX'):
-                        if getattr(f, 'desc', '') == desc:
-                            return (f.text or [''])[0]
-                    return ''
-                f = t.get(key)
-                return (f.text[0] if f and getattr(f, 'text', None) else '')
-            checks = ['TPE1','TPE2','TDRC','TRCK','TCON','TPUB','TCOP','TALB','TCOM','TPE3','TXXX:Group Description','TXXX:Mood','TXXX:Parental Rating Reason']
-            for k in checks:
-                if expected.get(k):
-                    got = get_text(tag, k)
-                    if str(got).strip() != str(expected[k]).strip():
-                        return False, f"{k} → '{got}' != '{expected[k]}'"
-            return True, 'ok'
+            from tagger.jobqueue import JobQueue
+            queue = JobQueue(cfg, jobs, log=self.log_message, progress=self.log_pump.progress,
+                             cancel_event=self.cancel_event, source=os.path.abspath(path))
+            queue.run()
+            self._finish_worker()
         except Exception as e:
-            return False, f"verify exception: {e}"
-    def _find_cover_art(self, base_folder):
-        candidates = ['cover.jpg', 'cover.jpeg', 'cover.png', 'folder.jpg', 'folder.jpeg', 'folder.png']
-        for name in candidates:
-            p = os.path.join(base_folder, name)
-            if os.path.isfile(p):
-                try:
-                    with open(p, 'rb') as f:
-                        data = f.read()
-                    mime = 'image/png' if p.lower().endswith('png') else 'image/jpeg'
-                    return (data, mime)
-                except Exception:
-                    continue
-        return (None, None)
+            self.log_message(f"Fatal error: {e}")
+            self._finish_worker()
+    def _finish_worker(self):
+        self.after(0, lambda: (self.log_pump.flush(), self.log_pump.close_file(),
+                               self._set_controls_enabled(True), messagebox.showinfo("Done", "Tagging complete!")))
     def reset_fields(self):
         for v in self.vars.values():
             v.set("")
     def save_profile(self):
-        data = {k: v.get().strip() for k, v in self.vars.items() if v.get().strip()}
-        data['__options__'] = {
-            'auto_number': self.auto_number.get(),
-            'only_fill_missing': self.only_fill_missing.get(),
-            'embed_cover': self.embed_cover.get(),
-            'verify_writes': self.verify_writes.get(),
-            'force_v23': self.force_v23.get(),
-            'track_offset': int(self.track_offset.get()),
-            'last_folder': getattr(self, 'folder', ''),
-            'single_mode': self.single_mode.get(),
-            'last_file': self.single_path or ''
-        }
+        cfg = self._build_config()
         file = filedialog.asksaveasfilename(defaultextension='.json', filetypes=[('JSON', '*.json')], title='Save profile as')
         if file:
             try:
-                with open(file, 'w') as f:
-                    json.dump(data, f, indent=2)
-                with open(PROFILE_PATH, 'w') as f:
-                    json.dump(data, f, indent=2)
+                save_profile(cfg, file)
+                save_profile(cfg, PROFILE_PATH)
                 messagebox.showinfo('Saved', f'Profile saved to {file}')
             except Exception as e:
                 messagebox.showerror('Error', f'Failed to save profile: {type(e).__name__} - {e}')
@@ -662,31 +850,11 @@ class MP3TaggerGUI(tk.Tk):
             path = filedialog.askopenfilename(filetypes=[('JSON', '*.json')], title='Load profile')
         if path and os.path.exists(path):
             try:
-                with open(path) as f:
-                    data = json.load(f)
-                options = data.pop('__options__', {})
-                for key, value in data.items():
-                    if key in self.vars:
-                        self.vars[key].set(value)
-                self.auto_number.set(bool(options.get('auto_number', self.auto_number.get())))
-                self.only_fill_missing.set(bool(options.get('only_fill_missing', self.only_fill_missing.get())))
-                self.embed_cover.set(bool(options.get('embed_cover', self.embed_cover.get())))
-                self.verify_writes.set(bool(options.get('verify_writes', self.verify_writes.get())))
-                self.force_v23.set(bool(options.get('force_v23', self.force_v23.get())))
-                self.track_offset.set(int(options.get('track_offset', self.track_offset.get())))
-                self.single_mode.set(bool(options.get('single_mode', self.single_mode.get())))
-                last_folder = options.get('last_folder')
-                if last_folder and os.path.isdir(last_folder):
-                    self.folder = last_folder
-                    self.dir_label.config(text=last_folder)
-                last_file = options.get('last_file')
-                if last_file and os.path.isfile(last_file):
-                    self.single_path = last_file
-                    self.single_file_label.config(text=os.path.basename(last_file))
+                self._apply_config(load_profile(path, base=self._build_config()))
                 if not silent:
                     messagebox.showinfo('Loaded', f'Profile loaded from {path}')
             except Exception as e:
                 if not silent:
                     messagebox.showerror('Error', f'Failed to load profile: {type(e).__name__} - {e}')
 if __name__ == '__main__':
-    MP3TaggerGUI().mainloop()
\ No newline at end of file
+    MP3TaggerGUI().mainloop()
\ No newline at end of file
@@ -0,0 +1,23 @@
+"""
+Headless core of the MP3/WAV Batch Tagger. Importing this package never
+pulls in tkinter or PIL, so it is safe on servers without a display.
+
+The names below are loaded on first access: `import tagger.config` stays
+cheap, and mutagen is only imported once the engine is actually used.
+"""
+
+_EXPORTS = {
+    'PROFILE_PATH': 'config', 'FIELDS': 'config', 'EXECUTORS': 'config', 'TagConfig': 'config',
+    'load_profile': 'config', 'save_profile': 'config',
+    'TaggerEngine': 'engine', 'RunStats': 'engine', 'FileResult': 'engine',
+    'CoverCache': 'covers', 'read_cover': 'covers', 'find_cover_art': 'covers',
+}
+__all__ = list(_EXPORTS)
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    from importlib import import_module
+    value = getattr(import_module(f'.{module}', __name__), name)
+    globals()[name] = value
+    return value
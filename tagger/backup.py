@@ -0,0 +1,222 @@
+"""
+Tag backups: the original tag bytes of every file a run rewrites, so the
+run can be rolled back without a copy of the library.
+
+Per file, only the tag regions are saved: the ID3v2 region at the start of
+an MP3 (plus a trailing ID3v1 tag, if any) or the payload of a WAV's
+`id3 ` chunk. A region is cut into contiguous slices at ID3v2 frame
+boundaries; slices of BIG_SLICE bytes or more (covers, mostly) go to a
+content-addressed object store shared by all runs, so a cover embedded in
+a thousand files is stored once. Small slices are kept inline and a run of
+zero padding is stored as its length. Concatenating the slices always gives
+back the exact original bytes; frame parsing only decides where to cut.
+
+Each run appends one JSON line per rewritten file to runs/<run id>.jsonl,
+with the file's size and mtime before and after the write. restore_run()
+puts the saved regions back at their original size, so the file is byte
+for byte what it was: in place where the region kept its size (or is a
+WAV's last chunk), otherwise by rewriting the file, and a tag the run added
+is taken out again. It gives the file its old mtime back (so an older run
+can be undone next) and skips files that changed since the run. Stale
+duplicate id3 chunks of a WAV, which a write retires, are not brought back.
+"""
+
+import os
+import json
+import time
+import base64
+import struct
+import hashlib
+import secrets
+from .config import BACKUP_DIR
+from .tagio import (
+    id3v2_region_size, read_wav_id3, remove_wav_id3, write_mp3_id3, write_wav_id3
+)
+# Slices at least this large are stored once, as shared objects
+BIG_SLICE = 4096
+def _syncsafe(b):
+    return (b[0] << 21) | (b[1] << 14) | (b[2] << 7) | b[3]
+def split_region(data):
+    """Cut raw ID3v2 bytes into contiguous slices at frame boundaries (best effort)."""
+    if len(data) < 10 or data[:3] != b'ID3':
+        return [data]
+    version, flags = data[3], data[5]
+    # Whole-tag unsynchronisation (v2.2/2.3) hides the frame boundaries
+    if version < 3 or (flags & 0x80 and version == 3):
+        return [data]
+    pos = 10
+    if flags & 0x40 and len(data) >= 14:
+        ext = data[10:14]
+        pos += _syncsafe(ext) if version == 4 else struct.unpack('>I', ext)[0] + 4
+    cuts = [0, pos]
+    while pos + 10 <= len(data):
+        frame_id = data[pos:pos + 4]
+        if not all(48 <= c <= 57 or 65 <= c <= 90 for c in frame_id):
+            break # padding or garbage: the rest is one slice
+        size_bytes = data[pos + 4:pos + 8]
+        size = _syncsafe(size_bytes) if version == 4 else struct.unpack('>I', size_bytes)[0]
+        if pos + 10 + size > len(data):
+            break
+        pos += 10 + size
+        cuts.append(pos)
+    if cuts[-1] < len(data):
+        cuts.append(len(data))
+    return [data[a:b] for a, b in zip(cuts, cuts[1:]) if b > a]
+class BackupStore:
+    """Object store and run logs under `root` (created on demand). Safe to share between processes."""
+    def __init__(self, root=BACKUP_DIR):
+        self.root = root
+        self.objects = os.path.join(root, 'objects')
+        self.runs = os.path.join(root, 'runs')
+    def _object_path(self, digest):
+        return os.path.join(self.objects, digest[:2], digest[2:])
+    def put(self, data):
+        """Store a blob once; returns its SHA-1."""
+        digest = hashlib.sha1(data).hexdigest()
+        path = self._object_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.{os.getpid()}.{secrets.token_hex(4)}.tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        return digest
+    def get(self, digest):
+        with open(self._object_path(digest), 'rb') as f:
+            data = f.read()
+        if hashlib.sha1(data).hexdigest() != digest:
+            raise ValueError(f"backup object {digest} is corrupt")
+        return data
+    def encode(self, data):
+        """Slices of `data` as JSON: ["o", sha1] shared object, ["b", base64] inline, ["z", n] zero padding."""
+        if data is None:
+            return None
+        parts = []
+        for piece in split_region(data):
+            if len(piece) >= BIG_SLICE and not piece.strip(b'\0'):
+                parts.append(['z', len(piece)])
+            elif len(piece) >= BIG_SLICE:
+                parts.append(['o', self.put(piece)])
+            else:
+                parts.append(['b', base64.b64encode(piece).decode('ascii')])
+        return parts
+    def decode(self, parts):
+        if parts is None:
+            return None
+        out = []
+        for kind, value in parts:
+            if kind == 'z':
+                out.append(b'\0' * value)
+            elif kind == 'o':
+                out.append(self.get(value))
+            else:
+                out.append(base64.b64decode(value))
+        return b''.join(out)
+    def save(self, path):
+        """
+        Store the current tag regions of `path`, just before it is written.
+        Returns its run log entry; call written() on it once the write is done.
+        """
+        v1 = None
+        st = os.stat(path)
+        if os.path.splitext(path)[1].lower() == '.wav':
+            kind, tag = 'wav', read_wav_id3(path)
+        else:
+            kind = 'mp3'
+            with open(path, 'rb') as f:
+                size = id3v2_region_size(f)
+                f.seek(0)
+                tag = f.read(size) if size else None
+                f.seek(0, 2)
+                if f.tell() >= 128 + size:
+                    f.seek(-128, 2)
+                    v1 = f.read(128)
+                    v1 = v1 if v1[:3] == b'TAG' else None
+        return {
+            'path': os.path.abspath(path), 'kind': kind, 'before': [st.st_size, st.st_mtime_ns], 'after': None,
+            'tag': self.encode(tag),
+            'v1': base64.b64encode(v1).decode('ascii') if v1 else None,
+        }
+    @staticmethod
+    def written(entry):
+        """Note the size and mtime the write left, so a restore can tell whether the file moved on since."""
+        st = os.stat(entry['path'])
+        entry['after'] = [st.st_size, st.st_mtime_ns]
+        return entry
+    def open_run(self, target):
+        return BackupRun(self, target)
+    def run_ids(self):
+        """Run ids, oldest first."""
+        try:
+            return sorted(name[:-6] for name in os.listdir(self.runs) if name.endswith('.jsonl'))
+        except OSError:
+            return []
+    def read_run(self, run_id):
+        """(header, entries) of a run log; a torn last line is ignored."""
+        entries = []
+        with open(os.path.join(self.runs, run_id + '.jsonl'), 'r', encoding='utf-8') as f:
+            header = json.loads(f.readline())
+            for line in f:
+                if not line.endswith('\n'):
+                    break
+                entries.append(json.loads(line))
+        return header, entries
+class BackupRun:
+    """Log of one run's rewritten files (main thread only)."""
+    def __init__(self, store, target):
+        self.store = store
+        self.id = time.strftime('%Y%m%d-%H%M%S') + '-' + secrets.token_hex(3)
+        os.makedirs(store.runs, exist_ok=True)
+        self.path = os.path.join(store.runs, self.id + '.jsonl')
+        self._f = open(self.path, 'w', encoding='utf-8')
+        self._f.write(json.dumps({'run': self.id, 'target': os.path.abspath(target), 'started': time.time()}) + '\n')
+        self.files = 0
+    def add(self, entry):
+        self._f.write(json.dumps(entry) + '\n')
+        self._f.flush()
+        self.files += 1
+    def close(self):
+        self._f.close()
+        if not self.files:
+            # Nothing was rewritten, so there is nothing to roll back
+            os.remove(self.path)
+def restore_file(store, entry):
+    """Put one file's saved regions back, byte for byte. Returns WRITE_IN_PLACE or WRITE_REWRITE."""
+    path = entry['path']
+    tag = store.decode(entry['tag'])
+    if entry['kind'] == 'wav':
+        if tag is None:
+            mode = remove_wav_id3(path)
+        else:
+            mode = write_wav_id3(path, lambda available: tag, exact=True)
+    else:
+        # A region of another size (or none, b'') moves the audio: write_mp3_id3 rewrites the file then
+        v1 = base64.b64decode(entry['v1']) if entry.get('v1') else None
+        mode = write_mp3_id3(path, lambda available: tag or b'', v1)
+    st = os.stat(path)
+    if entry.get('before') and st.st_size == entry['before'][0]:
+        os.utime(path, ns=(st.st_atime_ns, entry['before'][1]))
+    return mode
+def restore_run(store, run_id, log=None, force=False):
+    """
+    Roll back every file of a run. Files whose size or mtime moved since the
+    run are skipped unless `force`. Returns (restored, skipped, failed).
+    """
+    log = log or (lambda message: None)
+    _, entries = store.read_run(run_id)
+    restored = skipped = failed = 0
+    for entry in entries:
+        path = entry['path']
+        try:
+            st = os.stat(path)
+            if not force and [st.st_size, st.st_mtime_ns] != entry['after']:
+                log(f"Skipped {path}: changed since run {run_id}.")
+                skipped += 1
+                continue
+            restore_file(store, entry)
+            restored += 1
+        except (OSError, ValueError) as e:
+            log(f"Error restoring {path}: {type(e).__name__} - {e}")
+            failed += 1
+    log(f"Restore of run {run_id}: {restored} restored, {skipped} skipped, {failed} failed.")
+    return restored, skipped, failed
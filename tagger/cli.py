@@ -0,0 +1,276 @@
+"""
+Command-line entry point: python -m tagger [folder-or-file] [options]
+
+Takes the same fields and options as the JSON profile. A --profile is loaded
+first and any options given on the command line override it, so a saved GUI
+profile can be replayed headless and tweaked per run.
+"""
+
+import os
+import re
+import sys
+import signal
+import argparse
+import threading
+from .config import FIELDS, EXECUTORS, MEMORY_PROFILES, TagConfig, load_profile, save_profile
+from .covers import read_cover
+def _field_option(label):
+    return '--' + re.sub(r'[^a-z0-9]+', '-', label.lower()).strip('-')
+def build_parser():
+    p = argparse.ArgumentParser(prog='python -m tagger', description='Batch tag MP3/WAV files without the GUI.')
+    p.add_argument('target', nargs='?', help='Folder to tag (recursively) or a single .mp3/.wav file. Defaults to the profile\'s last folder/file.')
+    p.add_argument('--profile', metavar='JSON', help='Load fields and options from a saved profile.')
+    p.add_argument('--save-profile', metavar='JSON', help='Write the effective settings to a profile after parsing options.')
+    fields = p.add_argument_group('fields', 'ID3 values to write (empty string leaves the frame untouched).')
+    for label, key in FIELDS:
+        fields.add_argument(_field_option(label), dest=f'field:{key}', metavar='TEXT', help=f'{label} ({key})')
+    opts = p.add_argument_group('options')
+    bool_opt = dict(action=argparse.BooleanOptionalAction, default=None)
+    opts.add_argument('--auto-number', help='Number tracks by sorted file order (e.g. 1/10, 2/10).', **bool_opt)
+    opts.add_argument('--only-fill-missing', help='When auto-numbering, only set TRCK where it is missing.', **bool_opt)
+    opts.add_argument('--per-album', dest='album_mode', help='Treat every folder as an album: numbering restarts per folder and folders are tagged in parallel, largest first.', **bool_opt)
+    opts.add_argument('--track-offset', type=int, metavar='N', help='Starting number for auto-numbering.')
+    opts.add_argument('--embed-cover', help='Embed cover.jpg/folder.jpg found next to the files.', **bool_opt)
+    opts.add_argument('--cover', metavar='IMAGE', help='Embed this image in every file (overrides folder covers).')
+    opts.add_argument('--cover-max-px', type=int, metavar='PX', help='Downsize covers larger than PX pixels and re-encode them as JPEG (needs Pillow; 0 keeps them as-is).')
+    opts.add_argument('--cover-quality', type=int, metavar='Q', help='JPEG quality for downsized covers (default 90).')
+    opts.add_argument('--verify-writes', help='Check the written tags against the requested values.', **bool_opt)
+    opts.add_argument('--verify-readback', help='Verify by reading each file back from disk (default: re-parse the written tag bytes).', **bool_opt)
+    opts.add_argument('--force-v23', help='Write ID3v2.3 instead of v2.4.', **bool_opt)
+    opts.add_argument('--padding-reserve', type=int, metavar='BYTES', help='Padding added when a tag must grow, so later runs rewrite it in place (default 8192).')
+    opts.add_argument('--skip-unchanged', help='Leave files alone whose tags already match.', **bool_opt)
+    opts.add_argument('--manifest', dest='manifest_path', metavar='SQLITE', help='Manifest used by --skip-unchanged to skip files without opening them ("" disables it).')
+    opts.add_argument('--index', dest='use_index', help='Take the file list from the persistent library index, relisting only changed folders.', **bool_opt)
+    opts.add_argument('--index-path', metavar='SQLITE', help='Library index database (default ~/.mp3_tagger_index.sqlite).')
+    opts.add_argument('--resume', help='Continue an interrupted run with the same settings after its last finished file (default on).', **bool_opt)
+    opts.add_argument('--journal-dir', metavar='DIR', help='Folder of the checkpoint journals used by --resume, one per folder and settings ("" disables them; default ~/.mp3_tagger_journals).')
+    opts.add_argument('--backup', help='Save the original tags of every rewritten file so the run can be undone with --restore.', **bool_opt)
+    opts.add_argument('--backup-dir', metavar='DIR', help='Backup store (default ~/.mp3_tagger_backups).')
+    opts.add_argument('--workers', type=int, metavar='N', help='Tag N files concurrently (default 1).')
+    opts.add_argument('--executor', choices=EXECUTORS, help='Parallel mode: thread pool or process pool.')
+    opts.add_argument('--adaptive-io', help='For network mounts: adjust how many file operations run at once from their measured latency (uses threads).', **bool_opt)
+    opts.add_argument('--io-max', type=int, metavar='N', help='Most file operations at once with --adaptive-io (default 32).')
+    opts.add_argument('--simulate-io', dest='io_simulate', metavar='META_MS,DATA_MS[,SLOTS[,OVERLOAD]]',
+                      help='With --adaptive-io, add the latency of a slow filer with SLOTS parallel slots (default 8) to every operation, for testing.')
+    p.add_argument('--dry-run', metavar='JSONL', nargs='?', const='-',
+                   help='Write nothing; stream the planned frame changes per file as JSON lines to JSONL (default stdout).')
+    p.add_argument('--inventory', metavar='OUT',
+                   help='Tag nothing; export the tags already in the files to OUT (.csv, .jsonl or .sqlite; "-" for JSON lines on stdout).')
+    p.add_argument('--watch', action='store_true',
+                   help='Keep running and tag new or changed files as they arrive in the folder (Ctrl+C or SIGTERM stops).')
+    p.add_argument('--settle', dest='watch_settle', type=float, metavar='SECONDS',
+                   help='With --watch, tag a file once it has not changed for SECONDS (default 2).')
+    p.add_argument('--poll-interval', dest='watch_poll', type=float, metavar='SECONDS',
+                   help='With --watch, relist the folder every SECONDS where inotify is unavailable (default 1).')
+    p.add_argument('--jobs', metavar='LIST',
+                   help='Run a job list: one "folder-or-file<TAB>profile[<TAB>priority]" (or JSON) line per job, on one shared worker pool.')
+    p.add_argument('--restore', metavar='RUN', help='Roll back a backed-up run ("last" for the newest) and exit.')
+    p.add_argument('--restore-changed', action='store_true', help='With --restore, also roll back files modified since that run.')
+    p.add_argument('--list-backups', action='store_true', help='List the backed-up runs and exit.')
+    p.add_argument('--log-file', metavar='PATH', help='Also append every log line to PATH.')
+    p.add_argument('--report-json', metavar='PATH', help='Write per-stage timings and per-file percentiles of the run as JSON.')
+    p.add_argument('--report-prom', metavar='PATH', help='Write the same timings as a Prometheus textfile (e.g. for node_exporter).')
+    p.add_argument('--memory-profile', choices=MEMORY_PROFILES, help='Log peak memory per stage, per file type and the largest files (and add it to --report-json); trace also follows the Python heap, slower.')
+    p.add_argument('--memory-budget', type=int, metavar='MB', help='Keep the run under MB of memory: near it, cached covers are dropped and files are tagged one at a time (0 = off).')
+    p.add_argument('-q', '--quiet', action='store_true', help='Only print errors and the final summary.')
+    return p
+def explicit_options(args):
+    """Fields and options given on the command line, as {'fields': {key: value}, option: value}."""
+    options = {'fields': {}}
+    for _, key in FIELDS:
+        value = getattr(args, f'field:{key}')
+        if value is not None:
+            options['fields'][key] = value
+    for name in ('auto_number', 'only_fill_missing', 'album_mode', 'embed_cover', 'verify_writes', 'verify_readback', 'force_v23', 'track_offset', 'workers', 'executor', 'padding_reserve', 'skip_unchanged', 'manifest_path', 'use_index', 'index_path', 'cover_max_px', 'cover_quality', 'log_file', 'journal_dir', 'resume', 'backup', 'backup_dir', 'adaptive_io', 'io_max', 'io_simulate', 'report_json', 'report_prom', 'memory_profile', 'memory_budget', 'watch_settle', 'watch_poll'):
+        value = getattr(args, name)
+        if value is not None:
+            options[name] = value
+    return options
+def config_from_args(args):
+    cfg = load_profile(args.profile) if args.profile else TagConfig()
+    options = explicit_options(args)
+    cfg.fields.update(options.pop('fields'))
+    for name, value in options.items():
+        setattr(cfg, name, value)
+    # Same ranges as a profile (e.g. --workers 0 runs one worker)
+    cfg.normalize()
+    if args.target:
+        if os.path.isfile(args.target):
+            cfg.single_mode, cfg.single_path = True, args.target
+        else:
+            cfg.single_mode, cfg.folder = False, args.target
+    if args.cover:
+        cfg.cover = read_cover(args.cover)
+    if cfg.io_simulate:
+        from .iosched import SimulatedFiler
+        SimulatedFiler.from_spec(cfg.io_simulate) # rejects a malformed spec up front
+    return cfg
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    try:
+        cfg = config_from_args(args)
+    except (OSError, ValueError) as e:
+        parser.error(f"{type(e).__name__} - {e}")
+    if args.save_profile:
+        save_profile(cfg, args.save_profile)
+    if args.list_backups or args.restore:
+        return _backups(cfg, args)
+    target = cfg.target
+    if args.jobs:
+        if args.target:
+            parser.error('--jobs takes its folders from the job list.')
+    elif cfg.single_mode and not (target and os.path.isfile(target)):
+        parser.error('Pick a valid audio file for single-file mode.')
+    elif not cfg.single_mode and not (target and os.path.isdir(target)):
+        parser.error('Select a valid music folder first.')
+    log_file = open(cfg.log_file, 'a', encoding='utf-8') if cfg.log_file else None
+    # A plan on stdout keeps it clean for piping; the log goes to stderr then
+    log_stream = sys.stderr if '-' in (args.dry_run, args.inventory) else sys.stdout
+    def log(message):
+        if log_file:
+            log_file.write(message + '\n')
+        if not args.quiet or message.startswith(('Error', 'Unexpected', 'Fatal', 'Timing', 'Dry run', 'Watch', 'Inventory', 'Backup', 'I/O', 'Job', 'Memory')):
+            print(message, file=log_stream, flush=True)
+    # Loaded only now so --help and option errors never pay for mutagen
+    from .engine import TaggerEngine
+    if args.jobs:
+        return _jobs(cfg, args, log, log_file)
+    engine = TaggerEngine(cfg, log=log)
+    if args.dry_run:
+        return _dry_run(engine, args.dry_run, log_file)
+    if args.inventory:
+        try:
+            from .inventory import format_for
+            fmt = format_for(args.inventory)
+        except ValueError as e:
+            parser.error(str(e))
+        return _inventory(engine, args.inventory, fmt, log_file)
+    if args.watch:
+        if cfg.single_mode:
+            parser.error('--watch needs a folder.')
+        return _watch(engine, log_file)
+    try:
+        stats = engine.run()
+    except KeyboardInterrupt:
+        print("Cancelled by user.", file=sys.stderr)
+        return 130
+    except Exception as e:
+        print(f"Fatal error: {e}", file=sys.stderr)
+        return 2
+    finally:
+        if log_file:
+            log_file.close()
+    print(f"Done: {stats.tagged} tagged ({stats.in_place} in place, {stats.rewrites} rewritten), {stats.skipped} unchanged, "
+          f"{stats.failed} failed, {stats.total} total" + (f", {stats.resumed} done before resuming" if stats.resumed else "") + (" (cancelled)" if stats.cancelled else ""))
+    return 1 if stats.failed else 0
+def _jobs(cfg, args, log, log_file):
+    from .jobqueue import JobQueue, load_jobs
+    try:
+        path = args.jobs
+        jobs = load_jobs(path)
+        # Options given on the command line also override the job profiles
+        queue = JobQueue(cfg, jobs, log=log, source=os.path.abspath(path), overrides=explicit_options(args))
+        stats = queue.run()
+    except KeyboardInterrupt:
+        print("Cancelled by user.", file=sys.stderr)
+        return 130
+    except Exception as e:
+        print(f"Fatal error: {e}", file=sys.stderr)
+        return 2
+    finally:
+        if log_file:
+            log_file.close()
+    print(f"Done: {len(jobs)} jobs, {stats.tagged} tagged ({stats.in_place} in place, {stats.rewrites} rewritten), "
+          f"{stats.skipped} unchanged, {stats.failed} failed, {stats.total} total" + (" (cancelled)" if stats.cancelled else ""))
+    return 1 if stats.failed or queue.failed_jobs else 0
+def _reader_gone():
+    """The reader of our output (head, a pager) quit: stop quietly, as other command-line tools do. Returns 0."""
+    # The interpreter flushes stdout on exit; give what is left somewhere to go
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, sys.stdout.fileno())
+    return 0
+def _dry_run(engine, target, log_file):
+    out = sys.stdout if target == '-' else open(target, 'w', encoding='utf-8')
+    try:
+        counts = engine.write_plan(out)
+    except BrokenPipeError:
+        return _reader_gone()
+    except KeyboardInterrupt:
+        print("Cancelled by user.", file=sys.stderr)
+        return 130
+    except Exception as e:
+        print(f"Fatal error: {e}", file=sys.stderr)
+        return 2
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        if log_file:
+            log_file.close()
+    return 1 if counts['error'] else 0
+def _inventory(engine, target, fmt, log_file):
+    from .inventory import export_inventory
+    cfg = engine.config
+    if fmt == 'sqlite':
+        out = target
+    else:
+        # newline='' lets the csv module write its own line endings
+        out = sys.stdout if target == '-' else open(target, 'w', encoding='utf-8', newline='')
+    try:
+        files = engine.gather_files()
+        _, _, errors = export_inventory(files, out, fmt, cfg.workers, cfg.executor, engine.log, engine.cancelled)
+    except BrokenPipeError:
+        return _reader_gone()
+    except KeyboardInterrupt:
+        print("Cancelled by user.", file=sys.stderr)
+        return 130
+    except Exception as e:
+        print(f"Fatal error: {e}", file=sys.stderr)
+        return 2
+    finally:
+        if out not in (sys.stdout, target):
+            out.close()
+        if log_file:
+            log_file.close()
+    return 1 if errors else 0
+def _backups(cfg, args):
+    from .backup import BackupStore, restore_run
+    store = BackupStore(cfg.backup_dir)
+    runs = store.run_ids()
+    if args.list_backups:
+        for run_id in runs:
+            header, entries = store.read_run(run_id)
+            print(f"{run_id}  {len(entries):>7} files  {header.get('target', '')}")
+        if not runs:
+            print(f"No backed-up runs in {cfg.backup_dir}.")
+        return 0
+    run_id = runs[-1] if args.restore == 'last' and runs else args.restore
+    if run_id not in runs:
+        print(f"Fatal error: no backed-up run {args.restore!r} in {cfg.backup_dir}.", file=sys.stderr)
+        return 2
+    try:
+        _, _, failed = restore_run(store, run_id, log=print, force=args.restore_changed)
+    except KeyboardInterrupt:
+        print("Cancelled by user.", file=sys.stderr)
+        return 130
+    return 1 if failed else 0
+def _watch(engine, log_file):
+    from .watch import FolderWatcher
+    cfg = engine.config
+    stop = engine.cancel_event = threading.Event()
+    # A service manager stops the watch with SIGTERM; finish the current batch and report
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    watcher = FolderWatcher(engine, settle=cfg.watch_settle, poll_interval=cfg.watch_poll)
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        print(f"Fatal error: {e}", file=sys.stderr)
+        return 2
+    finally:
+        if log_file:
+            log_file.close()
+    stats = watcher.stats
+    print(f"Watch stopped: {stats.tagged} tagged, {stats.skipped} unchanged, {stats.failed} failed.")
+    return 1 if stats.failed else 0
@@ -0,0 +1,224 @@
+"""
+Run settings of the MP3/WAV Batch Tagger: the TagConfig dataclass, the form
+fields and the JSON profile format, plus the default locations of the files
+the tagger keeps in the home directory.
+
+This module imports nothing heavy (no mutagen, sqlite3, tkinter or PIL), so
+the GUI can build its form and read a profile before the engine is loaded.
+"""
+
+import os
+import json
+from dataclasses import dataclass, field
+# Default profile path
+PROFILE_PATH = os.path.join(os.path.expanduser("~"), ".mp3_tagger_profile.json")
+AUDIO_EXTS = ('.mp3', '.wav')
+# (label, tag key) in form order; keys double as profile keys
+FIELDS = [
+    ("Contributing Artist", "TPE1"),
+    ("Album Artist", "TPE2"),
+    ("Year", "TDRC"),
+    ("Track Number", "TRCK"),
+    ("Genre", "TCON"),
+    ("Publisher", "TPUB"),
+    ("Encoded by", "TSSE"),
+    ("Author URL", "WXXX"),
+    ("Copyright", "TCOP"),
+    ("Composers", "TCOM"),
+    ("Conductors", "TPE3"),
+    ("Group Description", "TXXX:Group Description"),
+    ("Mood", "TXXX:Mood"),
+    ("Album", "TALB"),
+    ("Parental Rating Reason", "TXXX:Parental Rating Reason"),
+]
+FIELD_KEYS = [key for _, key in FIELDS]
+TXXX_DESCS = ['Group Description', 'Mood', 'Parental Rating Reason']
+EXECUTORS = ('thread', 'process')
+# Memory profiling: off, RSS samples per stage, or RSS plus the Python heap (tracemalloc, slower)
+MEMORY_PROFILES = ('off', 'rss', 'trace')
+DEFAULT_PADDING_RESERVE = 8192
+# Default manifest, index and journal locations, next to the default profile
+MANIFEST_PATH = os.path.join(os.path.expanduser("~"), ".mp3_tagger_manifest.sqlite")
+INDEX_PATH = os.path.join(os.path.expanduser("~"), ".mp3_tagger_index.sqlite")
+JOURNAL_DIR = os.path.join(os.path.expanduser("~"), ".mp3_tagger_journals")
+BACKUP_DIR = os.path.join(os.path.expanduser("~"), ".mp3_tagger_backups")
+@dataclass
+class TagConfig:
+    """Settings for one tagging run. Mirrors the JSON profile layout."""
+    fields: dict = field(default_factory=dict)
+    folder: str = ''
+    single_path: str = ''
+    single_mode: bool = False
+    auto_number: bool = False
+    only_fill_missing: bool = False
+    track_offset: int = 1
+    # Every folder is its own album: numbering restarts per folder and folders are tagged in parallel
+    album_mode: bool = False
+    embed_cover: bool = True
+    verify_writes: bool = True
+    # Verify by reading the file back from disk instead of re-parsing the written bytes
+    verify_readback: bool = False
+    force_v23: bool = True
+    # Parallel mode: files tagged concurrently and executor kind ('thread' or 'process')
+    workers: int = 1
+    executor: str = 'thread'
+    # Padding added when a tag has to grow, so later runs can edit it in place
+    padding_reserve: int = DEFAULT_PADDING_RESERVE
+    # Leave files alone whose tags already match; the manifest ('' = none) skips them unopened
+    skip_unchanged: bool = False
+    manifest_path: str = MANIFEST_PATH
+    # Take the file list from the persistent library index instead of a full walk
+    use_index: bool = False
+    index_path: str = INDEX_PATH
+    # Downsize covers larger than this (pixels, 0 = embed as-is) and re-encode at this JPEG quality
+    cover_max_px: int = 0
+    cover_quality: int = 90
+    # Append the complete run log here ('' = off); the window only keeps recent lines
+    log_file: str = ''
+    # Folder of checkpoint journals, one per target and settings ('' = off);
+    # an interrupted run with the same settings resumes after its last file
+    journal_dir: str = JOURNAL_DIR
+    resume: bool = True
+    # Save the original tag bytes of every rewritten file under backup_dir, so the run can be rolled back
+    backup: bool = False
+    backup_dir: str = BACKUP_DIR
+    # Network mounts: an I/O scheduler sets how many metadata and data operations run at once
+    # (up to io_max threads) from their measured latency; io_simulate fakes a slow filer for
+    # trying it locally ("META_MS,DATA_MS[,SLOTS[,OVERLOAD]]", not saved in profiles)
+    adaptive_io: bool = False
+    io_max: int = 32
+    io_simulate: str = ''
+    # Per-stage timing report written after each run ('' = off): JSON and Prometheus textfile
+    report_json: str = ''
+    report_prom: str = ''
+    # Memory per stage, file type and largest files in the log and JSON report (one of MEMORY_PROFILES),
+    # and the MB the run keeps under by tagging fewer files at once (0 = no budget)
+    memory_profile: str = 'off'
+    memory_budget: int = 0
+    # Watch mode: seconds a new file must stay unchanged before it is tagged, and the polling
+    # period where inotify is unavailable
+    watch_settle: float = 2.0
+    watch_poll: float = 1.0
+    # Explicit cover (bytes, mime); overrides cover.jpg/folder.jpg lookup
+    cover: tuple = (None, None)
+    @property
+    def v2_version(self):
+        return 3 if self.force_v23 else 4
+    @property
+    def target(self):
+        return self.single_path if self.single_mode else self.folder
+    def metadata(self):
+        """Non-empty field values, stripped, keyed by tag key."""
+        return {k: str(v).strip() for k, v in self.fields.items() if str(v).strip()}
+    @classmethod
+    def from_profile(cls, data, base=None):
+        """Build a config from parsed profile JSON, layered over `base` if given."""
+        cfg = cls() if base is None else base.copy()
+        data = dict(data)
+        options = data.pop('__options__', {})
+        for key, value in data.items():
+            if key in FIELD_KEYS:
+                cfg.fields[key] = value
+        cfg.auto_number = bool(options.get('auto_number', cfg.auto_number))
+        cfg.only_fill_missing = bool(options.get('only_fill_missing', cfg.only_fill_missing))
+        cfg.embed_cover = bool(options.get('embed_cover', cfg.embed_cover))
+        cfg.verify_writes = bool(options.get('verify_writes', cfg.verify_writes))
+        cfg.verify_readback = bool(options.get('verify_readback', cfg.verify_readback))
+        cfg.force_v23 = bool(options.get('force_v23', cfg.force_v23))
+        cfg.track_offset = int(options.get('track_offset', cfg.track_offset))
+        cfg.single_mode = bool(options.get('single_mode', cfg.single_mode))
+        cfg.album_mode = bool(options.get('album_mode', cfg.album_mode))
+        cfg.workers = int(options.get('workers', cfg.workers))
+        cfg.padding_reserve = int(options.get('padding_reserve', cfg.padding_reserve))
+        cfg.skip_unchanged = bool(options.get('skip_unchanged', cfg.skip_unchanged))
+        cfg.manifest_path = str(options.get('manifest_path', cfg.manifest_path))
+        cfg.use_index = bool(options.get('use_index', cfg.use_index))
+        cfg.index_path = str(options.get('index_path', cfg.index_path))
+        cfg.cover_max_px = int(options.get('cover_max_px', cfg.cover_max_px))
+        cfg.cover_quality = int(options.get('cover_quality', cfg.cover_quality))
+        cfg.log_file = str(options.get('log_file', cfg.log_file))
+        # Older profiles name a single journal file; only its '' (off) carries over
+        cfg.journal_dir = str(options.get('journal_dir', '' if options.get('journal_path') == '' else cfg.journal_dir))
+        cfg.resume = bool(options.get('resume', cfg.resume))
+        cfg.backup = bool(options.get('backup', cfg.backup))
+        cfg.backup_dir = str(options.get('backup_dir', cfg.backup_dir))
+        cfg.adaptive_io = bool(options.get('adaptive_io', cfg.adaptive_io))
+        cfg.io_max = int(options.get('io_max', cfg.io_max))
+        cfg.report_json = str(options.get('report_json', cfg.report_json))
+        cfg.report_prom = str(options.get('report_prom', cfg.report_prom))
+        if options.get('memory_profile') in MEMORY_PROFILES:
+            cfg.memory_profile = options['memory_profile']
+        cfg.memory_budget = int(options.get('memory_budget', cfg.memory_budget))
+        cfg.watch_settle = float(options.get('watch_settle', cfg.watch_settle))
+        cfg.watch_poll = float(options.get('watch_poll', cfg.watch_poll))
+        if options.get('executor') in EXECUTORS:
+            cfg.executor = options['executor']
+        last_folder = options.get('last_folder')
+        if last_folder and os.path.isdir(last_folder):
+            cfg.folder = last_folder
+        last_file = options.get('last_file')
+        if last_file and os.path.isfile(last_file):
+            cfg.single_path = last_file
+        return cfg.normalize()
+    def normalize(self):
+        """Clamp the numeric options into their valid ranges (and unknown choices to the defaults); returns self."""
+        self.track_offset = max(1, int(self.track_offset))
+        self.workers = max(1, int(self.workers))
+        self.padding_reserve = max(0, int(self.padding_reserve))
+        self.cover_max_px = max(0, int(self.cover_max_px))
+        self.cover_quality = min(95, max(1, int(self.cover_quality)))
+        self.io_max = max(1, int(self.io_max))
+        self.memory_budget = max(0, int(self.memory_budget))
+        self.watch_settle = max(0.0, float(self.watch_settle))
+        self.watch_poll = max(0.05, float(self.watch_poll))
+        if self.executor not in EXECUTORS:
+            self.executor = EXECUTORS[0]
+        if self.memory_profile not in MEMORY_PROFILES:
+            self.memory_profile = MEMORY_PROFILES[0]
+        return self
+    def to_profile(self):
+        data = self.metadata()
+        data['__options__'] = {
+            'auto_number': self.auto_number,
+            'only_fill_missing': self.only_fill_missing,
+            'embed_cover': self.embed_cover,
+            'verify_writes': self.verify_writes,
+            'verify_readback': self.verify_readback,
+            'force_v23': self.force_v23,
+            'track_offset': int(self.track_offset),
+            'last_folder': self.folder or '',
+            'single_mode': self.single_mode,
+            'album_mode': self.album_mode,
+            'workers': int(self.workers),
+            'executor': self.executor,
+            'padding_reserve': int(self.padding_reserve),
+            'skip_unchanged': self.skip_unchanged,
+            'manifest_path': self.manifest_path,
+            'use_index': self.use_index,
+            'index_path': self.index_path,
+            'cover_max_px': int(self.cover_max_px),
+            'cover_quality': int(self.cover_quality),
+            'log_file': self.log_file,
+            'journal_dir': self.journal_dir,
+            'resume': self.resume,
+            'backup': self.backup,
+            'backup_dir': self.backup_dir,
+            'adaptive_io': self.adaptive_io,
+            'io_max': int(self.io_max),
+            'report_json': self.report_json,
+            'report_prom': self.report_prom,
+            'memory_profile': self.memory_profile,
+            'memory_budget': int(self.memory_budget),
+            'watch_settle': float(self.watch_settle),
+            'watch_poll': float(self.watch_poll),
+            'last_file': self.single_path or ''
+        }
+        return data
+    def copy(self):
+        return TagConfig(**{**self.__dict__, 'fields': dict(self.fields)})
+def load_profile(path, base=None):
+    with open(path) as f:
+        return TagConfig.from_profile(json.load(f), base=base)
+def save_profile(config, path):
+    with open(path, 'w') as f:
+        json.dump(config.to_profile(), f, indent=2)
@@ -0,0 +1,186 @@
+"""
+Per-folder cover art resolution with a content-hash cache.
+
+Each directory gets its own cover.jpg/folder.jpg (falling back to the
+nearest parent up to the batch root), each directory is looked up once,
+and identical images (same bytes, e.g. the same scan copied into every
+disc folder) are processed once and shared. With max_px set, covers larger
+than that are downsized and re-encoded as JPEG through Pillow before they
+are embedded; Pillow is only imported when that is needed. Caches of
+several batches (the jobs of a JobQueue) can share one store of processed
+images, so each image is processed once across all of them.
+
+Both the folders and the processed images are kept for the `keep` most
+recently used only: files arrive folder by folder, so a finished album's
+cover is rarely needed again, and a library of a thousand albums must not
+hold a thousand covers.
+"""
+
+import os
+import hashlib
+import threading
+from io import BytesIO
+COVER_CANDIDATES = ['cover.jpg', 'cover.jpeg', 'cover.png', 'folder.jpg', 'folder.jpeg', 'folder.png']
+NO_COVER = (None, None)
+# Folders and processed images a cache keeps (the most recently used)
+KEEP_COVERS = 8
+def read_cover(path):
+    """Read an image file and return (bytes, mime) for an APIC frame."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    mime = 'image/png' if path.lower().endswith('png') else 'image/jpeg'
+    return (data, mime)
+def find_cover_art(base_folder):
+    for name in COVER_CANDIDATES:
+        p = os.path.join(base_folder, name)
+        if os.path.isfile(p):
+            try:
+                return read_cover(p)
+            except Exception:
+                continue
+    return NO_COVER
+def downsize(data, mime, max_px, quality=90):
+    """
+    Fit the image into max_px x max_px and re-encode it as JPEG. Returns
+    (data, mime, resized); the original is kept if Pillow is missing, the
+    image cannot be decoded, it is already small enough, or the re-encoded
+    version would not be smaller.
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        return data, mime, False
+    try:
+        with Image.open(BytesIO(data)) as im:
+            if max(im.size) <= max_px:
+                return data, mime, False
+            im = im.convert('RGB')
+            im.thumbnail((max_px, max_px), Image.LANCZOS)
+            out = BytesIO()
+            im.save(out, 'JPEG', quality=quality, optimize=True)
+    except Exception:
+        return data, mime, False
+    small = out.getvalue()
+    if len(small) >= len(data):
+        return data, mime, False
+    return small, 'image/jpeg', True
+def _touch(entries, key, keep):
+    """Mark `key` of `entries` (a dict in use order) as most recently used and drop the oldest beyond `keep`."""
+    entries[key] = entries.pop(key)
+    while len(entries) > keep:
+        del entries[next(iter(entries))]
+class CoverStore:
+    """Processed images by (sha1 of the file as read, max_px, quality), the `keep` most recently used (thread-safe)."""
+    def __init__(self, keep=KEEP_COVERS):
+        self.keep = max(1, int(keep))
+        self._entries = {}
+        self._lock = threading.Lock()
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                _touch(self._entries, key, self.keep)
+            return entry
+    def add(self, key, entry):
+        """Store `entry` unless another cache got there first; returns the stored one."""
+        with self._lock:
+            entry = self._entries.setdefault(key, entry)
+            _touch(self._entries, key, self.keep)
+            return entry
+    def discard(self, entry):
+        """Drop `entry` (a value returned by get/add)."""
+        with self._lock:
+            for key in [key for key, value in self._entries.items() if value is entry]:
+                del self._entries[key]
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    def __len__(self):
+        return len(self._entries)
+class CoverCache:
+    """
+    Resolves the cover for every directory of a batch. Thread-safe; the same
+    (bytes, mime) tuple is returned for every folder sharing an image.
+    explicit: a picked (bytes, mime) cover that overrides folder lookup.
+    lookup: whether to search folders at all (the "Embed cover" option).
+    shared: a CoverStore of processed images to share with other caches.
+    keep: folders (and, without `shared`, processed images) kept at once.
+    """
+    def __init__(self, root, explicit=NO_COVER, lookup=True, max_px=0, quality=90, log=None, shared=None, keep=KEEP_COVERS):
+        self.root = os.path.abspath(root)
+        self.lookup = lookup
+        self.max_px = max(0, int(max_px or 0))
+        self.quality = int(quality)
+        self.log = log or (lambda message: None)
+        self._lock = threading.Lock()
+        self.keep = max(1, int(keep))
+        # Folder -> processed entry, in use order
+        self._by_dir = {}
+        self._by_hash = CoverStore(self.keep) if shared is None else shared
+        self.resized = 0
+        self.distinct = 0
+        self._explicit = self._process(*explicit) if explicit and explicit[0] else None
+    def _process(self, data, mime, name='cover'):
+        """Processed (bytes, mime, digest) for raw image bytes, computed once per content."""
+        key = (hashlib.sha1(data).hexdigest(), self.max_px, self.quality)
+        entry = self._by_hash.get(key)
+        if entry is None:
+            digest = key[0]
+            if self.max_px:
+                new, new_mime, resized = downsize(data, mime, self.max_px, self.quality)
+                if resized:
+                    self.resized += 1
+                    self.log(f"Cover {name}: {len(data) // 1024} KB -> {len(new) // 1024} KB ({self.max_px}px JPEG).")
+                    data, mime, digest = new, new_mime, hashlib.sha1(new).hexdigest()
+            self.distinct += 1
+            # Another cache sharing the store may have got there first
+            entry = self._by_hash.add(key, ((data, mime), digest))
+        return entry
+    def _resolve(self, d):
+        entry = self._by_dir.get(d)
+        if entry is not None:
+            _touch(self._by_dir, d, self.keep)
+            return entry
+        cover = find_cover_art(d)
+        if cover[0]:
+            entry = self._process(*cover, name=os.path.basename(d) or d)
+        elif d != self.root and d.startswith(self.root + os.sep):
+            entry = self._resolve(os.path.dirname(d))
+        else:
+            entry = (NO_COVER, None)
+        self._by_dir[d] = entry
+        _touch(self._by_dir, d, self.keep)
+        return entry
+    def entry_for_dir(self, d):
+        """((bytes, mime), sha1 of the embedded bytes) for directory `d`."""
+        if self._explicit:
+            return self._explicit
+        if not self.lookup:
+            return (NO_COVER, None)
+        with self._lock:
+            return self._resolve(os.path.abspath(d))
+    def for_dir(self, d):
+        return self.entry_for_dir(d)[0]
+    def clear(self):
+        """Forget every folder and processed image; they are looked up again when needed."""
+        with self._lock:
+            self._by_dir.clear()
+            self._by_hash.clear()
+    def forget(self, d):
+        """
+        Look up the cover of directory `d` and the directories below it again
+        (its image changed). Images no other folder uses are dropped too; returns
+        their (bytes, mime) covers, for the encoded frames to be dropped as well.
+        """
+        d = os.path.abspath(d)
+        with self._lock:
+            gone = [self._by_dir.pop(key) for key in list(self._by_dir) if key == d or key.startswith(d + os.sep)]
+            used = {id(entry) for entry in self._by_dir.values()}
+            dropped = []
+            for entry in {id(entry): entry for entry in gone}.values():
+                if entry[1] is not None and id(entry) not in used:
+                    self._by_hash.discard(entry)
+                    dropped.append(entry[0])
+            return dropped
+    def for_file(self, path):
+        return self.for_dir(os.path.dirname(path) or '.')
@@ -0,0 +1,916 @@
+"""
+Headless tagging engine for the MP3/WAV Batch Tagger.
+
+Everything needed to tag a folder (or a single file) without Tk lives here:
+  - TagConfig (defined in tagger.config, re-exported here): plain config
+    object with the same fields and options as the JSON profile
+  - TaggerEngine: gathers files, resolves cover art, writes and verifies tags
+
+The GUI (mp3tagger.py) and the command-line entry point (python -m tagger)
+are both thin clients of this module.
+"""
+
+import gc
+import os
+import json
+import time
+import queue
+import hashlib
+import threading
+from collections import deque
+from contextlib import nullcontext
+from functools import partial
+from itertools import islice
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass
+from io import BytesIO
+from mutagen.id3 import (
+    ID3, TPE1, TPE2, TDRC, TRCK, TCON,
+    TPUB, TSSE, WXXX, TCOP, TCOM,
+    TPE3, TXXX, TALB, APIC, MakeID3v1
+)
+from mutagen import MutagenError
+from .config import (
+    PROFILE_PATH, AUDIO_EXTS, FIELDS, FIELD_KEYS, TXXX_DESCS, EXECUTORS, DEFAULT_PADDING_RESERVE,
+    TagConfig, load_profile, save_profile
+)
+from .backup import BackupStore
+from .covers import KEEP_COVERS, CoverCache, read_cover, find_cover_art
+from .iosched import IOScheduler, SimulatedFiler
+from .journal import Journal, journal_file, run_key, remove_stale_temps
+from .manifest import Manifest
+from .memory import MB, MemoryMonitor, enable as enable_memory_sampling, set_shed_signal, shed_requested
+from .scan import FolderPrefetch, PathList, StreamingScan, iter_sorted, list_digests
+from .template import TagTemplate
+from .timing import FileTimer, RunTimer
+from .tagio import (
+    WRITE_IN_PLACE, WRITE_REWRITE, WRITE_SKIPPED, read_wav_tag, write_wav_id3, write_mp3_id3,
+    encode_frames, assemble_tag
+)
+# Jobs queued ahead per worker in parallel mode; bounds memory on huge trees
+IN_FLIGHT_PER_WORKER = 4
+VERIFY_KEYS = ['TPE1','TPE2','TDRC','TRCK','TCON','TPUB','TCOP','TALB','TCOM','TPE3','TXXX:Group Description','TXXX:Mood','TXXX:Parental Rating Reason']
+def _frame_value(frame):
+    """Comparable value of a frame we write; covers compare by content hash."""
+    if frame.FrameID == 'APIC':
+        return (frame.mime, int(frame.type), frame.desc, hashlib.sha1(frame.data).hexdigest())
+    if frame.FrameID == 'WXXX':
+        return (frame.desc, frame.url)
+    return (getattr(frame, 'desc', None), [str(t) for t in frame.text])
+def tag_matches(current, desired, v2_version):
+    """True if `current` already holds every frame of `desired`, saved as v2.<v2_version>."""
+    if current.version[1] != v2_version:
+        return False
+    for key, frame in desired.items():
+        have = current.get(key)
+        if have is None or _frame_value(have) != _frame_value(frame):
+            return False
+    return True
+def _json_value(frame):
+    """JSON-friendly value of a frame for dry-run records (covers as mime, size and hash)."""
+    if frame is None:
+        return None
+    if frame.FrameID == 'APIC':
+        return {'mime': frame.mime, 'bytes': len(frame.data), 'sha1': hashlib.sha1(frame.data).hexdigest()}
+    if frame.FrameID == 'WXXX':
+        return frame.url
+    return [str(t) for t in frame.text]
+def tag_changes(current, desired, v2_version):
+    """Frame-level differences merging `desired` into `current` would make, as [{frame, old, new}]."""
+    changes = []
+    if len(current) and current.version[1] != v2_version:
+        changes.append({'frame': 'version', 'old': f"2.{current.version[1]}", 'new': f"2.{v2_version}"})
+    for key, frame in desired.items():
+        have = current.get(key)
+        if have is None or _frame_value(have) != _frame_value(frame):
+            changes.append({'frame': key, 'old': _json_value(have), 'new': _json_value(frame)})
+    return changes
+def album_shards(files):
+    """
+    Group a sorted file list by folder for album mode. Returns [(folder,
+    [(index, path, (n, count))])], largest album first; `index` is the file's
+    1-based position in `files`, (n, count) its track number within the album.
+    """
+    albums = {}
+    for i, path in enumerate(files, start=1):
+        albums.setdefault(os.path.dirname(path), []).append((i, path))
+    shards = []
+    for d, entries in albums.items():
+        count = len(entries)
+        shards.append((d, [(i, path, (n, count)) for n, (i, path) in enumerate(entries, start=1)]))
+    shards.sort(key=lambda shard: len(shard[1]), reverse=True)
+    return shards
+def get_text(tag, key):
+    """First text value of `key` in an ID3 tag ('' if absent). Handles TXXX:<desc>."""
+    if key.startswith('TXXX:'):
+        desc = key.split(':',1)[1]
+        for f in tag.getall('TXXX'):
+            if getattr(f, 'desc', '') == desc:
+                return (f.text or [''])[0]
+        return ''
+    f = tag.get(key)
+    return (f.text[0] if f and getattr(f, 'text', None) else '')
+def verify_tag(tag, expected):
+    """Confirm a subset of tags in a parsed ID3 match expected values. Returns (ok, message)."""
+    for k in VERIFY_KEYS:
+        if expected.get(k):
+            got = get_text(tag, k)
+            if str(got).strip() != str(expected[k]).strip():
+                return False, f"{k} → '{got}' != '{expected[k]}'"
+    return True, 'ok'
+def verify_tag_bytes(data, expected):
+    """verify_tag() against serialized ID3v2 bytes instead of a file on disk."""
+    try:
+        return verify_tag(ID3(BytesIO(data)), expected)
+    except Exception as e:
+        return False, f"verify exception: {e}"
+@dataclass
+class FileResult:
+    index: int
+    path: str
+    ok: bool
+    message: str
+    # WRITE_IN_PLACE / WRITE_REWRITE / WRITE_SKIPPED for successful files
+    write: str = ''
+    # Seconds per stage (see tagger.timing) and in total, for files that were opened
+    timings: dict = None
+    seconds: float = 0.0
+    # Backup run log entry of a rewritten file (with backup on)
+    backup: dict = None
+    # Memory samples of the file (FileTimer.memory), with memory profiling or a budget on
+    memory: dict = None
+@dataclass
+class RunStats:
+    total: int = 0
+    tagged: int = 0
+    failed: int = 0
+    cancelled: bool = False
+    # Tag writes that only touched the tag region vs. ones that moved the audio
+    in_place: int = 0
+    rewrites: int = 0
+    # Files whose tags already matched (skip_unchanged)
+    skipped: int = 0
+    # Files finished by an interrupted earlier run and not revisited
+    resumed: int = 0
+    def count(self, res):
+        """Add one FileResult to the outcome counters (not to total)."""
+        if not res.ok:
+            self.failed += 1
+            return
+        if res.write == WRITE_SKIPPED:
+            self.skipped += 1
+        else:
+            self.tagged += 1
+        if res.write == WRITE_IN_PLACE:
+            self.in_place += 1
+        elif res.write == WRITE_REWRITE:
+            self.rewrites += 1
+class TaggerEngine:
+    """
+    Runs one batch described by a TagConfig.
+    log(message) and progress(done, total) are called from the thread that
+    calls run(); cancel_event is anything with is_set() (e.g. threading.Event).
+    """
+    def __init__(self, config, log=None, progress=None, cancel_event=None):
+        self.config = config
+        self.log = log or (lambda message: None)
+        self.progress = progress or (lambda done, total: None)
+        self.cancel_event = cancel_event
+        self._manifest = None
+        self._covers = None
+        self._template = None
+        self._backup = None
+        # Adaptive I/O scheduler of the current run (adaptive_io on)
+        self._io = None
+        # MemoryMonitor of the last run (memory profiling or a memory budget on)
+        self.memory = None
+        # Set by a JobQueue to share processed covers and compiled templates between its jobs
+        self.cover_store = None
+        self.templates = None
+        # Album mode: (n, count) track position of every file, by 1-based index
+        self._numbers = None
+        # Timing of the last run()
+        self.timer = None
+    def cancelled(self):
+        return bool(self.cancel_event and self.cancel_event.is_set())
+    def open_io(self):
+        """Start the adaptive I/O scheduler for a run if adaptive_io is on."""
+        cfg = self.config
+        self._io = None
+        if cfg.adaptive_io:
+            filer = SimulatedFiler.from_spec(cfg.io_simulate) if cfg.io_simulate else None
+            self._io = IOScheduler(cfg.io_max, filer)
+            self.log(f"Adaptive I/O: up to {self._io.maximum} file operations at once, limits set from measured latency"
+                     + (" (simulated filer)." if filer else "."))
+        return self._io
+    def close_io(self):
+        """Stop the run's I/O scheduler and log what its limits did."""
+        if self._io:
+            self._io.close()
+            self.log(self._io.summary())
+            self._io = None
+    def open_memory(self):
+        """Start the memory monitor for a run if memory profiling or a budget is on."""
+        cfg = self.config
+        self.memory = None
+        if cfg.memory_profile != 'off' or cfg.memory_budget:
+            self.memory = MemoryMonitor(cfg.memory_budget, cfg.memory_profile != 'off', cfg.memory_profile == 'trace').start()
+            if cfg.memory_budget:
+                self.log(f"Memory budget: {cfg.memory_budget} MB; fewer files run at once when it gets close.")
+        return self.memory
+    def close_memory(self):
+        """Stop the run's memory monitor and log what it saw (it stays in `memory` for the reports)."""
+        if self.memory and self.memory.running:
+            self.memory.stop()
+            self.log(self.memory.summary())
+    def check_memory(self, res=None, shed=None):
+        """
+        Between files (run()'s thread): record `res` and keep to the budget.
+        While over it, shed() (default shed_caches()) drops the caches after
+        every file, here and in worker processes.
+        """
+        monitor = self.memory
+        if res is not None:
+            monitor.add_file(res.path, res.memory)
+        monitor.check()
+        if monitor.over:
+            (shed or self.shed_caches)()
+            monitor.request_shed()
+            gc.collect()
+        if not monitor.pressure_changed():
+            return
+        if monitor.over:
+            self.log(f"Memory: {monitor.used // MB} MB in use of the {monitor.budget // MB} MB budget; "
+                     f"dropping cached covers and tagging one file at a time.")
+        else:
+            self.log(f"Memory: down to {monitor.used // MB} MB; tagging {self.pool_size()} files at once again.")
+    def shed_caches(self):
+        """Drop processed covers and their encoded frames."""
+        if self._covers:
+            self._covers.clear()
+        if self._template:
+            self._template.clear_covers()
+    def forget_cover(self, folder):
+        """Look up the cover of `folder` (and the folders below it) again when it is next needed."""
+        if self._covers:
+            for cover in self._covers.forget(folder):
+                if self._template:
+                    self._template.drop_cover(cover)
+    def worker_signal(self, ctx):
+        """For a process pool's initializer: the memory monitor's shed counter, or None without a budget."""
+        return self.memory.worker_signal(ctx) if self.memory and self.memory.budget else None
+    def in_flight(self, workers):
+        """Files handed to a pool at once: a few per worker, or one while over the memory budget."""
+        if self.memory and self.memory.over:
+            return 1
+        return workers * IN_FLIGHT_PER_WORKER
+    def admit(self):
+        """Context around one file on an album thread: one file at a time while over the memory budget."""
+        return self.memory.admit() if self.memory else nullcontext()
+    def io(self, kind):
+        """Context around one file operation ('meta' or 'data'), paced by the I/O scheduler when it is on."""
+        return self._io.op(kind) if self._io else nullcontext()
+    def pool_size(self):
+        """Files handled at once: `workers`, or with adaptive I/O io_max threads (the scheduler paces their I/O)."""
+        return self._io.maximum if self._io else max(1, int(self.config.workers or 1))
+    def folder_prefetch(self):
+        """FolderPrefetch that lists folders ahead of a walk under the metadata limit, or None."""
+        return FolderPrefetch(partial(self._io.submit, 'meta'), AUDIO_EXTS) if self._io else None
+    def gather_files(self):
+        """Audio files to tag in case-insensitive path order, as a compact PathList."""
+        cfg = self.config
+        if cfg.single_mode and cfg.single_path:
+            return PathList([cfg.single_path])
+        if cfg.use_index and cfg.index_path:
+            from .index import LibraryIndex
+            with LibraryIndex(cfg.index_path, AUDIO_EXTS) as index:
+                index.scan(cfg.folder)
+                self.log(f"Index: listed {index.dirs_listed} of {index.dirs_seen} folders.")
+                return PathList(index.files(cfg.folder))
+        files = PathList()
+        for folder, name in iter_sorted(cfg.folder, AUDIO_EXTS, self.folder_prefetch()):
+            files.add(folder, name)
+        return files
+    def can_stream(self):
+        """True if tagging can start while the folder is still being scanned (no track total needed)."""
+        cfg = self.config
+        return not (cfg.single_mode or cfg.auto_number or cfg.album_mode or cfg.use_index)
+    def cover_root(self):
+        cfg = self.config
+        return os.path.dirname(os.path.abspath(cfg.single_path)) if cfg.single_mode else cfg.folder
+    def cover_keep(self):
+        """Covers worth keeping: a few recent folders, plus one per folder tagged at once in album mode."""
+        return KEEP_COVERS + (self.pool_size() if self.config.album_mode else 0)
+    def make_cover_cache(self):
+        cfg = self.config
+        return CoverCache(self.cover_root(), explicit=cfg.cover, lookup=cfg.embed_cover, max_px=cfg.cover_max_px,
+                          quality=cfg.cover_quality, log=self.log, shared=self.cover_store, keep=self.cover_keep())
+    def number_albums(self, files):
+        """In album mode, number `files` per folder for this run. Returns the album count (0 otherwise)."""
+        self._numbers = None
+        if not self.config.album_mode or self.config.single_mode:
+            return 0
+        shards = album_shards(files)
+        self._numbers = [None] * len(files)
+        for _, jobs in shards:
+            for i, _, number in jobs:
+                self._numbers[i - 1] = number
+        return len(shards)
+    def number_for(self, i, total):
+        """(n, count) used to number the i-th of `total` files: its album position in album mode."""
+        return self._numbers[i - 1] if self._numbers else (i, total)
+    def track_number(self, i, total):
+        offset = max(1, int(self.config.track_offset or 1))
+        return f"{offset + i - 1}/{total + offset - 1}"
+    def read_tag(self, path):
+        """Parse the file's current ID3 tag (empty ID3 if it has none)."""
+        if os.path.splitext(path)[1].lower() == '.wav':
+            return read_wav_tag(path)
+        try:
+            return ID3(path)
+        except MutagenError:
+            return ID3()
+    def file_metadata(self, i, total, base_md, tag):
+        """Metadata for the i-th (1-based) of `total` files, including auto TRCK; `tag` is its current tag."""
+        cfg = self.config
+        md = dict(base_md)
+        if cfg.auto_number and not cfg.single_mode:
+            if cfg.only_fill_missing:
+                existing = tag.get('TRCK')
+                has_track = bool(existing and getattr(existing, 'text', [''])[0])
+                if not has_track:
+                    md['TRCK'] = self.track_number(i, total)
+            else:
+                md['TRCK'] = self.track_number(i, total)
+        return md
+    def prepare(self):
+        """Per-batch state shared by every tag_file() call (base fields, covers)."""
+        cfg = self.config
+        self._base_md = cfg.metadata()
+        self._covers = self.make_cover_cache()
+        key = (json.dumps(sorted(self._base_md.items())), cfg.v2_version)
+        self._template = self.templates.get(key) if self.templates is not None else None
+        if self._template is None:
+            self._template = TagTemplate(self.build_tag, self._base_md, cfg.v2_version, self.cover_keep())
+            if self.templates is not None:
+                self._template = self.templates.setdefault(key, self._template)
+        self._backup = BackupStore(cfg.backup_dir) if cfg.backup and cfg.backup_dir else None
+        self._run_sig = json.dumps([
+            sorted(self._base_md.items()), cfg.v2_version,
+            bool(cfg.auto_number and cfg.only_fill_missing and not cfg.single_mode),
+        ])
+    def file_signature(self, i, total, path):
+        """Identifies the tags the i-th file should end up with, for the manifest."""
+        cfg = self.config
+        trck = ''
+        if cfg.auto_number and not cfg.single_mode and not cfg.only_fill_missing:
+            trck = self.track_number(*self.number_for(i, total))
+        (_, cover_mime), cover_digest = self._covers.entry_for_dir(os.path.dirname(path) or '.')
+        return hashlib.sha1(f"{self._run_sig}|{trck}|{cover_mime}|{cover_digest}".encode('utf-8')).hexdigest()
+    def _precheck(self, i, total, path):
+        """FileResult for files the manifest proves unchanged (never opened), else None."""
+        if not self._manifest:
+            return None
+        with self.io('meta'):
+            unchanged = self._manifest.unchanged(path, self.file_signature(i, total, path))
+        if unchanged:
+            return FileResult(i, path, True, f"{_position(i, total)} Unchanged: {os.path.basename(path)}", WRITE_SKIPPED)
+        return None
+    def tag_file(self, i, total, path, number=None):
+        """
+        Tag the i-th (1-based) of `total` files. Never raises; returns a FileResult.
+        The tag is parsed once; fill-missing, merge and verify all work on that parse.
+        number: (n, count) for the track number if not (i, total), e.g. in album mode.
+        """
+        t0 = time.perf_counter()
+        timer = FileTimer()
+        try:
+            with timer.stage('read'), self.io('data'):
+                tag = self.read_tag(path)
+            md = self.file_metadata(*(number or self.number_for(i, total)), self._base_md, tag)
+            with timer.stage('cover'):
+                cover = self._covers.for_file(path)
+            backup = []
+            def save_backup():
+                with timer.stage('backup'), self.io('data'):
+                    backup.append(self._backup.save(path))
+            write = self.apply_meta(path, md, cover=cover, tag=tag, timer=timer, before_write=save_backup if self._backup else None)
+            verb = 'Unchanged' if write == WRITE_SKIPPED else 'Tagged'
+            res = FileResult(i, path, True, f"{_position(i, total)} {verb}: {os.path.basename(path)}", write)
+            if backup:
+                res.backup = BackupStore.written(backup[0])
+        except (MutagenError, OSError, ValueError) as e:
+            res = FileResult(i, path, False, f"Error tagging {os.path.basename(path)}: {type(e).__name__} - {e}")
+        except Exception as e:
+            res = FileResult(i, path, False, f"Unexpected error tagging {os.path.basename(path)}: {type(e).__name__} - {e}")
+        res.timings, res.seconds = timer.stages, time.perf_counter() - t0
+        res.memory = timer.memory
+        return res
+    def _make_pool(self, workers, total):
+        """Executor plus a submit(i, path) that schedules tag_file on it."""
+        if self.config.executor == 'process' and not self._io:
+            # multiprocessing is only imported when a process pool is asked for
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            ctx = multiprocessing.get_context()
+            pool = ProcessPoolExecutor(workers, mp_context=ctx, initializer=_process_init,
+                                       initargs=(self.config, None, self.worker_signal(ctx)))
+            return pool, lambda i, path: pool.submit(_process_tag, i, total, path)
+        pool = ThreadPoolExecutor(workers, thread_name_prefix='tagger')
+        return pool, lambda i, path: pool.submit(self.tag_file, i, total, path)
+    def results(self, files, start=0):
+        """
+        Yield a FileResult per file from files[start:], in file order, stopping
+        early on cancel. With workers > 1 up to a few jobs per worker are in
+        flight; results are still released strictly in order so log lines and
+        progress never jump.
+        """
+        total = len(files)
+        jobs = islice(enumerate(files, start=1), start, None)
+        if total - start <= 1:
+            return self.job_results(jobs, total, workers=1)
+        return self.job_results(jobs, total)
+    def job_results(self, jobs, total, workers=None):
+        """
+        results() over an iterator of (index, path); `total` is 0 while it is
+        unknown (a running scan). Jobs are pulled only as workers free up.
+        """
+        workers = max(1, int(workers or self.pool_size()))
+        if workers == 1:
+            for i, path in jobs:
+                if self.cancelled():
+                    return
+                yield self._precheck(i, total, path) or self.tag_file(i, total, path)
+            return
+        pool, submit = self._make_pool(workers, total)
+        pending = deque()
+        try:
+            while True:
+                while len(pending) < self.in_flight(workers) and not self.cancelled():
+                    job = next(jobs, None)
+                    if job is None:
+                        break
+                    res = self._precheck(job[0], total, job[1])
+                    if res:
+                        fut = Future()
+                        fut.set_result(res)
+                    else:
+                        fut = submit(*job)
+                    pending.append(fut)
+                if self.cancelled():
+                    # Drop queued jobs; ones already running still report below
+                    for fut in pending:
+                        fut.cancel()
+                if not pending:
+                    return
+                fut = pending.popleft()
+                if not fut.cancelled():
+                    yield fut.result()
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+    def album_results(self, files, skip=()):
+        """
+        Album mode: every folder is an independent job with its own track
+        count, scheduled largest album first on up to `workers` workers.
+        Yields a FileResult per file (indexes in `skip` excepted) as files
+        finish, so albums interleave. Cancellation is checked between files
+        of every album.
+        """
+        cfg = self.config
+        total = len(files)
+        shards = []
+        for _, jobs in album_shards(files):
+            todo = []
+            for i, path, number in jobs:
+                if i in skip:
+                    continue
+                res = self._precheck(i, total, path)
+                if res:
+                    yield res
+                else:
+                    todo.append((i, path, number))
+            if todo:
+                shards.append(todo)
+        if not shards:
+            return
+        shards.sort(key=len, reverse=True)
+        workers = min(self.pool_size(), len(shards))
+        if cfg.executor == 'process' and workers > 1 and not self._io:
+            yield from self._album_results_process(shards, workers, total)
+            return
+        results = queue.Queue()
+        stop = threading.Event()
+        def run_shard(jobs):
+            try:
+                for i, path, number in jobs:
+                    if self.cancelled() or stop.is_set():
+                        break
+                    with self.admit():
+                        results.put(self.tag_file(i, total, path, number))
+            finally:
+                results.put(None) # album finished or stopped
+        pool = ThreadPoolExecutor(workers, thread_name_prefix='album')
+        try:
+            for jobs in shards:
+                pool.submit(run_shard, jobs)
+            running = len(shards)
+            while running:
+                res = results.get()
+                if res is None:
+                    running -= 1
+                else:
+                    yield res
+        finally:
+            stop.set()
+            pool.shutdown(wait=True, cancel_futures=True)
+    def _album_results_process(self, shards, workers, total):
+        """album_results() on a process pool; each album's results arrive when it finishes."""
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        ctx = multiprocessing.get_context()
+        # Shared with the workers so a cancel also stops albums already running
+        stop = ctx.Event()
+        pool = ProcessPoolExecutor(workers, mp_context=ctx, initializer=_process_init,
+                                   initargs=(self.config, stop, self.worker_signal(ctx)))
+        try:
+            pending = {pool.submit(_process_shard, jobs, total) for jobs in shards}
+            while pending:
+                done, pending = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+                if self.cancelled():
+                    stop.set()
+                for fut in done:
+                    yield from fut.result()
+        finally:
+            stop.set()
+            pool.shutdown(wait=True, cancel_futures=True)
+    def run(self):
+        stats = RunStats()
+        timer = self.timer = RunTimer()
+        self.open_io()
+        self.open_memory()
+        try:
+            return self._run(stats, timer)
+        finally:
+            self.close_io()
+            self.close_memory()
+    def _run(self, stats, timer):
+        scan = StreamingScan(self.config.folder, AUDIO_EXTS, self.folder_prefetch()) if self.can_stream() else None
+        if scan:
+            # Tagging starts as soon as the scan finds its first file
+            first = next(scan, None)
+            files, total = scan.files, 0
+        else:
+            t0 = time.perf_counter()
+            files = self.gather_files()
+            timer.add('scan', time.perf_counter() - t0)
+            first = files[0] if files else None
+            total = len(files)
+        if first is None:
+            self.log("No audio files found.")
+            return stats
+        self.progress(0, total)
+        self.prepare()
+        cover_bytes, cover_mime = self._covers.for_dir(self.cover_root())
+        if cover_bytes:
+            self.log(f"Cover art found ({cover_mime}); will embed.")
+        elif self.config.embed_cover and not self.config.single_mode:
+            self.log("No cover art in the top folder; subfolder covers will be used where found.")
+        elif self.config.embed_cover:
+            self.log("No cover art found to embed.")
+        cfg = self.config
+        album_mode = self.number_albums(files)
+        if album_mode:
+            self.log(f"Album mode: {album_mode} albums, largest first.")
+        self._manifest = Manifest(cfg.manifest_path) if cfg.skip_unchanged and cfg.manifest_path else None
+        journal, skip = self.open_journal(None if scan else files)
+        backup_run = self._backup.open_run(cfg.target) if self._backup else None
+        if backup_run:
+            self.log(f"Backup: saving the original tags of rewritten files as run {backup_run.id}.")
+        # Journal lines of a streamed run carry a digest of the file list up to them
+        digests = {}
+        if scan:
+            stream = self._stream_jobs(scan, journal, skip, digests)
+            skip = next(stream)
+        done = stats.resumed = len(skip)
+        if done:
+            self.progress(done, total)
+        # Album mode: folder -> [files left, files, failed], reported when the album completes
+        albums = {}
+        if album_mode:
+            for i, path in enumerate(files, start=1):
+                if i not in skip:
+                    albums.setdefault(os.path.dirname(path), [0, 0, 0])[0] += 1
+            for album in albums.values():
+                album[1] = album[0]
+        if scan:
+            stream = self.job_results(stream, 0)
+        elif album_mode:
+            stream = self.album_results(files, skip)
+        else:
+            stream = self.results(files, start=done)
+        try:
+            for res in stream:
+                done += 1
+                if res.backup and backup_run:
+                    backup_run.add(res.backup)
+                if journal:
+                    journal.record(res.index, res.ok, digests.pop(res.index, ''))
+                self.log(res.message)
+                album = albums.get(os.path.dirname(res.path))
+                if album:
+                    album[0] -= 1
+                    album[2] += not res.ok
+                    if album[0] == 0:
+                        failed = f", {album[2]} failed" if album[2] else ""
+                        self.log(f"Album done: {os.path.dirname(res.path) or '.'} ({album[1]} files{failed}).")
+                if res.timings is not None:
+                    timer.add_file(res.timings, res.seconds)
+                if self.memory:
+                    self.check_memory(res)
+                stats.count(res)
+                if res.ok and self._manifest:
+                    with self.io('meta'):
+                        self._manifest.record(res.path, self.file_signature(res.index, total, res.path))
+                if scan and scan.finished:
+                    total = len(files)
+                self.progress(done, total)
+        finally:
+            if scan:
+                timer.add('scan', scan.seconds)
+                total = len(files) if scan.finished else total
+            if self._manifest:
+                self._manifest.close()
+                self._manifest = None
+            if journal:
+                journal.close(complete=bool(total) and done == total)
+            if backup_run:
+                backup_run.close()
+        stats.total = len(files)
+        if self.cancelled() and (done < total or not total):
+            unfinished = sum(1 for album in albums.values() if album[0])
+            self.log("Cancelled by user." + (f" {unfinished} albums not finished." if unfinished else ""))
+            stats.cancelled = True
+        if backup_run and backup_run.files:
+            self.log(f"Backup: run {backup_run.id} holds the original tags of {backup_run.files} files; "
+                     f"undo it with --restore {backup_run.id}.")
+        if stats.tagged or stats.skipped:
+            self.log(f"Writes: {stats.in_place} in place, {stats.rewrites} full rewrites, {stats.skipped} unchanged.")
+        self.close_io()
+        timer.finish()
+        self.log(timer.summary())
+        self.close_memory()
+        self.write_reports(stats)
+        return stats
+    def open_journal(self, files):
+        """
+        (journal or None, indexes already done) for this run: a prefix of the
+        file list, or in album mode any finished files. A resumed run first
+        drops stale temp files. files=None is a streamed run: its list is not
+        known yet, so the prefix is only claimed here and checked by
+        _stream_jobs() once the scan has reached it.
+        """
+        cfg = self.config
+        if not cfg.journal_dir or cfg.single_mode:
+            return None, set()
+        settings = [self._run_sig, cfg.target, cfg.single_mode, cfg.auto_number, cfg.track_offset,
+                    cfg.album_mode, cfg.embed_cover, cfg.cover_max_px, cfg.cover_quality]
+        # One journal per folder and settings; a changed file list starts that one over
+        identity = settings + ['stream' if files is None else 'list', os.path.abspath(cfg.folder)]
+        if files is None:
+            journal = Journal(journal_file(cfg.journal_dir, identity), run_key(identity, ()), 0)
+        else:
+            journal = Journal(journal_file(cfg.journal_dir, identity), run_key(settings, files), len(files))
+        try:
+            journal.begin(resume=cfg.resume)
+        except OSError as e:
+            self.log(f"Error opening journal {journal.path}: {type(e).__name__} - {e}; running without resume.")
+            return None, set()
+        if files is None:
+            return journal, set(range(1, journal.done + 1))
+        skip = journal.completed if cfg.album_mode else set(range(1, journal.done + 1))
+        if skip:
+            failed = f" ({journal.failed} of them failed)" if journal.failed else ""
+            where = f"with {len(skip)}" if cfg.album_mode else f"after file {len(skip)}"
+            self.log(f"Resuming {where} of {len(files)} files finished by an interrupted run{failed}.")
+            removed = remove_stale_temps(path for i, path in enumerate(files, start=1) if i not in skip)
+            if removed:
+                self.log(f"Removed {removed} leftover temp file(s) from the interrupted run.")
+        return journal, skip
+    def _stream_jobs(self, scan, journal, skip, digests):
+        """
+        Jobs (index, path) from a running scan. The first value yielded is the
+        set of indexes really skipped: a journal prefix is only trusted if the
+        scan reproduces the digest recorded with its last line.
+        """
+        done = len(skip)
+        if done:
+            for _ in islice(scan, done - len(scan.files)):
+                pass
+            if len(scan.files) == done and scan.digest() == journal.last_digest:
+                self.log(f"Resuming after file {done}: an interrupted run with the same settings already finished those"
+                         + (f" ({journal.failed} of them failed)." if journal.failed else "."))
+            else:
+                self.log("The journal does not match the files found; starting over.")
+                journal.restart()
+                done = 0
+        yield set(range(1, done + 1))
+        # Files already scanned but not skipped, then the rest of the scan
+        replay = zip(range(done + 1, len(scan.files) + 1), scan.files[done:], islice(list_digests(scan.files), done, None))
+        for i, path, digest in replay:
+            digests[i] = digest
+            yield i, path
+        for path in scan:
+            i = len(scan.files)
+            digests[i] = scan.digest()
+            if done and i <= done + IN_FLIGHT_PER_WORKER * self.pool_size():
+                # Files the interrupted run may have been writing
+                remove_stale_temps([path])
+            yield i, path
+    def write_reports(self, stats):
+        """Write the configured timing reports for the last run; failures are logged, not raised."""
+        cfg = self.config
+        # The JSON report also carries the memory profile
+        extra = {'memory': self.memory.to_dict()} if self.memory and self.memory.profile else None
+        for path, write in ((cfg.report_json, partial(self.timer.write_json, extra=extra)), (cfg.report_prom, self.timer.write_prometheus)):
+            if path:
+                try:
+                    write(path, stats)
+                except OSError as e:
+                    self.log(f"Error writing report {path}: {type(e).__name__} - {e}")
+    def plan_file(self, i, total, path):
+        """Dry-run record for the i-th of `total` files: what apply_meta would change. Never raises."""
+        rec = {'index': i, 'path': path}
+        try:
+            tag = self.read_tag(path)
+            md = self.file_metadata(*self.number_for(i, total), self._base_md, tag)
+            desired = self.build_tag(md, self._covers.for_file(path))
+            changes = tag_changes(tag, desired, self.config.v2_version)
+            skip = self.config.skip_unchanged and tag_matches(tag, desired, self.config.v2_version)
+            rec.update(action='skip' if skip else 'write', changes=changes)
+        except Exception as e:
+            rec.update(action='error', error=f"{type(e).__name__} - {e}")
+        return rec
+    def plan(self):
+        """
+        Yield a dry-run record per file, in file order, without writing any
+        audio file. Only tags are parsed; files the manifest proves unchanged
+        are not opened at all.
+        """
+        files = self.gather_files()
+        total = len(files)
+        if total == 0:
+            return
+        self.prepare()
+        cfg = self.config
+        self.number_albums(files)
+        # Never create a manifest just to look things up in it
+        use_manifest = cfg.skip_unchanged and cfg.manifest_path and os.path.isfile(cfg.manifest_path)
+        manifest = Manifest(cfg.manifest_path) if use_manifest else None
+        self.progress(0, total)
+        try:
+            for i, path in enumerate(files, start=1):
+                if self.cancelled():
+                    return
+                if manifest and manifest.unchanged(path, self.file_signature(i, total, path)):
+                    yield {'index': i, 'path': path, 'action': 'skip', 'reason': 'manifest', 'changes': []}
+                else:
+                    yield self.plan_file(i, total, path)
+                self.progress(i, total)
+        finally:
+            if manifest:
+                manifest.close()
+    def write_plan(self, out):
+        """Stream plan() to `out` as JSON lines. Returns counts per action."""
+        counts = {'write': 0, 'skip': 0, 'error': 0}
+        for rec in self.plan():
+            out.write(json.dumps(rec, ensure_ascii=False) + '\n')
+            counts[rec['action']] += 1
+            if rec['action'] == 'error':
+                self.log(f"Error reading {os.path.basename(rec['path'])}: {rec['error']}")
+        self.log(f"Dry run: {counts['write']} to write, {counts['skip']} to skip, {counts['error']} errors.")
+        return counts
+    def build_tag(self, metadata, cover=(None, None)):
+        """Fresh ID3 holding only the frames `metadata` and `cover` ask for."""
+        id3 = ID3()
+        def set_frame(key, frame):
+            id3.delall(key)
+            id3.add(frame)
+        # Standard frames
+        if metadata.get('TPE1'): set_frame('TPE1', TPE1(encoding=3, text=[metadata['TPE1']]))
+        if metadata.get('TPE2'): set_frame('TPE2', TPE2(encoding=3, text=[metadata['TPE2']]))
+        if metadata.get('TDRC'): set_frame('TDRC', TDRC(encoding=3, text=[metadata['TDRC']]))
+        if metadata.get('TRCK'): set_frame('TRCK', TRCK(encoding=3, text=[metadata['TRCK']]))
+        if metadata.get('TCON'): set_frame('TCON', TCON(encoding=3, text=[metadata['TCON']]))
+        if metadata.get('TPUB'): set_frame('TPUB', TPUB(encoding=3, text=[metadata['TPUB']]))
+        if metadata.get('TSSE'): set_frame('TSSE', TSSE(encoding=3, text=[metadata['TSSE']]))
+        if metadata.get('WXXX'):
+            id3.delall('WXXX')
+            id3.add(WXXX(encoding=3, desc='Author URL', url=metadata['WXXX']))
+        if metadata.get('TCOP'): set_frame('TCOP', TCOP(encoding=3, text=[metadata['TCOP']]))
+        if metadata.get('TALB'): set_frame('TALB', TALB(encoding=3, text=[metadata['TALB']]))
+        for desc in TXXX_DESCS:
+            key = f"TXXX:{desc}"
+            if metadata.get(key):
+                id3.delall(key)
+                id3.add(TXXX(encoding=3, desc=desc, text=[metadata[key]]))
+        if metadata.get('TCOM'): set_frame('TCOM', TCOM(encoding=3, text=[metadata['TCOM']]))
+        if metadata.get('TPE3'): set_frame('TPE3', TPE3(encoding=3, text=[metadata['TPE3']]))
+        # Embed cover art if provided
+        cover_bytes, cover_mime = cover
+        if cover_bytes and cover_mime:
+            id3.delall('APIC')
+            id3.add(APIC(encoding=3, mime=cover_mime, type=3, desc='Cover', data=cover_bytes))
+        return id3
+    def apply_meta(self, file_path, metadata, cover=(None, None), tag=None, timer=None, before_write=None):
+        """
+        Write `metadata` (and cover) into one file. Returns WRITE_IN_PLACE or
+        WRITE_REWRITE, or WRITE_SKIPPED if skip_unchanged is on and the file
+        already carries exactly these frames. `tag` is the file's already
+        parsed tag (read here if not given); it is merged in place. Stage
+        times are added to `timer` (a FileTimer) if given. before_write() is
+        called once the file is known to need writing (e.g. to back it up).
+        """
+        timer = timer or FileTimer()
+        ext = os.path.splitext(file_path)[1].lower()
+        v2_ver = self.config.v2_version
+        reserve = max(0, int(self.config.padding_reserve))
+        if tag is None:
+            with timer.stage('read'), self.io('data'):
+                tag = self.read_tag(file_path)
+        with timer.stage('build'):
+            if self._template is None:
+                self._template = TagTemplate(self.build_tag, metadata, v2_ver, self.cover_keep())
+            # Frames shared by the batch come pre-encoded; only `own` is built for this file
+            shared, shared_bytes, own = self._template.compile(metadata, cover)
+            if self.config.skip_unchanged and tag_matches(tag, {**shared, **dict(own.items())}, v2_ver):
+                return WRITE_SKIPPED
+            for key in shared:
+                tag.pop(key, None)
+            tag.update(own)
+        with timer.stage('serialize'):
+            frames = [shared_bytes, encode_frames(tag, v2_ver)]
+        tag.update(shared)
+        if before_write:
+            before_write()
+        rendered = []
+        def render(available):
+            t = time.perf_counter()
+            rendered.append(assemble_tag(frames, v2_ver, available, reserve))
+            serialize = time.perf_counter() - t
+            timer.add('serialize', serialize)
+            timer.add('write', -serialize) # counted inside the write stage below
+            return rendered[-1]
+        with timer.stage('write'), self.io('data'):
+            if ext == '.wav':
+                # Merge into the existing id3 chunk; only that chunk is rewritten
+                write = write_wav_id3(file_path, render)
+            else:
+                write = write_mp3_id3(file_path, render, MakeID3v1(tag))
+        # Optional verification: re-parse the bytes we serialized, or read the file back
+        if self.config.verify_writes:
+            with timer.stage('verify'):
+                if self.config.verify_readback:
+                    with self.io('data'):
+                        ok, msg = self.verify_file_tags(file_path, metadata)
+                else:
+                    ok, msg = verify_tag_bytes(rendered[-1], metadata)
+            if not ok:
+                raise ValueError(f"Verify failed: {msg}")
+        return write
+    def verify_file_tags(self, file_path, expected):
+        """Read file and confirm a subset of written tags match expected values."""
+        try:
+            ext = os.path.splitext(file_path)[1].lower()
+            if ext == '.wav':
+                tag = read_wav_tag(file_path)
+            else:
+                tag = ID3(file_path)
+            return verify_tag(tag, expected)
+        except Exception as e:
+            return False, f"verify exception: {e}"
+# Process-pool workers build one engine (and cover cache) each instead of pickling covers per job
+_PROCESS_ENGINE = None
+def _position(i, total):
+    return f"[{i}/{total}]" if total else f"[{i}]"
+def _process_init(config, cancel_event=None, shed=None):
+    global _PROCESS_ENGINE
+    if config.memory_profile != 'off' or config.memory_budget:
+        enable_memory_sampling(config.memory_profile == 'trace')
+    set_shed_signal(shed)
+    _PROCESS_ENGINE = TaggerEngine(config, cancel_event=cancel_event)
+    _PROCESS_ENGINE.prepare()
+def _process_shed():
+    if shed_requested():
+        _PROCESS_ENGINE.shed_caches()
+        gc.collect()
+def _process_tag(i, total, path):
+    _process_shed()
+    return _PROCESS_ENGINE.tag_file(i, total, path)
+def _process_shard(jobs, total):
+    results = []
+    for i, path, number in jobs:
+        if _PROCESS_ENGINE.cancelled():
+            break
+        _process_shed()
+        results.append(_PROCESS_ENGINE.tag_file(i, total, path, number))
+    return results
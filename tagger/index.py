@@ -0,0 +1,106 @@
+"""
+Persistent library index used instead of a full os.walk on every run.
+
+The index (SQLite) stores every known .mp3/.wav path with its sort key and,
+per directory, the mtime and subdirectory names seen at the last listing.
+A rescan still stats each directory, but only lists the ones whose mtime
+moved; unchanged directories reuse their stored entries. The sorted file
+order is read straight from an index on the sort key, so no in-memory sort
+is needed either.
+"""
+
+import os
+import json
+import time
+import sqlite3
+from .config import INDEX_PATH
+# Directory mtimes this close to "now" are not trusted: a file added within the
+# same timestamp tick would not change them (coarse SMB/FAT clocks)
+RACY_WINDOW_NS = 2 * 10**9
+class LibraryIndex:
+    def __init__(self, path=INDEX_PATH, exts=('.mp3', '.wav')):
+        self.path = path
+        self.exts = tuple(exts)
+        self.db = sqlite3.connect(path, timeout=30)
+        self.db.executescript(
+            "CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, mtime_ns INTEGER NOT NULL, subdirs TEXT NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, dir TEXT NOT NULL, sort_key TEXT NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS files_dir ON files (dir);"
+            "CREATE INDEX IF NOT EXISTS files_sort ON files (sort_key, path);")
+        # Counters of the last scan()
+        self.dirs_seen = 0
+        self.dirs_listed = 0
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        self.close()
+    def close(self):
+        self.db.close()
+    @staticmethod
+    def _prefix(root):
+        return root if root.endswith(os.sep) else root + os.sep
+    def _purge(self, d):
+        """Forget a directory and everything below it."""
+        lo = self._prefix(d)
+        hi = lo[:-1] + chr(ord(os.sep) + 1)
+        self.db.execute("DELETE FROM dirs WHERE path = ? OR (path >= ? AND path < ?)", (d, lo, hi))
+        self.db.execute("DELETE FROM files WHERE dir = ? OR (dir >= ? AND dir < ?)", (d, lo, hi))
+    def _list(self, d, mtime_ns, old_subdirs):
+        subdirs = []
+        audio = []
+        with os.scandir(d) as it:
+            for entry in it:
+                try:
+                    # Same rules as os.walk: symlinked dirs are listed but not followed
+                    if entry.is_dir():
+                        if not entry.is_symlink():
+                            subdirs.append(entry.name)
+                    elif os.path.splitext(entry.name)[1].lower() in self.exts:
+                        audio.append(entry.path)
+                except OSError:
+                    continue
+        for gone in set(old_subdirs) - set(subdirs):
+            self._purge(os.path.join(d, gone))
+        self.db.execute("DELETE FROM files WHERE dir = ?", (d,))
+        self.db.executemany("INSERT OR REPLACE INTO files (path, dir, sort_key) VALUES (?, ?, ?)",
+                            [(p, d, p.lower()) for p in audio])
+        if time.time_ns() - mtime_ns < RACY_WINDOW_NS:
+            mtime_ns = -1 # list again next time
+        self.db.execute("INSERT OR REPLACE INTO dirs (path, mtime_ns, subdirs) VALUES (?, ?, ?)",
+                        (d, mtime_ns, json.dumps(subdirs)))
+        return subdirs
+    def scan(self, root):
+        """Bring the index for `root` up to date, listing only changed directories."""
+        root = os.path.abspath(root)
+        self.dirs_seen = self.dirs_listed = 0
+        stack = [root]
+        with self.db:
+            while stack:
+                d = stack.pop()
+                try:
+                    mtime_ns = os.stat(d).st_mtime_ns
+                except OSError:
+                    self._purge(d)
+                    continue
+                self.dirs_seen += 1
+                row = self.db.execute("SELECT mtime_ns, subdirs FROM dirs WHERE path = ?", (d,)).fetchone()
+                if row and row[0] == mtime_ns:
+                    subdirs = json.loads(row[1])
+                else:
+                    try:
+                        subdirs = self._list(d, mtime_ns, json.loads(row[1]) if row else [])
+                    except OSError:
+                        self._purge(d)
+                        continue
+                    self.dirs_listed += 1
+                stack.extend(os.path.join(d, name) for name in subdirs)
+    def files(self, root):
+        """Indexed audio files under `root`, in case-insensitive path order and joined onto `root` as given (like the walk)."""
+        prefix = self._prefix(os.path.abspath(root))
+        lo, hi = prefix.lower(), prefix.lower()[:-1] + chr(ord(os.sep) + 1)
+        # The case-folded range orders the rows; the exact one leaves out sibling folders that differ only in case
+        exact_hi = prefix[:-1] + chr(ord(os.sep) + 1)
+        cur = self.db.execute("SELECT path FROM files WHERE sort_key >= ? AND sort_key < ? AND path >= ? AND path < ?"
+                              " ORDER BY sort_key, path", (lo, hi, prefix, exact_hi))
+        for (path,) in cur:
+            yield os.path.join(root, path[len(prefix):])
@@ -0,0 +1,180 @@
+"""
+Tag inventory: export what a library already carries, without tagging it.
+
+Only the tag region of each file is read: the ID3v2 header and frames at
+the start of an MP3, or the `id3 ` chunk of a WAV (found by seeking over
+the RIFF chunk headers). The audio is never touched, so a scan costs a few
+KB per file plus cover art. Files are parsed on a thread or process pool
+in batches, and rows are written in file order as CSV, JSON lines or an
+SQLite table: one row per file with every form field, the ID3 version,
+the number of APIC frames and the front cover's mime, size and SHA-1.
+"""
+
+import os
+import csv
+import json
+import time
+import hashlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from mutagen.id3 import ID3
+from .config import FIELDS
+from .tagio import read_mp3_id3, read_wav_id3
+# Files per job handed to a worker; amortizes scheduling (and pickling with processes)
+BATCH_SIZE = 256
+# Batches queued ahead per worker
+IN_FLIGHT_PER_WORKER = 2
+# Rows per SQLite transaction
+SQLITE_COMMIT_EVERY = 5000
+FORMATS = ('csv', 'jsonl', 'sqlite')
+COLUMNS = (['path', 'format', 'size', 'mtime', 'id3_version'] + [key for _, key in FIELDS]
+           + ['apic_count', 'apic_mime', 'apic_bytes', 'apic_sha1', 'tag_bytes', 'error'])
+INTEGER_COLUMNS = ('size', 'mtime', 'apic_count', 'apic_bytes', 'tag_bytes')
+def format_for(path):
+    """Export format for an output path, from its extension ('-' is JSON lines on stdout)."""
+    if path == '-':
+        return 'jsonl'
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.csv':
+        return 'csv'
+    if ext in ('.jsonl', '.json', '.ndjson'):
+        return 'jsonl'
+    if ext in ('.sqlite', '.sqlite3', '.db'):
+        return 'sqlite'
+    raise ValueError(f"unknown inventory format for {path!r}; use .csv, .jsonl or .sqlite")
+def field_text(tag, key):
+    """Text of one form field in a parsed tag ('' if absent); several values are joined with '; '."""
+    if key == 'WXXX':
+        frames = tag.getall('WXXX')
+        return frames[0].url if frames else ''
+    if key.startswith('TXXX:'):
+        frames = tag.getall(key)
+    else:
+        frame = tag.get(key)
+        frames = [frame] if frame is not None else []
+    if not frames or not getattr(frames[0], 'text', None):
+        return ''
+    return '; '.join(str(t) for t in frames[0].text)
+def inventory_row(path):
+    """Inventory row (dict over COLUMNS) for one file. Never raises; problems go to 'error'."""
+    row = dict.fromkeys(COLUMNS, '')
+    row.update(path=path, format=os.path.splitext(path)[1].lower().lstrip('.'), apic_count=0, tag_bytes=0)
+    try:
+        st = os.stat(path)
+        row.update(size=st.st_size, mtime=int(st.st_mtime))
+        data = read_wav_id3(path) if row['format'] == 'wav' else read_mp3_id3(path)
+        if not data:
+            return row
+        row['tag_bytes'] = len(data)
+        tag = ID3(BytesIO(data), load_v1=False)
+        row['id3_version'] = f"2.{tag.version[1]}"
+        for _, key in FIELDS:
+            row[key] = field_text(tag, key)
+        covers = tag.getall('APIC')
+        row['apic_count'] = len(covers)
+        if covers:
+            # Front cover (type 3) if there is one
+            cover = next((c for c in covers if int(c.type) == 3), covers[0])
+            row.update(apic_mime=cover.mime, apic_bytes=len(cover.data), apic_sha1=hashlib.sha1(cover.data).hexdigest())
+    except Exception as e:
+        row['error'] = f"{type(e).__name__} - {e}"
+    return row
+def inventory_batch(paths):
+    return [inventory_row(path) for path in paths]
+def inventory_rows(files, workers=1, executor='thread', cancelled=None):
+    """Yield an inventory row per file, in file order, parsing batches on `workers` workers."""
+    cancelled = cancelled or (lambda: False)
+    workers = max(1, int(workers or 1))
+    # Small trees still get split across every worker
+    size = max(1, min(BATCH_SIZE, -(-len(files) // (workers * IN_FLIGHT_PER_WORKER))))
+    batches = (files[i:i + size] for i in range(0, len(files), size))
+    if workers == 1:
+        for batch in batches:
+            if cancelled():
+                return
+            yield from inventory_batch(batch)
+        return
+    if executor == 'process':
+        from concurrent.futures import ProcessPoolExecutor
+        pool = ProcessPoolExecutor(workers)
+    else:
+        pool = ThreadPoolExecutor(workers, thread_name_prefix='inventory')
+    pending = deque()
+    try:
+        while True:
+            while len(pending) < workers * IN_FLIGHT_PER_WORKER and not cancelled():
+                batch = next(batches, None)
+                if batch is None:
+                    break
+                pending.append(pool.submit(inventory_batch, batch))
+            if not pending or cancelled():
+                return
+            yield from pending.popleft().result()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+class _CsvWriter:
+    def __init__(self, out):
+        self.writer = csv.DictWriter(out, COLUMNS)
+        self.writer.writeheader()
+    def write(self, row):
+        self.writer.writerow(row)
+    def close(self):
+        pass
+class _JsonlWriter:
+    def __init__(self, out):
+        self.out = out
+    def write(self, row):
+        self.out.write(json.dumps(row, ensure_ascii=False) + '\n')
+    def close(self):
+        pass
+class _SqliteWriter:
+    """Table `inventory` keyed by path; a re-export of the same files replaces their rows."""
+    def __init__(self, path):
+        import sqlite3
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        # Field keys such as "TXXX:Mood" need quoting as column names
+        quoted = [f'"{c}"' for c in COLUMNS]
+        types = ['TEXT PRIMARY KEY' if c == 'path' else 'INTEGER' if c in INTEGER_COLUMNS else 'TEXT' for c in COLUMNS]
+        self.db.execute(f"CREATE TABLE IF NOT EXISTS inventory ({', '.join(f'{q} {t}' for q, t in zip(quoted, types))})")
+        self.sql = f"INSERT OR REPLACE INTO inventory ({', '.join(quoted)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+        self._rows = []
+    def write(self, row):
+        self._rows.append(tuple(row[c] for c in COLUMNS))
+        if len(self._rows) >= SQLITE_COMMIT_EVERY:
+            self.flush()
+    def flush(self):
+        if self._rows:
+            self.db.executemany(self.sql, self._rows)
+            self.db.commit()
+            self._rows = []
+    def close(self):
+        self.flush()
+        self.db.close()
+def export_inventory(files, out, fmt, workers=1, executor='thread', log=None, cancelled=None):
+    """
+    Write the inventory of `files` to `out` (an open text stream for csv and
+    jsonl, a database path for sqlite). Returns (rows, files with a cover,
+    errors).
+    """
+    log = log or (lambda message: None)
+    writer = _SqliteWriter(out) if fmt == 'sqlite' else (_CsvWriter(out) if fmt == 'csv' else _JsonlWriter(out))
+    t0 = time.perf_counter()
+    rows = covers = errors = tag_bytes = 0
+    try:
+        for row in inventory_rows(files, workers, executor, cancelled):
+            writer.write(row)
+            rows += 1
+            covers += row['apic_count'] > 0
+            tag_bytes += row['tag_bytes']
+            if row['error']:
+                errors += 1
+                log(f"Error reading {os.path.basename(row['path'])}: {row['error']}")
+    finally:
+        writer.close()
+    secs = time.perf_counter() - t0
+    log(f"Inventory: {rows} files ({covers} with cover art, {errors} errors) in {secs:.2f}s, "
+        f"{rows / secs if secs else 0:.0f} files/s, {tag_bytes / 1e6:.1f} MB of tags read.")
+    return rows, covers, errors
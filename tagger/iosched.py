@@ -0,0 +1,236 @@
+"""
+Adaptive I/O concurrency for libraries on network mounts (NFS, SMB, NAS).
+
+On a network mount each file operation waits mostly on the filer, so one
+operation at a time leaves the link idle while a large fixed pool queues
+up on the filer and slows everyone down. IOScheduler keeps two separate
+limits, one for metadata operations (folder listings, stat) and one for
+data operations (tag reads, writes, replaces), and adjusts each from the
+latency and errors it measures:
+
+  - an operation runs only while fewer than `limit` of its kind are in
+    flight; the others wait for a slot;
+  - the baseline is what an operation costs when the filer is not
+    queueing: the first round, and every PROBE_EVERY rounds after it, is a
+    probe that runs MIN_ROUND operations one at a time, and the baseline
+    is the lowest mean latency of the last BASELINE_PROBES probes;
+  - every round of `limit` completions (at least MIN_ROUND) the limit is
+    revisited: a round with a load error (timeouts, EIO, ...) halves it, a
+    round whose mean latency is more than TOLERANCE times the baseline
+    backs off by a quarter, and a round that ran at the limit without
+    either raises it by one. Operations that started before a cut are not
+    judged again, so one burst of trouble cuts the limit once.
+
+The mean rather than the median is judged because a queueing filer does
+not slow every operation alike (some get through at once while others
+wait behind several), but whatever order it serves them in, the mean
+grows with the operations queued. The limit therefore settles between
+the filer's own concurrency and about TOLERANCE times it.
+
+Missing files and permission errors say nothing about load and are not
+counted. SimulatedFiler is a stand-in for a slow filer, so the controller
+can be tried on a local disk (--simulate-io).
+"""
+
+import time
+import errno
+import random
+import threading
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+KINDS = ('meta', 'data')
+# Limit every kind starts at (capped by the maximum)
+INITIAL_LIMIT = 4
+# Completions per round at the least, so low limits are not judged on one sample
+MIN_ROUND = 8
+# A round mean this many times the baseline means the filer is queueing
+TOLERANCE = 1.5
+# Rounds between baseline probes, and probes the baseline is the lowest of
+PROBE_EVERY = 50
+BASELINE_PROBES = 5
+# Errors that are about the file, not the filer's load
+_NOT_LOAD = (FileNotFoundError, PermissionError, IsADirectoryError, NotADirectoryError, FileExistsError)
+class AdaptiveLimit:
+    """How many operations of one kind may run at once (thread-safe)."""
+    def __init__(self, name, maximum=32, minimum=1):
+        self.name = name
+        self.minimum = max(1, int(minimum))
+        self.maximum = max(self.minimum, int(maximum))
+        self.limit = min(self.maximum, max(self.minimum, INITIAL_LIMIT))
+        self.inflight = 0
+        self.ops = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.waited = 0.0
+        self.low = self.high = self.limit
+        self._cond = threading.Condition()
+        self._round = []
+        self._round_errors = 0
+        self._round_peak = 0
+        # Bumped on every cut and probe; operations started before it are left out of the next rounds
+        self._generation = 0
+        # While probing, operations run one at a time (the minimum) to measure the baseline
+        self._probing = True
+        self._rounds = 0
+        self._baselines = deque(maxlen=BASELINE_PROBES)
+    def _cap(self):
+        return self.minimum if self._probing else self.limit
+    def acquire(self):
+        """Wait for a slot; returns a token for release()."""
+        with self._cond:
+            if self.inflight >= self._cap():
+                t0 = time.perf_counter()
+                while self.inflight >= self._cap():
+                    self._cond.wait()
+                self.waited += time.perf_counter() - t0
+            self.inflight += 1
+            self._round_peak = max(self._round_peak, self.inflight)
+            return self._generation
+    def release(self, token, seconds, error=False):
+        """End one operation that held its slot for `seconds`; `error` if it failed under load."""
+        with self._cond:
+            self.inflight -= 1
+            self.ops += 1
+            self.errors += error
+            self.seconds += seconds
+            if token == self._generation:
+                # A failure's latency (often instant) says nothing about queueing
+                if error:
+                    self._round_errors += 1
+                else:
+                    self._round.append(seconds)
+                if self._probing and len(self._round) + self._round_errors >= MIN_ROUND:
+                    self._end_probe()
+                elif not self._probing and len(self._round) + self._round_errors >= max(MIN_ROUND, self.limit):
+                    self._adjust()
+            self._cond.notify_all()
+    @property
+    def baseline(self):
+        """Mean latency in seconds with no queueing, or None before the first probe."""
+        return min(self._baselines) if self._baselines else None
+    def _end_probe(self):
+        if self._round:
+            self._baselines.append(sum(self._round) / len(self._round))
+        # A probe that only failed measured nothing: probe again
+        self._probing = not self._baselines
+        self._generation += 1
+        self._round, self._round_errors, self._round_peak = [], 0, self.inflight
+    def _adjust(self):
+        mean = sum(self._round) / len(self._round) if self._round else None
+        baseline = self.baseline
+        if self._round_errors:
+            limit = self.limit // 2
+        elif mean is not None and baseline is not None and mean > baseline * TOLERANCE:
+            limit = self.limit - max(1, self.limit // 4)
+        elif self._round_peak >= self.limit:
+            # Only grow while the demand is there to use it
+            limit = self.limit + 1
+        else:
+            limit = self.limit
+        limit = min(self.maximum, max(self.minimum, limit))
+        if limit < self.limit:
+            self._generation += 1
+        self.limit = limit
+        self.low, self.high = min(self.low, self.limit), max(self.high, self.limit)
+        self._round, self._round_errors, self._round_peak = [], 0, self.inflight
+        self._rounds += 1
+        if self._rounds % PROBE_EVERY == 0:
+            # Measure the baseline again: the filer's unloaded latency may have moved
+            self._probing = True
+            self._generation += 1
+    def summary(self):
+        mean = self.seconds / self.ops * 1000 if self.ops else 0.0
+        baseline = f" (baseline {self.baseline * 1000:.1f} ms)" if self.baseline is not None else ""
+        return (f"{self.name} limit {self.limit} (range {self.low}-{self.high}), {self.ops} ops, "
+                f"mean {mean:.1f} ms{baseline}, {self.waited:.2f}s waiting, {self.errors} errors")
+class SimulatedFiler:
+    """
+    Stand-in for a network filer, to try the controller on a local disk:
+    every operation first sleeps its kind's service time (with some jitter)
+    while holding one of `slots` service slots, so operations beyond `slots`
+    queue and their latency grows as on a busy NAS. Slots are handed out in
+    arrival order, like a filer's request queue. With `overload` > 0, an
+    operation that finds more than that many others queued fails with EIO.
+    """
+    def __init__(self, meta_ms=2.0, data_ms=10.0, slots=8, overload=0):
+        self.service = {'meta': meta_ms / 1000, 'data': data_ms / 1000}
+        self.overload = int(overload)
+        self.slots = max(1, int(slots))
+        self._cond = threading.Condition()
+        self._queued = 0
+        self._busy = 0
+        # Tickets: the next one to hand out and the next one to serve
+        self._next_ticket = 0
+        self._turn = 0
+    @classmethod
+    def from_spec(cls, spec):
+        """From "META_MS,DATA_MS[,SLOTS[,OVERLOAD]]", e.g. "2,15,8"."""
+        parts = [p.strip() for p in str(spec).split(',')]
+        if not 2 <= len(parts) <= 4:
+            raise ValueError(f"bad I/O simulation {spec!r}; expected META_MS,DATA_MS[,SLOTS[,OVERLOAD]]")
+        meta_ms, data_ms = float(parts[0]), float(parts[1])
+        return cls(meta_ms, data_ms, *(int(p) for p in parts[2:]))
+    def serve(self, kind):
+        with self._cond:
+            if self.overload and self._queued >= self.overload:
+                raise OSError(errno.EIO, "simulated filer overload")
+            self._queued += 1
+            ticket = self._next_ticket
+            self._next_ticket += 1
+            while ticket != self._turn or self._busy >= self.slots:
+                self._cond.wait()
+            self._turn += 1
+            self._busy += 1
+            # The next ticket may be served too if a slot is still free
+            self._cond.notify_all()
+        try:
+            time.sleep(self.service[kind] * random.uniform(0.8, 1.2))
+        finally:
+            with self._cond:
+                self._busy -= 1
+                self._queued -= 1
+                self._cond.notify_all()
+class IOScheduler:
+    """
+    Separate adaptive limits for metadata and data operations, each between
+    1 and `maximum`. Wrap each file operation in op(kind); the scheduler
+    also owns the thread pool that lists folders ahead of a walk.
+    """
+    def __init__(self, maximum=32, filer=None):
+        self.maximum = max(1, int(maximum))
+        self.limits = {'meta': AdaptiveLimit('metadata', self.maximum), 'data': AdaptiveLimit('data', self.maximum)}
+        self.filer = filer
+        self._pool = None
+        self._pool_lock = threading.Lock()
+    @contextmanager
+    def op(self, kind):
+        limit = self.limits[kind]
+        token = limit.acquire()
+        t0 = time.perf_counter()
+        error = False
+        try:
+            if self.filer:
+                self.filer.serve(kind)
+            yield
+        except OSError as e:
+            error = not isinstance(e, _NOT_LOAD)
+            raise
+        finally:
+            limit.release(token, time.perf_counter() - t0, error)
+    def submit(self, kind, fn, *args):
+        """Run fn(*args) as one `kind` operation on the scheduler's pool; returns a Future."""
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(self.maximum, thread_name_prefix='io')
+        return self._pool.submit(self._call, kind, fn, args)
+    def _call(self, kind, fn, args):
+        with self.op(kind):
+            return fn(*args)
+    def summary(self):
+        return "I/O: " + "; ".join(self.limits[kind].summary() for kind in KINDS) + "."
+    def close(self):
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool:
+            pool.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,431 @@
+"""
+Job queue: many (folder or file, profile) pairs tagged as one batch.
+
+A job list has one job per line, either JSON ({"target": ..., "profile":
+..., "priority": n}) or tab-separated "target<TAB>profile[<TAB>priority]".
+Blank lines and lines starting with '#' are skipped, and relative paths
+are taken from the list's folder. A job's profile gives its tag fields and
+tagging options; the run's own options (RUN_OPTIONS: pool, I/O, journal,
+manifest, backups, reports, memory) come from the base config whatever the profile
+says. `overrides` (e.g. the options given on the command line) are applied
+over every job's profile. A job without a profile tags with the base
+config as it is.
+
+Jobs run highest priority first (list order among equals) through one
+shared worker pool that never drains between jobs: while one job's files
+are tagged, the next jobs are set up on a background thread (profile
+applied, folder scanned, tracks numbered). Each profile is parsed once,
+jobs with the same fields share one compiled tag template, and covers are
+processed once per image across every job. Progress, the log and the
+timing report cover the whole queue, with one report entry per job. With
+a journal, a rerun after an interruption skips the jobs that finished.
+"""
+
+import gc
+import os
+import json
+import time
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from .config import TagConfig
+from .covers import KEEP_COVERS, CoverStore
+from .engine import RunStats, TaggerEngine
+from .journal import Journal, journal_file, run_key
+from .manifest import Manifest
+from .memory import enable as enable_memory_sampling, set_shed_signal, shed_requested
+from .timing import RunTimer
+# Files per task on a process pool; each task carries its job's config once
+PROCESS_CHUNK = 16
+# Job engines a process worker keeps prepared
+PROCESS_ENGINES = 8
+# Options of the whole run, always taken from the base config; they do not key the journal either
+RUN_OPTIONS = ('workers', 'executor', 'adaptive_io', 'io_max', 'io_simulate', 'log_file', 'journal_dir', 'resume',
+               'manifest_path', 'index_path', 'backup', 'backup_dir', 'report_json', 'report_prom', 'memory_profile', 'memory_budget')
+@dataclass
+class Job:
+    """One line of a job list; the run fills in the rest."""
+    number: int
+    target: str
+    profile: str = ''
+    priority: int = 0
+    error: str = ''
+    engine: object = None
+    files: object = None
+    stats: RunStats = field(default_factory=RunStats)
+    released: int = 0
+    # Setup time (profile, scan, numbering), counted as the scan stage
+    setup_seconds: float = 0.0
+    started: float = 0.0
+    seconds: float = 0.0
+    finished: bool = False
+    # Log lines from before the job's results start, written when they do
+    notes: list = field(default_factory=list)
+    def report(self):
+        s = self.stats
+        return {'job': self.number, 'target': self.target, 'profile': self.profile, 'priority': self.priority,
+                'files': s.total, 'tagged': s.tagged, 'skipped': s.skipped, 'failed': s.failed,
+                'in_place': s.in_place, 'rewrites': s.rewrites, 'seconds': round(self.seconds, 6), 'error': self.error}
+def load_jobs(path):
+    """Jobs of a job list file, in list order. Raises ValueError on a malformed line."""
+    base = os.path.dirname(os.path.abspath(path))
+    def resolve(p):
+        p = str(p or '').strip()
+        return os.path.join(base, os.path.expanduser(p)) if p else ''
+    jobs = []
+    with open(path, encoding='utf-8') as f:
+        for n, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            try:
+                if line.startswith('{'):
+                    entry = json.loads(line)
+                    target, profile, priority = entry['target'], entry.get('profile'), entry.get('priority', 0)
+                else:
+                    parts = line.split('\t')
+                    if len(parts) > 3:
+                        raise ValueError("expected target<TAB>profile[<TAB>priority]")
+                    target, profile, priority = (parts + ['', 0])[:3]
+                job = Job(len(jobs) + 1, resolve(target), resolve(profile), int(priority or 0))
+            except (ValueError, KeyError, TypeError) as e:
+                raise ValueError(f"{path}, line {n}: {type(e).__name__} - {e}") from None
+            if not job.target:
+                raise ValueError(f"{path}, line {n}: no target")
+            jobs.append(job)
+    return jobs
+def _done(value):
+    fut = Future()
+    fut.set_result(value)
+    return fut
+class JobQueue:
+    """
+    Runs a list of Jobs on one worker pool. `config` is the base config,
+    `overrides` ({'fields': {...}, option: value}) is laid over each job's
+    profile and `source` names the list (e.g. its path) in backup runs. log, progress
+    and cancel_event work as for TaggerEngine; the progress total is 0
+    until every job has been scanned.
+    """
+    def __init__(self, config, jobs, log=None, progress=None, cancel_event=None, source='', overrides=None):
+        self.config = config
+        self.jobs = jobs
+        self.source = source
+        self.overrides = overrides or {}
+        self.log = log or (lambda message: None)
+        self.progress = progress or (lambda done, total: None)
+        self.cancel_event = cancel_event
+        self.timer = None
+        self.failed_jobs = 0
+        self._profiles = {}
+        self._profile_lock = threading.Lock()
+        self._notes_lock = threading.Lock()
+        self._templates = {}
+        self._manifests = {}
+        self._backup_runs = {}
+        # Engine over the base config: adaptive I/O scheduler and pool size for the whole queue
+        self._base = TaggerEngine(config, log=self.log, cancel_event=cancel_event)
+        # Shared by every job engine; jobs overlap on the pool, so a folder per worker is kept on top
+        self._cover_store = CoverStore(KEEP_COVERS + self._base.pool_size())
+    def cancelled(self):
+        return self._base.cancelled()
+    def profile(self, path):
+        """Parsed profile JSON, read once per path."""
+        with self._profile_lock:
+            data = self._profiles.get(path)
+            if data is None:
+                with open(path, encoding='utf-8') as f:
+                    data = self._profiles[path] = json.load(f)
+            return data
+    def job_config(self, job):
+        """The base config with the job's profile (fields and options) and target applied."""
+        cfg = self.config.copy()
+        if job.profile:
+            cfg.fields = {}
+            cfg = TagConfig.from_profile(self.profile(job.profile), base=cfg)
+            for name in RUN_OPTIONS:
+                setattr(cfg, name, getattr(self.config, name))
+            for name, value in self.overrides.items():
+                if name == 'fields':
+                    cfg.fields.update(value)
+                else:
+                    setattr(cfg, name, value)
+            cfg.normalize()
+        if os.path.isfile(job.target):
+            cfg.single_mode, cfg.single_path = True, job.target
+        elif os.path.isdir(job.target):
+            cfg.single_mode, cfg.folder = False, job.target
+        else:
+            raise ValueError(f"no such folder or file: {job.target}")
+        # The queue keeps one journal and one report for the whole run
+        cfg.journal_dir = cfg.report_json = cfg.report_prom = ''
+        return cfg
+    def setup(self, job):
+        """Build the job's engine and file list (setup thread). Never raises; problems go to job.error."""
+        if self.cancelled():
+            return job
+        t0 = time.perf_counter()
+        try:
+            engine = TaggerEngine(self.job_config(job), log=self._job_log(job), cancel_event=self.cancel_event)
+            engine.cover_store, engine.templates, engine._io = self._cover_store, self._templates, self._base._io
+            files = engine.gather_files()
+            engine.prepare()
+            engine.number_albums(files)
+            job.engine, job.files = engine, files
+        except Exception as e:
+            job.error = f"{type(e).__name__} - {e}"
+        job.setup_seconds = time.perf_counter() - t0
+        return job
+    def _job_log(self, job):
+        """Log for a job's engine: held back until the job's results start, so its lines stay together."""
+        def log(message):
+            with self._notes_lock:
+                if not job.started:
+                    job.notes.append(message)
+                    return
+            self.log(message)
+        return log
+    def open_journal(self):
+        """(journal or None, numbers of the jobs an interrupted run finished)."""
+        cfg = self.config
+        if not cfg.journal_dir:
+            return None, set()
+        def profile_or_none(path):
+            try:
+                return self.profile(path) if path else None
+            except (OSError, ValueError):
+                return None
+        base = cfg.to_profile()
+        base['__options__'] = {k: v for k, v in base['__options__'].items()
+                               if k not in RUN_OPTIONS + ('last_folder', 'last_file')}
+        settings = ['queue', base, [(job.priority, profile_or_none(job.profile)) for job in self.jobs]]
+        jobs = [f"{job.target}\t{job.profile}" for job in self.jobs]
+        # A job list has its own journal: editing it leaves the old one to expire
+        journal = Journal(journal_file(cfg.journal_dir, settings + [jobs]), run_key(settings, jobs), len(self.jobs))
+        try:
+            journal.begin(resume=cfg.resume)
+        except OSError as e:
+            self.log(f"Error opening journal {journal.path}: {type(e).__name__} - {e}; running without resume.")
+            return None, set()
+        return journal, set(journal.completed)
+    def _manifest(self, cfg):
+        if not (cfg.skip_unchanged and cfg.manifest_path):
+            return None
+        if cfg.manifest_path not in self._manifests:
+            self._manifests[cfg.manifest_path] = Manifest(cfg.manifest_path)
+        return self._manifests[cfg.manifest_path]
+    def _backup_run(self, engine):
+        store = engine._backup
+        run = self._backup_runs.get(store.root)
+        if run is None:
+            run = self._backup_runs[store.root] = store.open_run(self.source or engine.config.target)
+        return run
+    def _items(self, setups, pool, process):
+        """
+        (kind, job, future) in release order: a 'start' and an 'end' around
+        each job's 'files' (a FileResult or a list of them). Runs on the
+        main thread, so a job's manifest checks happen there.
+        """
+        for setup in setups:
+            job = setup.result()
+            yield 'start', job, _done(None)
+            engine, files = job.engine, job.files
+            if engine is not None:
+                engine._manifest = self._manifest(engine.config)
+                total = len(files)
+                chunk = []
+                for i, path in enumerate(files, start=1):
+                    res = engine._precheck(i, total, path)
+                    if res:
+                        yield 'files', job, _done(res)
+                    elif not process:
+                        yield 'files', job, pool.submit(engine.tag_file, i, total, path)
+                    else:
+                        chunk.append((i, path, engine.number_for(i, total)))
+                        if len(chunk) == PROCESS_CHUNK:
+                            yield 'files', job, pool.submit(_process_chunk, job.number, engine.config, total, chunk)
+                            chunk = []
+                if chunk:
+                    yield 'files', job, pool.submit(_process_chunk, job.number, engine.config, total, chunk)
+            yield 'end', job, _done(None)
+    def run(self):
+        self._base.open_io()
+        self._base.open_memory()
+        try:
+            return self._run()
+        finally:
+            self._base.close_io()
+            self._base.close_memory()
+    def _run(self):
+        cfg = self.config
+        stats = RunStats()
+        timer = self.timer = RunTimer()
+        journal, finished = self.open_journal()
+        todo = sorted((job for job in self.jobs if job.number not in finished), key=lambda job: (-job.priority, job.number))
+        if finished:
+            self.log(f"Job queue: resuming; {len(finished)} of {len(self.jobs)} jobs were finished by an interrupted run.")
+        self.log(f"Job queue: {len(todo)} jobs, highest priority first.")
+        workers = self._base.pool_size()
+        process = cfg.executor == 'process' and workers > 1 and not self._base._io
+        if process:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            ctx = multiprocessing.get_context()
+            pool = ProcessPoolExecutor(workers, mp_context=ctx, initializer=set_shed_signal, initargs=(self._base.worker_signal(ctx),))
+        else:
+            pool = ThreadPoolExecutor(workers, thread_name_prefix='tagger')
+        setup_pool = ThreadPoolExecutor(1, thread_name_prefix='job-setup')
+        setups = [setup_pool.submit(self.setup, job) for job in todo]
+        items = self._items(setups, pool, process)
+        pending = deque()
+        done = total = scanned = started = 0
+        try:
+            while True:
+                while len(pending) < self._base.in_flight(workers) and not self.cancelled():
+                    item = next(items, None)
+                    if item is None:
+                        break
+                    pending.append(item)
+                if self.cancelled():
+                    for _, _, fut in pending:
+                        fut.cancel()
+                if not pending:
+                    break
+                kind, job, fut = pending.popleft()
+                if fut.cancelled():
+                    continue
+                if kind == 'start':
+                    started += 1
+                    self._start(job, started, len(todo))
+                elif kind == 'end':
+                    self._finish(job, journal)
+                else:
+                    results = fut.result()
+                    for res in results if isinstance(results, list) else [results]:
+                        done += 1
+                        self._release(job, res, stats)
+                # Setups finish in order; the total is known once the last job is scanned
+                while scanned < len(setups) and setups[scanned].done():
+                    scanned += 1
+                if scanned == len(setups) and not total:
+                    total = sum(len(job.files) for job in todo if job.files is not None)
+                self.progress(done, total)
+        finally:
+            items.close()
+            setup_pool.shutdown(wait=True, cancel_futures=True)
+            pool.shutdown(wait=True, cancel_futures=True)
+            for manifest in self._manifests.values():
+                manifest.close()
+            for run in self._backup_runs.values():
+                run.close()
+            if journal:
+                journal.close(complete=all(job.finished for job in todo))
+        stats.total = sum(len(job.files) for job in todo if job.files is not None)
+        finished_now = sum(job.finished for job in todo)
+        if self.cancelled():
+            self.log(f"Cancelled by user. {len(todo) - finished_now - self.failed_jobs} jobs not finished.")
+            stats.cancelled = True
+        failed = f", {self.failed_jobs} could not run" if self.failed_jobs else ""
+        self.log(f"Job queue: {finished_now} of {len(todo)} jobs finished{failed}.")
+        for run in self._backup_runs.values():
+            if run.files:
+                self.log(f"Backup: run {run.id} holds the original tags of {run.files} files; undo it with --restore {run.id}.")
+        if stats.tagged or stats.skipped:
+            self.log(f"Writes: {stats.in_place} in place, {stats.rewrites} full rewrites, {stats.skipped} unchanged.")
+        self._base.close_io()
+        timer.finish()
+        self.log(timer.summary())
+        self._base.close_memory()
+        self.write_reports(stats, todo)
+        return stats
+    def _start(self, job, n, count):
+        what = os.path.basename(job.profile) if job.profile else 'no profile'
+        if job.files is not None:
+            what += f", {len(job.files)} files"
+        self.log(f"Job {n}/{count}: {job.target} ({what}).")
+        self.timer.add('scan', job.setup_seconds)
+        with self._notes_lock:
+            job.started = time.perf_counter()
+            notes, job.notes = job.notes, []
+        for note in notes:
+            self.log(note)
+        if job.error:
+            self.failed_jobs += 1
+            self.log(f"Error in job {n}: {job.error}")
+    def _release(self, job, res, stats):
+        engine = job.engine
+        job.released += 1
+        job.stats.count(res)
+        stats.count(res)
+        if res.backup:
+            self._backup_run(engine).add(res.backup)
+        self.log(res.message)
+        if res.timings is not None:
+            self.timer.add_file(res.timings, res.seconds)
+        if self._base.memory:
+            self._base.check_memory(res, self.shed_caches)
+        if res.ok and engine._manifest:
+            with engine.io('meta'):
+                engine._manifest.record(res.path, engine.file_signature(res.index, len(job.files), res.path))
+    def shed_caches(self):
+        """Drop the processed covers and encoded cover frames of every job."""
+        for job in self.jobs:
+            if job.engine is not None:
+                job.engine.shed_caches()
+        self._cover_store.clear()
+        for template in list(self._templates.values()):
+            template.clear_covers()
+    def _finish(self, job, journal):
+        job.seconds = time.perf_counter() - job.started
+        if job.files is None:
+            # Not recorded: a rerun tries it again once its profile or folder is fixed
+            return
+        job.stats.total = len(job.files)
+        if job.released < len(job.files):
+            return # cancelled part way
+        job.finished = True
+        s = job.stats
+        if journal:
+            journal.record(job.number, not s.failed)
+        failed = f", {s.failed} failed" if s.failed else ""
+        self.log(f"Job done: {job.target} ({s.tagged} tagged, {s.skipped} unchanged{failed}; {job.seconds:.1f}s).")
+        # The job's per-file state is no longer needed
+        job.engine = None
+    def write_reports(self, stats, jobs):
+        """The configured timing reports for the whole queue; the JSON one lists every job."""
+        cfg = self.config
+        extra = {'jobs': [job.report() for job in jobs]}
+        if self._base.memory and self._base.memory.profile:
+            extra['memory'] = self._base.memory.to_dict()
+        for path, write in ((cfg.report_json, lambda path: self.timer.write_json(path, stats, extra)),
+                            (cfg.report_prom, lambda path: self.timer.write_prometheus(path, stats))):
+            if path:
+                try:
+                    write(path)
+                except OSError as e:
+                    self.log(f"Error writing report {path}: {type(e).__name__} - {e}")
+# Process-pool workers keep the engines of recent jobs, sharing covers and templates among them
+_JOB_ENGINES = OrderedDict()
+_COVER_STORE = CoverStore()
+_TEMPLATES = {}
+def _process_chunk(number, config, total, chunk):
+    if shed_requested():
+        for engine in _JOB_ENGINES.values():
+            engine.shed_caches()
+        _COVER_STORE.clear()
+        for template in _TEMPLATES.values():
+            template.clear_covers()
+        gc.collect()
+    engine = _JOB_ENGINES.get(number)
+    if engine is None:
+        engine = TaggerEngine(config)
+        engine.cover_store, engine.templates = _COVER_STORE, _TEMPLATES
+        if config.memory_profile != 'off' or config.memory_budget:
+            enable_memory_sampling(config.memory_profile == 'trace')
+        engine.prepare()
+        _JOB_ENGINES[number] = engine
+        if len(_JOB_ENGINES) > PROCESS_ENGINES:
+            _JOB_ENGINES.popitem(last=False)
+    else:
+        _JOB_ENGINES.move_to_end(number)
+    return [engine.tag_file(i, total, path, position) for i, path, position in chunk]
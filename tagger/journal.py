@@ -0,0 +1,188 @@
+"""
+Checkpoint journal for resuming interrupted batch runs.
+
+The journal is an append-only text file: a JSON header naming the run (a
+key over the settings that decide what gets written and the exact ordered
+file list), then one "index<TAB>ok" line per finished file. In a normal run
+results are released in file order, so the committed files are a prefix of
+the list and a run with the same key starts right after the last line; in
+album mode files finish out of order and a resumed run skips every index
+listed. A run that tags while its folder is still being scanned cannot key
+on the file list, so each of its lines also carries a digest of the list up
+to that file; the resumed scan must reproduce it before the prefix is
+skipped. A torn last line from a crash is ignored. A run that completes
+removes its journal; a new run with a different key starts it over.
+
+Each run target and its settings get their own journal file in the
+journal directory (journal_file()), so an interrupted run keeps its resume
+point while other folders are tagged. A run holds an exclusive lock on its
+journal while it runs; a second run that finds it locked gets JournalBusy
+and runs without resume instead of truncating the first run's lines.
+Journals left behind for STALE_DAYS are removed.
+"""
+
+import os
+import json
+import time
+import hashlib
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+# Entries written between fsyncs
+FSYNC_EVERY = 100
+# Journals of interrupted runs nobody resumed are removed after this many days
+STALE_DAYS = 30
+class JournalBusy(OSError):
+    """Another run is using this journal."""
+def journal_file(directory, identity):
+    """Journal path in `directory` for runs of the same target and settings (`identity`, any JSON-able value)."""
+    name = hashlib.sha1(json.dumps(identity, sort_keys=True).encode('utf-8')).hexdigest()[:20]
+    return os.path.join(directory, name + '.log')
+def _lock(f):
+    try:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        raise JournalBusy("in use by another run") from None
+def remove_stale(directory, days=STALE_DAYS):
+    """Delete journals not written to for `days` days."""
+    cutoff = time.time() - days * 86400
+    try:
+        names = [name for name in os.listdir(directory) if name.endswith('.log')]
+    except OSError:
+        return
+    for name in names:
+        path = os.path.join(directory, name)
+        try:
+            if os.stat(path).st_mtime < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+def run_key(settings, files):
+    """Identifies a run by its settings (any JSON-able value) and ordered file list."""
+    h = hashlib.sha1(json.dumps(settings, sort_keys=True).encode('utf-8'))
+    for path in files:
+        h.update(path.encode('utf-8', 'surrogateescape') + b'\0')
+    return h.hexdigest()
+class Journal:
+    """One run's journal at `path` (see journal_file()); begin() locks and reads it."""
+    def __init__(self, path, key, total):
+        self.path = path
+        self.key = key
+        self.total = total
+        # Indexes committed by an earlier run with this key, and how many of them failed
+        self.completed = set()
+        self.failed = 0
+        # Digest recorded with the highest index (streamed runs)
+        self.last_digest = ''
+        self._f = None
+        self._unsynced = 0
+    def _load(self):
+        try:
+            self._f.seek(0)
+            header = json.loads(self._f.readline() or 'null')
+            if not isinstance(header, dict) or header.get('key') != self.key:
+                return
+            top = 0
+            for line in self._f:
+                parts = line.rstrip('\n').split('\t')
+                if not line.endswith('\n') or len(parts) not in (2, 3) or not parts[0].isdigit():
+                    break
+                index = int(parts[0])
+                self.completed.add(index)
+                self.failed += parts[1] == '0'
+                if index > top:
+                    top, self.last_digest = index, parts[2] if len(parts) == 3 else ''
+        except (OSError, ValueError):
+            self.completed, self.failed, self.last_digest = set(), 0, ''
+    @property
+    def done(self):
+        """Length of the committed prefix: files 1..done are finished."""
+        n = 0
+        while n + 1 in self.completed:
+            n += 1
+        return n
+    def begin(self, resume=True):
+        """
+        Lock the journal and read what an earlier run with this key recorded;
+        without `resume` (or nothing to resume) it starts over. Raises
+        JournalBusy if another run holds it.
+        """
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            remove_stale(directory)
+        while True:
+            # 'a+' leaves the lines of a run holding the lock alone
+            f = open(self.path, 'a+', encoding='utf-8')
+            try:
+                _lock(f)
+                if os.path.samestat(os.fstat(f.fileno()), os.stat(self.path)):
+                    break
+            except FileNotFoundError:
+                pass
+            except OSError:
+                f.close()
+                raise
+            # A completed run removed the file between our open and lock: open it again
+            f.close()
+        self._f = f
+        if resume:
+            self._load()
+        if not (resume and self.completed):
+            self.restart()
+        else:
+            self._f.seek(0, 2)
+    def restart(self):
+        """Drop what an earlier run recorded and start the journal over (the lock is kept)."""
+        self.completed, self.failed, self.last_digest = set(), 0, ''
+        self._f.seek(0)
+        self._f.truncate()
+        self._f.write(json.dumps({'key': self.key, 'total': self.total}) + '\n')
+        self._sync()
+    def record(self, index, ok, digest=''):
+        self._f.write(f"{index}\t{1 if ok else 0}" + (f"\t{digest}\n" if digest else "\n"))
+        self._f.flush()
+        self._unsynced += 1
+        if self._unsynced >= FSYNC_EVERY:
+            self._sync()
+    def _sync(self):
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        self._unsynced = 0
+    def close(self, complete=False):
+        """Close the journal; a complete run has nothing left to resume, so its journal is removed."""
+        if not self._f:
+            return
+        self._sync()
+        if complete and fcntl:
+            # Under the lock, so another run cannot start on the file being removed
+            self._remove()
+        self._f.close()
+        self._f = None
+        if complete and not fcntl:
+            # Windows cannot remove an open file
+            self._remove()
+    def _remove(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+def remove_stale_temps(files):
+    """Delete leftover '<file>.tmp' copies from an interrupted rewrite. Returns how many were removed."""
+    removed = 0
+    for path in files:
+        temp_path = path + '.tmp'
+        if os.path.isfile(temp_path):
+            try:
+                os.remove(temp_path)
+                removed += 1
+            except OSError:
+                pass
+    return removed
@@ -0,0 +1,49 @@
+"""
+Tag manifest for skip-unchanged runs.
+
+Remembers, per file, the (size, mtime) it had right after we last wrote or
+confirmed its tags, together with a signature of the tags we wanted. If a
+later run wants the same tags and the file's size and mtime have not moved,
+the file is skipped without being opened at all.
+"""
+
+import os
+import sqlite3
+from .config import MANIFEST_PATH
+# Rows buffered before a commit
+FLUSH_EVERY = 500
+class Manifest:
+    def __init__(self, path=MANIFEST_PATH):
+        self.path = path
+        self.db = sqlite3.connect(path, timeout=30)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            " path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, sig TEXT NOT NULL)")
+        self._pending = []
+    @staticmethod
+    def _key(path):
+        return os.path.abspath(path)
+    def unchanged(self, path, sig):
+        """True if `path` still has the size/mtime recorded with this signature."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        row = self.db.execute("SELECT size, mtime_ns, sig FROM files WHERE path = ?", (self._key(path),)).fetchone()
+        return row == (st.st_size, st.st_mtime_ns, sig)
+    def record(self, path, sig):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return
+        self._pending.append((self._key(path), st.st_size, st.st_mtime_ns, sig))
+        if len(self._pending) >= FLUSH_EVERY:
+            self.flush()
+    def flush(self):
+        if self._pending:
+            self.db.executemany("INSERT OR REPLACE INTO files (path, size, mtime_ns, sig) VALUES (?, ?, ?, ?)", self._pending)
+            self.db.commit()
+            self._pending = []
+    def close(self):
+        self.flush()
+        self.db.close()
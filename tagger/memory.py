@@ -0,0 +1,258 @@
+"""
+Memory watch for tagging runs: where the memory goes, and a budget to keep to.
+
+With memory profiling on, every file's FileTimer samples its process's
+resident size (RSS) at the end of each stage, and with 'trace' also the
+Python heap's peak since the previous sample (tracemalloc). The samples
+travel back in the FileResult, so process workers report too, and a
+MemoryMonitor in the main process folds them into the peak per stage and
+per file type, plus the files whose processing grew memory the most. With
+several files in flight one sample covers all of them, so these figures
+are upper bounds; a single worker gives exact ones.
+
+With a budget (memory_budget, MB) the monitor also samples the process on
+a background thread every SAMPLE_SECONDS and adds the last RSS reported by
+each worker process. Once the total passes HIGH_WATER of the budget the
+engine tags one file at a time and drops its caches of processed covers
+after every file (worker processes drop theirs when the shared counter
+from worker_signal() moves) until memory is back under LOW_WATER, instead
+of growing until the system kills the run.
+"""
+
+import os
+import heapq
+import threading
+import tracemalloc
+from contextlib import contextmanager
+MB = 1024 * 1024
+SAMPLE_SECONDS = 0.05
+# Fractions of the budget where throttling starts and stops
+HIGH_WATER = 0.9
+LOW_WATER = 0.75
+# Files listed as the largest
+TOP_FILES = 10
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+# Whether FileTimers of this process take samples; set by enable()
+_enabled = False
+_started_tracing = False
+# Worker processes: the main process's shed counter and the last value acted on
+_shed = None
+_shed_seen = 0
+def rss_bytes():
+    """Resident size of this process in bytes, or None where it cannot be read."""
+    try:
+        with open('/proc/self/statm', 'rb') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        # Optional: other systems need psutil for the current RSS
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss
+def enable(trace=False):
+    """Let this process's FileTimers sample memory; `trace` also starts tracemalloc."""
+    global _enabled, _started_tracing
+    if trace and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _started_tracing = True
+    _enabled = True
+def disable():
+    global _enabled, _started_tracing
+    if _started_tracing:
+        tracemalloc.stop()
+        _started_tracing = False
+    _enabled = False
+def enabled():
+    return _enabled
+def set_shed_signal(value):
+    """In a worker process: watch `value` (MemoryMonitor.worker_signal()) from now on."""
+    global _shed, _shed_seen
+    _shed, _shed_seen = value, value.value if value is not None else 0
+def shed_requested():
+    """In a worker process: True once every time the main process asks for caches to be dropped."""
+    global _shed_seen
+    if _shed is None or _shed.value == _shed_seen:
+        return False
+    _shed_seen = _shed.value
+    return True
+def baseline():
+    """(RSS, current heap) before a file's first stage; heap is None unless tracing."""
+    return rss_bytes(), tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
+def sample():
+    """(RSS, heap peak since the previous sample) at the end of a stage; heap is None unless tracing."""
+    heap = None
+    if tracemalloc.is_tracing():
+        heap = tracemalloc.get_traced_memory()[1]
+        tracemalloc.reset_peak()
+    return rss_bytes(), heap
+def _max(a, b):
+    return b if a is None else a if b is None else max(a, b)
+def record(stages, name):
+    """Take a sample() and keep the peaks of stage `name` in `stages` ({stage: (RSS, heap)})."""
+    rss, heap = sample()
+    old_rss, old_heap = stages.get(name, (None, None))
+    stages[name] = (_max(old_rss, rss), _max(old_heap, heap))
+def _mb(n):
+    return f"{n / MB:.1f} MB"
+class MemoryMonitor:
+    """
+    Peaks of one run, from the FileTimer samples passed to add_file() (main
+    thread), and the budget check. `budget_mb` 0 means no budget; `trace`
+    runs tracemalloc (slower, but sees the Python heap per stage).
+    """
+    def __init__(self, budget_mb=0, profile=True, trace=False):
+        self.budget = max(0, int(budget_mb or 0)) * MB
+        self.profile = profile
+        self.trace = trace
+        self.peak_rss = None
+        self.peak_heap = None
+        # Most in use at once, worker processes included
+        self.peak_used = 0
+        # stage -> [peak RSS, peak heap]; file type -> [peak RSS, peak heap, files, largest growth]
+        self.stages = {}
+        self.types = {}
+        self._largest = []
+        self._workers = {}
+        self._used = 0
+        self.over = False
+        self.throttled = 0
+        self._changed = False
+        self._lock = threading.Lock()
+        # Held by the one file allowed to run while over budget (album threads)
+        self._gate = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._signal = None
+        self.running = False
+    def start(self):
+        enable(self.trace)
+        self.running = True
+        if self.budget:
+            self._thread = threading.Thread(target=self._sampler, name='memory', daemon=True)
+            self._thread.start()
+        return self
+    def stop(self):
+        self.check()
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        disable()
+        self.running = self.over = False
+    def worker_signal(self, ctx):
+        """Shared counter (a `ctx` Value) that request_shed() bumps, for worker processes to watch."""
+        if self._signal is None:
+            self._signal = ctx.Value('i', 0)
+        return self._signal
+    def request_shed(self):
+        """Ask the worker processes to drop their caches before their next file."""
+        if self._signal is not None:
+            with self._signal.get_lock():
+                self._signal.value += 1
+    def _sampler(self):
+        while not self._stop.wait(SAMPLE_SECONDS):
+            self.check()
+    def check(self):
+        """Sample this process now; returns True while over budget."""
+        rss = rss_bytes()
+        heap = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
+        with self._lock:
+            self.peak_rss, self.peak_heap = _max(self.peak_rss, rss), _max(self.peak_heap, heap)
+            self._used = (rss if rss is not None else heap or 0) + sum(self._workers.values())
+            self.peak_used = max(self.peak_used, self._used)
+            if not self.budget:
+                return False
+            if not self.over and self._used > self.budget * HIGH_WATER:
+                self.over = self._changed = True
+                self.throttled += 1
+            elif self.over and self._used < self.budget * LOW_WATER:
+                self.over, self._changed = False, True
+            return self.over
+    def pressure_changed(self):
+        """True once after every switch into or out of the over-budget state (then see `over`)."""
+        with self._lock:
+            changed, self._changed = self._changed, False
+            return changed
+    @property
+    def used(self):
+        """Bytes in use at the last sample, worker processes included."""
+        return self._used
+    @contextmanager
+    def admit(self):
+        """Around one file's work on a thread: while over budget, only one file runs at a time."""
+        if not self.over:
+            yield
+            return
+        with self._gate:
+            yield
+    def add_file(self, path, memory):
+        """Fold one file's samples (FileTimer.memory) into the run's peaks."""
+        if not memory:
+            return
+        start_rss, start_heap = memory['start']
+        rss = heap = None
+        for stage, (stage_rss, stage_heap) in memory['stages'].items():
+            peaks = self.stages.setdefault(stage, [None, None])
+            peaks[0], peaks[1] = _max(peaks[0], stage_rss), _max(peaks[1], stage_heap)
+            rss, heap = _max(rss, stage_rss), _max(heap, stage_heap)
+        with self._lock:
+            if memory['pid'] != os.getpid() and rss is not None:
+                # A worker process: its RSS counts against the budget until it reports again
+                self._workers[memory['pid']] = rss
+            self.peak_rss, self.peak_heap = _max(self.peak_rss, rss), _max(self.peak_heap, heap)
+        if heap is not None and start_heap is not None:
+            growth = heap - start_heap
+        elif rss is not None and start_rss is not None:
+            growth = rss - start_rss
+        else:
+            return
+        growth = max(0, growth)
+        ext = os.path.splitext(path)[1].lower() or '(none)'
+        kind = self.types.setdefault(ext, [None, None, 0, 0])
+        kind[0], kind[1] = _max(kind[0], rss), _max(kind[1], heap)
+        kind[2] += 1
+        kind[3] = max(kind[3], growth)
+        entry = (growth, path)
+        if len(self._largest) < TOP_FILES:
+            heapq.heappush(self._largest, entry)
+        elif entry > self._largest[0]:
+            heapq.heapreplace(self._largest, entry)
+    def largest(self):
+        """[(growth in bytes, path)] of the files that grew memory the most, largest first."""
+        return sorted(self._largest, reverse=True)
+    def summary(self):
+        line = "Memory: peak RSS " + (_mb(self.peak_rss) if self.peak_rss is not None else "unknown")
+        if self._workers:
+            line += f" per process, {_mb(self.peak_used)} in all"
+        if self.peak_heap is not None:
+            line += f", Python heap {_mb(self.peak_heap)}"
+        if self.budget:
+            line += f" (budget {self.budget // MB} MB, throttled {self.throttled} time{'' if self.throttled == 1 else 's'})"
+        if not self.profile:
+            return line + "."
+        # Heap figures when tracing: RSS rarely goes back down, so it hides which stage needed the memory
+        column = 1 if self.trace else 0
+        stages = ', '.join(f"{name} {_mb(peaks[column])}" for name, peaks in self.stages.items() if peaks[column] is not None)
+        if stages:
+            line += f"; {'heap' if self.trace else 'RSS'} peak by stage: {stages}"
+        if self.types:
+            line += "; most one file added, by type: " + ', '.join(f"{ext} {_mb(kind[3])}" for ext, kind in sorted(self.types.items()))
+        largest = self.largest()[:3]
+        if largest:
+            line += "; largest: " + ', '.join(f"{os.path.basename(path)} +{_mb(growth)}" for growth, path in largest)
+        return line + "."
+    def to_dict(self):
+        return {
+            'peak_rss_bytes': self.peak_rss,
+            'peak_used_bytes': self.peak_used,
+            'peak_heap_bytes': self.peak_heap,
+            'budget_bytes': self.budget or None,
+            'throttled': self.throttled,
+            'traced': self.trace,
+            'stages': {name: {'rss_bytes': rss, 'heap_bytes': heap} for name, (rss, heap) in self.stages.items()},
+            'types': {ext: {'rss_bytes': rss, 'heap_bytes': heap, 'files': files, 'max_growth_bytes': growth}
+                      for ext, (rss, heap, files, growth) in self.types.items()},
+            'largest': [{'path': path, 'growth_bytes': growth} for growth, path in self.largest()],
+        }
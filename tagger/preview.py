@@ -0,0 +1,102 @@
+"""
+File preview: the files a run would tag, with their current and planned
+track number, album and artist, for lists of any size.
+
+PreviewModel holds the gathered PathList and hands out rows by index. The
+current values are read lazily, only for the rows a view asks for (plus one
+window ahead), by a background reader that parses just the tag region, as
+the inventory does. Rows sit in an LRU cache of CACHE_ROWS, so scrolling
+back costs nothing and memory stays bounded however long the list. The
+planned values come from the engine's own numbering and merge rules: what
+the run leaves in the file, not just what the form says.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from mutagen.id3 import ID3
+from .inventory import field_text
+from .tagio import read_mp3_id3, read_wav_id3
+PREVIEW_KEYS = ('TRCK', 'TALB', 'TPE1')
+# Rows kept loaded; the least recently shown are dropped first
+CACHE_ROWS = 4096
+class PreviewModel:
+    """
+    Rows of a preview over `files` (in run order) as `engine` would tag them.
+    row(i) never blocks; request(first, count) tells the reader which rows a
+    view shows, and on_loaded() is called from the reader thread whenever
+    new rows are ready.
+    """
+    def __init__(self, engine, files, on_loaded=None, cache_rows=CACHE_ROWS):
+        self.engine = engine
+        self.files = files
+        self.on_loaded = on_loaded or (lambda: None)
+        cfg = engine.config
+        self.root = os.path.dirname(cfg.single_path) if cfg.single_mode else cfg.folder
+        self._base_md = cfg.metadata()
+        engine.number_albums(files)
+        self._cache = OrderedDict()
+        self._cache_rows = max(1, cache_rows)
+        self._cond = threading.Condition()
+        self._window = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._reader, name='preview', daemon=True)
+        self._thread.start()
+    def __len__(self):
+        return len(self.files)
+    def name(self, i):
+        """Path of the i-th (0-based) file relative to the folder."""
+        path = self.files[i]
+        prefix = os.path.join(self.root, '')
+        return path[len(prefix):] if self.root and path.startswith(prefix) else os.path.basename(path)
+    def row(self, i):
+        """(current values, planned values, error) of the i-th file over PREVIEW_KEYS, or None until read."""
+        with self._cond:
+            values = self._cache.get(i)
+            if values is not None:
+                self._cache.move_to_end(i)
+            return values
+    def request(self, first, count):
+        """Rows first..first+count-1 are on screen: read those next (and then the window after them)."""
+        with self._cond:
+            self._window = (max(0, first), max(0, count))
+            self._cond.notify()
+    def read(self, i):
+        """Read the i-th file's row now (any thread)."""
+        path = self.files[i]
+        try:
+            data = read_wav_id3(path) if os.path.splitext(path)[1].lower() == '.wav' else read_mp3_id3(path)
+            tag = ID3(BytesIO(data), load_v1=False) if data else ID3()
+            current = tuple(field_text(tag, key) for key in PREVIEW_KEYS)
+            md = self.engine.file_metadata(*self.engine.number_for(i + 1, len(self.files)), self._base_md, tag)
+            planned = tuple(md.get(key, value) for key, value in zip(PREVIEW_KEYS, current))
+            return current, planned, ''
+        except Exception as e:
+            blank = ('',) * len(PREVIEW_KEYS)
+            return blank, blank, f"{type(e).__name__} - {e}"
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+    def _reader(self):
+        while True:
+            with self._cond:
+                while self._window is None and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                (first, count), self._window = self._window, None
+                end = min(len(self.files), first + 2 * count)
+                wanted = [i for i in range(first, end) if i not in self._cache]
+            for i in wanted:
+                values = self.read(i)
+                with self._cond:
+                    self._cache[i] = values
+                    while len(self._cache) > self._cache_rows:
+                        self._cache.popitem(last=False)
+                    # A newer window (the view scrolled on) or close() wins over the rest of this one
+                    stale = self._window is not None or self._closed
+                self.on_loaded()
+                if stale:
+                    break
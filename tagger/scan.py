@@ -0,0 +1,219 @@
+"""
+Streaming, memory-bounded scan of a music tree.
+
+iter_sorted() walks the tree with os.scandir and yields the audio files in
+case-insensitive path order while the walk is still running: each folder's
+entries are sorted on their own, with subfolders keyed as "name/", which
+gives exactly the order of sorting all full paths (a subtree's paths all
+share its "name/" prefix, so they sort as one contiguous block). Only the
+folders on the current path are held, and a folder too large to sort in
+memory is sorted in runs spilled to temp files and merged back. On a slow
+(network) mount, FolderPrefetch lists the folders the walk is about to
+enter on a thread pool, ahead of it.
+
+PathList keeps the resulting list compactly: a table of folders (each
+stored once) plus the names packed into one bytearray, instead of a full
+path string per file.
+"""
+
+import os
+import heapq
+import hashlib
+import tempfile
+import time
+from array import array
+from collections import deque
+from .config import AUDIO_EXTS
+# Entries of one folder sorted in memory; bigger folders spill sorted runs to disk
+SPILL_ENTRIES = 200_000
+# Folder listings FolderPrefetch keeps done or running ahead of the walk
+PREFETCH_FOLDERS = 64
+_READ_SIZE = 1 << 16
+def _key(entry):
+    is_dir, name = entry
+    return name.lower() + os.sep if is_dir else name.lower(), name
+def _write_run(entries):
+    """Sorted entries to an anonymous temp file: 'd' or 'f' plus the name, NUL-terminated."""
+    f = tempfile.TemporaryFile()
+    f.write(b''.join((b'd' if is_dir else b'f') + os.fsencode(name) + b'\0' for is_dir, name in entries))
+    f.seek(0)
+    return f
+def _read_run(f):
+    try:
+        tail = b''
+        while True:
+            chunk = f.read(_READ_SIZE)
+            if not chunk:
+                return
+            records = (tail + chunk).split(b'\0')
+            tail = records.pop()
+            for rec in records:
+                yield rec[:1] == b'd', os.fsdecode(rec[1:])
+    finally:
+        f.close()
+def sorted_entries(folder, exts=AUDIO_EXTS):
+    """(is_dir, name) for the subfolders and audio files of `folder`, in scan order (a list unless it spilled)."""
+    entries = []
+    runs = []
+    try:
+        with os.scandir(folder) as it:
+            for entry in it:
+                try:
+                    # Same rules as os.walk: symlinked folders count as folders but are not followed
+                    if entry.is_dir():
+                        if not entry.is_symlink():
+                            entries.append((True, entry.name))
+                    elif os.path.splitext(entry.name)[1].lower() in exts:
+                        entries.append((False, entry.name))
+                except OSError:
+                    continue
+                if len(entries) >= SPILL_ENTRIES:
+                    entries.sort(key=_key)
+                    runs.append(_write_run(entries))
+                    entries = []
+    except OSError:
+        pass
+    entries.sort(key=_key)
+    if not runs:
+        return entries
+    if entries:
+        runs.append(_write_run(entries))
+    return heapq.merge(*(_read_run(f) for f in runs), key=_key)
+class FolderPrefetch:
+    """
+    Lists folders ahead of iter_sorted(): when the walk enters a folder, its
+    subfolders are queued in walk order and up to `ahead` listings are kept
+    done or running. submit(fn, *args) runs one listing on a pool and
+    returns a Future (e.g. IOScheduler.submit under the metadata limit).
+    """
+    def __init__(self, submit, exts=AUDIO_EXTS, ahead=PREFETCH_FOLDERS):
+        self._submit = submit
+        self.exts = exts
+        self.ahead = ahead
+        # Folders found but not listed yet, next to be entered first
+        self._wanted = deque()
+        self._listing = {}
+    def entries(self, folder):
+        future = self._listing.pop(folder, None)
+        if future is not None:
+            entries = future.result()
+        else:
+            if self._wanted and self._wanted[0] == folder:
+                self._wanted.popleft()
+            entries = self.submit(folder).result()
+        if isinstance(entries, list):
+            # Walk order is depth first, so these come before the folders queued earlier
+            self._wanted.extendleft(os.path.join(folder, name) for is_dir, name in reversed(entries) if is_dir)
+        while self._wanted and len(self._listing) < self.ahead:
+            sub = self._wanted.popleft()
+            self._listing[sub] = self.submit(sub)
+        return iter(entries)
+    def submit(self, folder):
+        return self._submit(sorted_entries, folder, self.exts)
+    def cancel(self):
+        for future in self._listing.values():
+            future.cancel()
+        self._listing.clear()
+def iter_sorted(root, exts=AUDIO_EXTS, prefetch=None):
+    """
+    Yield (folder, name) for every audio file under `root`, in case-insensitive
+    path order. With `prefetch` (a FolderPrefetch for the same exts) folders
+    are listed ahead of the walk.
+    """
+    if prefetch is None:
+        list_folder = lambda folder: iter(sorted_entries(folder, exts))
+    else:
+        list_folder = prefetch.entries
+    try:
+        yield from _walk(root, list_folder)
+    finally:
+        if prefetch is not None:
+            prefetch.cancel()
+def _walk(root, list_folder):
+    stack = [(root, list_folder(root))]
+    while stack:
+        folder, entries = stack[-1]
+        entry = next(entries, None)
+        if entry is None:
+            stack.pop()
+        elif entry[0]:
+            sub = os.path.join(folder, entry[1])
+            stack.append((sub, list_folder(sub)))
+        else:
+            yield folder, entry[1]
+class PathList:
+    """Append-only sequence of file paths: folder table plus packed names (about 12 bytes per file plus the name)."""
+    def __init__(self, paths=()):
+        self._dirs = []
+        self._dir_ids = {}
+        self._dir_of = array('I')
+        self._names = bytearray()
+        self._ends = array('Q')
+        for path in paths:
+            self.append(path)
+    def add(self, folder, name):
+        dir_id = self._dir_ids.get(folder)
+        if dir_id is None:
+            dir_id = self._dir_ids[folder] = len(self._dirs)
+            self._dirs.append(folder)
+        self._dir_of.append(dir_id)
+        self._names += name.encode('utf-8', 'surrogateescape')
+        self._ends.append(len(self._names))
+    def append(self, path):
+        folder, name = os.path.split(path)
+        self.add(folder, name)
+    def __len__(self):
+        return len(self._ends)
+    def _path(self, i):
+        start = self._ends[i - 1] if i else 0
+        name = self._names[start:self._ends[i]].decode('utf-8', 'surrogateescape')
+        return os.path.join(self._dirs[self._dir_of[i]], name)
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._path(k) for k in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('PathList index out of range')
+        return self._path(i)
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._path(i)
+    @property
+    def folders(self):
+        return len(self._dirs)
+class StreamingScan:
+    """
+    Iterator over the sorted audio files under `root` while the walk runs.
+    Every path handed out is also kept in `files` (a PathList); `seconds`
+    is the time spent scanning and digest() identifies the list so far.
+    """
+    def __init__(self, root, exts=AUDIO_EXTS, prefetch=None):
+        self.files = PathList()
+        self.seconds = 0.0
+        self.finished = False
+        self._it = iter_sorted(root, exts, prefetch)
+        self._hash = hashlib.sha1()
+    def __iter__(self):
+        return self
+    def __next__(self):
+        t0 = time.perf_counter()
+        try:
+            folder, name = next(self._it)
+        except StopIteration:
+            self.finished = True
+            raise
+        finally:
+            self.seconds += time.perf_counter() - t0
+        self.files.add(folder, name)
+        path = os.path.join(folder, name)
+        self._hash.update(path.encode('utf-8', 'surrogateescape') + b'\0')
+        return path
+    def digest(self):
+        return self._hash.hexdigest()[:16]
+def list_digests(paths):
+    """digest() of a StreamingScan after each of `paths`, recomputed from a list."""
+    h = hashlib.sha1()
+    for path in paths:
+        h.update(path.encode('utf-8', 'surrogateescape') + b'\0')
+        yield h.hexdigest()[:16]
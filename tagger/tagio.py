@@ -0,0 +1,320 @@
+"""
+Low-level tag I/O that never loads audio payloads into memory.
+
+MP3 tags are written by write_mp3_id3(): the new ID3v2 tag is padded to the
+size of the old one whenever the frames fit, so re-tagging overwrites only
+the header region. When it has to grow, a padding reserve is added so the
+following runs fit again.
+
+WAV tags live in a RIFF `id3 ` chunk. write_wav_id3() walks the chunk table
+(seeking over the audio) and, whenever the layout allows, replaces or
+appends just that chunk and patches the RIFF size in place. When it cannot
+(the new tag outgrows an id3 chunk sitting before other chunks, or there is
+trailing data after the RIFF body) the file is stream-copied to a temp file
+with copy_file_range() or a bounded buffer. Every other chunk (fmt, data,
+LIST/INFO, bext, ds64 for RF64, ...) is carried over byte for byte.
+"""
+
+import os
+import shutil
+import struct
+from collections import namedtuple
+from io import BytesIO
+from mutagen.id3 import ID3
+from mutagen import MutagenError, PaddingInfo
+# Bounded buffer for the userspace copy fallback
+COPY_BUFSIZE = 1024 * 1024
+RIFF_FORMS = (b'RIFF', b'RF64', b'BW64')
+ID3_CHUNK_IDS = (b'id3 ', b'ID3 ')
+# Results of a write, as counted by the engine
+WRITE_IN_PLACE = 'in_place'
+WRITE_REWRITE = 'rewrite'
+WRITE_SKIPPED = 'skipped'
+class Chunk(namedtuple('Chunk', 'id offset size')):
+    """A RIFF chunk: 4-byte id, offset of its 8-byte header and payload size."""
+    @property
+    def data_offset(self):
+        return self.offset + 8
+    @property
+    def end(self):
+        # Chunks are word aligned: odd sizes carry one pad byte
+        return self.offset + 8 + self.size + (self.size & 1)
+RiffLayout = namedtuple('RiffLayout', 'form riff_size file_size chunks ds64_offset')
+def parse_riff(f):
+    """Read the chunk table of an open RIFF/RF64 WAVE file without touching payloads."""
+    f.seek(0, 2)
+    file_size = f.tell()
+    f.seek(0)
+    head = f.read(12)
+    if len(head) < 12 or head[:4] not in RIFF_FORMS or head[8:12] != b'WAVE':
+        raise ValueError("WAV read failed: not a RIFF/WAVE file")
+    form = head[:4]
+    riff_size = struct.unpack('<I', head[4:8])[0]
+    ds64_offset = None
+    big_sizes = {}
+    chunks = []
+    pos = 12
+    while pos + 8 <= file_size:
+        f.seek(pos)
+        cid, size = struct.unpack('<4sI', f.read(8))
+        if not all(32 <= b < 127 for b in cid):
+            break # not a chunk header: trailing data after the RIFF body
+        if form != b'RIFF' and cid == b'ds64' and size >= 28:
+            # RF64: real 64-bit sizes live in ds64 (riff, data, sample count, table)
+            body = f.read(size)
+            riff_size, data_size, _, table_len = struct.unpack('<QQQI', body[:28])
+            big_sizes[b'data'] = data_size
+            for n in range(table_len):
+                entry = body[28 + 12 * n:40 + 12 * n]
+                if len(entry) == 12:
+                    tid, tsize = struct.unpack('<4sQ', entry)
+                    big_sizes[tid] = tsize
+            ds64_offset = pos
+        if size == 0xFFFFFFFF and cid in big_sizes:
+            size = big_sizes[cid]
+        chunks.append(Chunk(cid, pos, size))
+        pos = chunks[-1].end
+    return RiffLayout(form, riff_size, file_size, chunks, ds64_offset)
+def _check_riff_size(layout, riff_size):
+    if layout.ds64_offset is None and riff_size > 0xFFFFFFFF:
+        raise ValueError("WAV would exceed 4 GiB; convert it to RF64 first")
+def _set_riff_size(f, layout, riff_size):
+    if layout.ds64_offset is not None:
+        f.seek(layout.ds64_offset + 8)
+        f.write(struct.pack('<Q', riff_size))
+        return
+    _check_riff_size(layout, riff_size)
+    f.seek(4)
+    f.write(struct.pack('<I', riff_size))
+def id3_chunk(tag_data, chunk_id=b'id3 '):
+    pad = b'\x00' if len(tag_data) % 2 == 1 else b''
+    return chunk_id + struct.pack('<I', len(tag_data)) + tag_data + pad
+def copy_range(src, dst, offset, length):
+    """Copy `length` bytes of src starting at `offset` to dst's current position."""
+    if length <= 0:
+        return
+    if hasattr(os, 'copy_file_range'):
+        dst.flush()
+        out = dst.tell()
+        try:
+            while length > 0:
+                n = os.copy_file_range(src.fileno(), dst.fileno(), min(length, 1 << 30), offset, out)
+                if n == 0:
+                    break
+                offset += n
+                out += n
+                length -= n
+        except OSError:
+            pass # cross-device, unsupported fs, ...: finish with the buffered copy
+        dst.seek(out)
+    src.seek(offset)
+    while length > 0:
+        buf = src.read(min(COPY_BUFSIZE, length))
+        if not buf:
+            raise ValueError("WAV read failed: file is truncated")
+        dst.write(buf)
+        length -= len(buf)
+def _find_id3(layout):
+    return [c for c in layout.chunks if c.id in ID3_CHUNK_IDS]
+def read_wav_id3(path):
+    """Raw payload of the first id3 chunk of a WAV file, or None."""
+    with open(path, 'rb') as f:
+        found = _find_id3(parse_riff(f))
+        if not found:
+            return None
+        f.seek(found[0].data_offset)
+        return f.read(found[0].size)
+def read_mp3_id3(path):
+    """Raw ID3v2 region at the start of an MP3 (header included), or None; the audio is not read."""
+    with open(path, 'rb') as f:
+        size = id3v2_region_size(f)
+        if not size:
+            return None
+        f.seek(0)
+        return f.read(size)
+def read_wav_tag(path):
+    """ID3 tag stored in a WAV file (empty ID3 if it has none or it is unreadable)."""
+    data = read_wav_id3(path)
+    if data:
+        try:
+            return ID3(BytesIO(data))
+        except MutagenError:
+            pass
+    return ID3()
+def _padding(needed, available, reserve):
+    if available is not None and needed <= available:
+        return available - needed
+    return PaddingInfo(-needed, 0).get_default_padding() if reserve is None else reserve
+def serialize_tag(tag, v2_version, available=None, reserve=None):
+    """
+    ID3v2 bytes for `tag`. If the frames fit in `available` bytes the result is
+    padded to exactly that size, so the existing tag slot is reused in place.
+    Otherwise `reserve` bytes of padding (mutagen's default if None) are added
+    so the next runs have room to edit the tag without moving the audio.
+    """
+    f = BytesIO()
+    # Serializing into an empty buffer: info.padding is minus the bytes needed
+    tag.save(f, v2_version=v2_version, padding=lambda info: _padding(-info.padding, available, reserve))
+    return f.getvalue()
+def encode_frames(tag, v2_version):
+    """The encoded frames of `tag` alone: no header, no padding."""
+    return serialize_tag(tag, v2_version, reserve=0)[10:]
+def assemble_tag(parts, v2_version, available=None, reserve=None):
+    """ID3v2 tag around already encoded frames (a list of byte strings), padded like serialize_tag()."""
+    length = sum(len(p) for p in parts)
+    pad = _padding(10 + length, available, reserve)
+    size = length + pad # syncsafe, excludes the header itself
+    header = b'ID3' + bytes([v2_version, 0, 0, (size >> 21) & 0x7F, (size >> 14) & 0x7F, (size >> 7) & 0x7F, size & 0x7F])
+    return b''.join([header, *parts, b'\x00' * pad])
+def write_wav_id3(path, render, exact=False):
+    """
+    Store an ID3 tag in the WAV at `path`. render(available) must return the
+    tag bytes; `available` is the payload size of the id3 chunk that can be
+    overwritten in place (None if there is none). With `exact` a smaller tag
+    is not zero-filled into the old slot: the chunk gets the tag's own size,
+    rewriting the file if it is not the last chunk. Returns WRITE_IN_PLACE
+    or WRITE_REWRITE.
+    """
+    with open(path, 'r+b') as f:
+        layout = parse_riff(f)
+        if not layout.chunks:
+            raise ValueError("WAV read failed: no chunks")
+        found = _find_id3(layout)
+        target = found[0] if found else None
+        last = layout.chunks[-1]
+        body_end = last.end
+        if body_end > layout.file_size + 1:
+            raise ValueError("WAV read failed: file is truncated")
+        trailing = layout.file_size > body_end
+        tag_data = render(target.size if target else None)
+        new_chunk = id3_chunk(tag_data, target.id if target else b'id3 ')
+        # Every in-place branch checks the new RIFF size before it writes, so a
+        # tag that cannot fit leaves the old tag and header as they were
+        in_place = False
+        if target is not None and target is last and not trailing:
+            # Tag is the final chunk: rewrite the tail only
+            new_end = target.offset + len(new_chunk)
+            _check_riff_size(layout, new_end - 8)
+            f.seek(target.offset)
+            f.write(new_chunk)
+            f.truncate()
+            in_place = True
+        elif target is not None and (len(tag_data) == target.size if exact else len(tag_data) <= target.size):
+            # Fits the existing slot; zero-fill keeps the chunk size unchanged
+            new_end = body_end
+            _check_riff_size(layout, new_end - 8)
+            f.seek(target.data_offset)
+            f.write(tag_data + b'\x00' * (target.size - len(tag_data)))
+            in_place = True
+        elif target is None and not trailing:
+            new_end = body_end + len(new_chunk)
+            _check_riff_size(layout, new_end - 8)
+            f.seek(0, 2)
+            if layout.file_size < body_end:
+                f.write(b'\x00') # missing pad byte of the last chunk
+            f.write(new_chunk)
+            in_place = True
+        if in_place:
+            # Older versions appended a fresh chunk on every run; retire the stale ones
+            for extra in found[1:]:
+                f.seek(extra.offset)
+                f.write(b'JUNK')
+            _set_riff_size(f, layout, new_end - 8)
+            return WRITE_IN_PLACE
+        _rewrite_wav(f, path, layout, target, found[1:], new_chunk)
+    return WRITE_REWRITE
+def remove_wav_id3(path):
+    """Take every id3 chunk out of the WAV at `path`. Returns WRITE_IN_PLACE (nothing to move) or WRITE_REWRITE."""
+    with open(path, 'r+b') as f:
+        layout = parse_riff(f)
+        found = _find_id3(layout)
+        if not found:
+            return WRITE_IN_PLACE
+        if found == layout.chunks[-1:] and layout.file_size <= found[0].end:
+            f.truncate(found[0].offset)
+            _set_riff_size(f, layout, found[0].offset - 8)
+            return WRITE_IN_PLACE
+        _rewrite_wav(f, path, layout, None, found, b'')
+    return WRITE_REWRITE
+def _replace_via_temp(src, path, fill):
+    """Build the new file with fill(dst) in path + '.tmp', then swap it in atomically."""
+    temp_path = path + '.tmp'
+    try:
+        with open(temp_path, 'w+b') as dst:
+            fill(dst)
+        shutil.copymode(path, temp_path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    src.close()
+    os.replace(temp_path, path)
+def _rewrite_wav(src, path, layout, target, drop, new_chunk):
+    """Stream-copy the WAV with the id3 chunk replaced (or appended)."""
+    def fill(dst):
+        start = 0 # start of the pending source range
+        for c in layout.chunks:
+            if c is target or c in drop:
+                copy_range(src, dst, start, c.offset - start)
+                if c is target:
+                    dst.write(new_chunk)
+                start = c.end
+        body_end = layout.chunks[-1].end
+        copy_range(src, dst, start, min(body_end, layout.file_size) - start)
+        if layout.file_size < body_end:
+            dst.write(b'\x00')
+        if target is None:
+            dst.write(new_chunk)
+        new_end = dst.tell()
+        copy_range(src, dst, body_end, layout.file_size - body_end)
+        _set_riff_size(dst, layout, new_end - 8)
+    _replace_via_temp(src, path, fill)
+def id3v2_region_size(f):
+    """Bytes taken by the ID3v2 tag at the start of an MP3 (header, frames, padding, footer)."""
+    f.seek(0)
+    head = f.read(10)
+    if len(head) < 10 or head[:3] != b'ID3':
+        return 0
+    if any(b & 0x80 for b in head[6:10]):
+        raise ValueError("corrupt ID3v2 header size")
+    size = (head[6] << 21) | (head[7] << 14) | (head[8] << 7) | head[9]
+    footer = 10 if head[3] == 4 and head[5] & 0x10 else 0
+    return 10 + size + footer
+def write_mp3_id3(path, render, v1_data=None):
+    """
+    Store an ID3v2 tag at the start of the MP3 at `path`. render(available)
+    must return the tag bytes; `available` is the size of the current tag
+    region (None if there is none). A tag of exactly that size is written
+    over the old one in place; anything else stream-copies the audio behind
+    the new tag. An existing ID3v1 tag is refreshed with `v1_data`.
+    Returns WRITE_IN_PLACE or WRITE_REWRITE.
+    """
+    with open(path, 'r+b') as f:
+        old_size = id3v2_region_size(f)
+        data = render(old_size or None)
+        if old_size and len(data) == old_size:
+            f.seek(0)
+            f.write(data)
+            _update_v1(f, v1_data)
+            return WRITE_IN_PLACE
+        f.seek(0, 2)
+        file_size = f.tell()
+        def fill(dst):
+            dst.write(data)
+            copy_range(f, dst, old_size, file_size - old_size)
+            _update_v1(dst, v1_data)
+        _replace_via_temp(f, path, fill)
+    return WRITE_REWRITE
+def _update_v1(f, v1_data):
+    # Same policy as mutagen's v1=1: refresh an ID3v1 tag only if one exists
+    if not v1_data:
+        return
+    f.seek(0, 2)
+    if f.tell() < 128:
+        return
+    f.seek(-128, 2)
+    if f.read(3) == b'TAG':
+        f.seek(-128, 2)
+        f.write(v1_data)
@@ -0,0 +1,70 @@
+"""
+Compiled tag template: the frames every file of a batch shares, built and
+encoded once.
+
+Each file of a batch gets the same base fields and, per folder, the same
+cover; usually only TRCK differs. A TagTemplate builds those constant
+frames once for the batch's ID3v2 version and keeps their encoded bytes,
+and encodes each cover once as well, keeping the encoded frames of the
+`keep` most recently used covers. Per file, only the frames
+that differ and whatever the file's own tag keeps are encoded; the shared
+bytes are spliced in front of them.
+"""
+
+import threading
+from .covers import KEEP_COVERS
+from .tagio import encode_frames
+class TagTemplate:
+    """
+    build_tag(metadata, cover) -> ID3 is the engine's frame builder.
+    base_md: fields shared by every file (TRCK is always treated as per-file).
+    keep: covers whose encoded frames are kept at once.
+    """
+    def __init__(self, build_tag, base_md, v2_version, keep=KEEP_COVERS):
+        self.build_tag = build_tag
+        self.v2_version = v2_version
+        self.base_md = {k: v for k, v in base_md.items() if k != 'TRCK'}
+        base = build_tag(self.base_md)
+        self.frames = dict(base.items())
+        self.encoded = encode_frames(base, v2_version)
+        self._lock = threading.Lock()
+        self.keep = max(1, int(keep))
+        # (id(cover bytes), mime) -> (cover bytes, frames, encoded), in use order; holding the bytes keeps the id unique
+        self._covers = {}
+    def _cover(self, cover):
+        data, mime = cover
+        if not (data and mime):
+            return {}, b''
+        key = (id(data), mime)
+        with self._lock:
+            entry = self._covers.pop(key, None)
+            if entry is None:
+                tag = self.build_tag({}, cover)
+                entry = (data, dict(tag.items()), encode_frames(tag, self.v2_version))
+            # Reinserted last: the dict is in use order, oldest first
+            self._covers[key] = entry
+            while len(self._covers) > self.keep:
+                del self._covers[next(iter(self._covers))]
+        return entry[1], entry[2]
+    def drop_cover(self, cover):
+        """Drop the encoded frames of one (bytes, mime) cover (it changed on disk)."""
+        data, mime = cover
+        with self._lock:
+            entry = self._covers.get((id(data), mime))
+            if entry is not None and entry[0] is data:
+                del self._covers[(id(data), mime)]
+    def clear_covers(self):
+        """Drop the encoded cover frames (they are encoded again when next needed)."""
+        with self._lock:
+            self._covers.clear()
+    def compile(self, metadata, cover):
+        """
+        (shared frames by HashKey, their encoded bytes, ID3 of the per-file
+        frames) for one file. Falls back to building everything per file when
+        `metadata` disagrees with the base fields.
+        """
+        if any(metadata.get(k) != v for k, v in self.base_md.items()):
+            return {}, b'', self.build_tag(metadata, cover)
+        cover_frames, cover_bytes = self._cover(cover)
+        own = self.build_tag({k: v for k, v in metadata.items() if k not in self.base_md})
+        return {**self.frames, **cover_frames}, self.encoded + cover_bytes, own
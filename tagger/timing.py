@@ -0,0 +1,116 @@
+"""
+Per-stage timing for tagging runs.
+
+Every tagged file carries a FileTimer through tag_file()/apply_meta(); its
+stage totals travel back in the FileResult (so process workers report too)
+and are folded into the run's RunTimer. At the end of a run the RunTimer
+gives per-stage totals and p50/p95/p99 of the per-file time, as a log
+summary, a JSON report and a Prometheus textfile (node_exporter's textfile
+collector picks up *.prom files; they are replaced atomically).
+"""
+
+import os
+import json
+import math
+import time
+from array import array
+from contextlib import contextmanager
+from . import memory
+# Stages in pipeline order: scan (file list) and the per-file stages
+STAGES = ('scan', 'cover', 'read', 'build', 'serialize', 'backup', 'write', 'verify')
+QUANTILES = (0.5, 0.95, 0.99)
+class FileTimer:
+    """Seconds spent per stage on one file; with memory sampling on (see tagger.memory), memory too."""
+    def __init__(self):
+        self.stages = {}
+        # {'pid', 'start': (RSS, heap), 'stages': {stage: (peak RSS, peak heap)}}
+        self.memory = {'pid': os.getpid(), 'start': memory.baseline(), 'stages': {}} if memory.enabled() else None
+    @contextmanager
+    def stage(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - t0)
+            if self.memory is not None:
+                memory.record(self.memory['stages'], name)
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted sequence (None if empty)."""
+    if not sorted_values:
+        return None
+    rank = min(len(sorted_values), max(1, math.ceil(q * len(sorted_values))))
+    return sorted_values[rank - 1]
+class RunTimer:
+    """Accumulates stage totals and per-file times for one run (main thread only)."""
+    def __init__(self):
+        self.started = time.time()
+        self._t0 = time.perf_counter()
+        self.wall = 0.0
+        self.stages = dict.fromkeys(STAGES, 0.0)
+        self.per_file = array('d')
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+    def add_file(self, stages, seconds):
+        for name, value in stages.items():
+            self.add(name, value)
+        self.per_file.append(seconds)
+    def finish(self):
+        self.wall = time.perf_counter() - self._t0
+    def quantiles(self):
+        values = sorted(self.per_file)
+        return {q: percentile(values, q) for q in QUANTILES}
+    def summary(self):
+        parts = ', '.join(f"{name} {secs:.2f}s" for name, secs in self.stages.items() if secs)
+        # With workers > 1 the stage sums can exceed the wall time
+        line = f"Timing: {self.wall:.2f}s wall; stages summed over files: {parts or 'none'}."
+        q = self.quantiles()
+        if q[0.5] is not None:
+            line += " Per file: " + ', '.join(f"p{int(k * 100)} {v * 1000:.1f} ms" for k, v in q.items()) + "."
+        return line
+    def to_dict(self, stats=None, extra=None):
+        report = {
+            'started': self.started,
+            'wall_seconds': round(self.wall, 6),
+            'stages': {name: round(secs, 6) for name, secs in self.stages.items()},
+            'files_timed': len(self.per_file),
+            'per_file_seconds': {f"p{int(q * 100)}": (None if v is None else round(v, 6)) for q, v in self.quantiles().items()},
+        }
+        if stats is not None:
+            report['files'] = {'total': stats.total, 'tagged': stats.tagged, 'skipped': stats.skipped,
+                               'failed': stats.failed, 'in_place': stats.in_place, 'rewrites': stats.rewrites}
+            report['cancelled'] = stats.cancelled
+        report.update(extra or {})
+        return report
+    def write_json(self, path, stats=None, extra=None):
+        """JSON report; `extra` adds top-level keys (e.g. a job queue's per-job results)."""
+        _write_atomic(path, json.dumps(self.to_dict(stats, extra), indent=2) + '\n')
+    def write_prometheus(self, path, stats=None):
+        lines = [
+            "# HELP mp3tagger_run_seconds Wall time of the last tagging run.",
+            "# TYPE mp3tagger_run_seconds gauge",
+            f"mp3tagger_run_seconds {self.wall:.6f}",
+            "# HELP mp3tagger_last_run_timestamp_seconds Start time of the last tagging run.",
+            "# TYPE mp3tagger_last_run_timestamp_seconds gauge",
+            f"mp3tagger_last_run_timestamp_seconds {self.started:.3f}",
+            "# HELP mp3tagger_stage_seconds Time spent per stage in the last run.",
+            "# TYPE mp3tagger_stage_seconds gauge",
+        ]
+        lines += [f'mp3tagger_stage_seconds{{stage="{name}"}} {secs:.6f}' for name, secs in self.stages.items()]
+        lines += [
+            "# HELP mp3tagger_file_seconds Per-file tagging time in the last run.",
+            "# TYPE mp3tagger_file_seconds summary",
+        ]
+        lines += [f'mp3tagger_file_seconds{{quantile="{q}"}} {v:.6f}' for q, v in self.quantiles().items() if v is not None]
+        lines += [f"mp3tagger_file_seconds_sum {sum(self.per_file):.6f}", f"mp3tagger_file_seconds_count {len(self.per_file)}"]
+        if stats is not None:
+            lines += ["# HELP mp3tagger_files Files by outcome in the last run.", "# TYPE mp3tagger_files gauge"]
+            for outcome in ('total', 'tagged', 'skipped', 'failed', 'in_place', 'rewrites'):
+                lines.append(f'mp3tagger_files{{result="{outcome}"}} {getattr(stats, outcome)}')
+        _write_atomic(path, '\n'.join(lines) + '\n')
+def _write_atomic(path, text):
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(temp_path, path)
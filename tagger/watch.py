@@ -0,0 +1,384 @@
+"""
+Watch-folder mode: tag audio files as they land in a folder.
+
+A change source reports paths that may have changed: inotify on Linux
+(through ctypes, no extra dependency) or, elsewhere or when inotify is out
+of watches, a poller that compares directory listings by size and mtime.
+A reported file is tagged once its size and mtime have held still for
+`settle` seconds, so half-copied files are left until the copy is done.
+Files present when the watch starts are left alone; only new or changed
+.mp3/.wav files get the current settings. The tagger's own writes are
+recognised by the size and mtime they left behind and do not retrigger.
+A cover image (cover.jpg, folder.png, ...) added, changed or removed in a
+folder makes the next file there look its cover up again.
+
+With auto-numbering, a folder's existing track numbers are read the first
+time a file arrives there; new files continue after the highest one and a
+file that is tagged again keeps its number.
+"""
+
+import os
+import re
+import time
+import errno
+import select
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from .config import AUDIO_EXTS
+from .covers import COVER_CANDIDATES
+from .engine import RunStats
+from .tagio import WRITE_SKIPPED
+from .timing import RunTimer, percentile
+# inotify(7) constants
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+_EVENT = struct.Struct('iIII')
+def is_audio(name):
+    return os.path.splitext(name)[1].lower() in AUDIO_EXTS
+def is_cover(name):
+    return name.lower() in COVER_CANDIDATES
+def is_watched(name):
+    return is_audio(name) or is_cover(name)
+def stat_sig(path):
+    """(size, mtime_ns) of a file, or None if it is gone."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+def walk_audio(root, match=is_audio):
+    """Yield (path, (size, mtime_ns)) for every audio file (or name passing `match`) under root, via os.scandir."""
+    stack = [root]
+    while stack:
+        folder = stack.pop()
+        try:
+            with os.scandir(folder) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif match(entry.name) and entry.is_file():
+                            st = entry.stat()
+                            yield entry.path, (st.st_size, st.st_mtime_ns)
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+class PollSource:
+    """Change source that relists the tree every `interval` seconds."""
+    name = 'polling'
+    def __init__(self, root, interval=1.0):
+        self.root = root
+        self.interval = max(0.05, float(interval))
+        self._seen = dict(walk_audio(root, is_watched))
+        self._next = time.monotonic() + self.interval
+    def poll(self, timeout):
+        """Paths added, changed or removed since the last poll (waits at most `timeout` seconds)."""
+        wait = self._next - time.monotonic()
+        if wait > timeout:
+            time.sleep(timeout)
+            return []
+        if wait > 0:
+            time.sleep(wait)
+        self._next = time.monotonic() + self.interval
+        current = dict(walk_audio(self.root, is_watched))
+        changed = [path for path, sig in current.items() if self._seen.get(path) != sig]
+        changed += [path for path in self._seen if path not in current]
+        self._seen = current
+        return changed
+    def close(self):
+        self._seen = {}
+class InotifySource:
+    """Change source on Linux inotify, one watch per folder. Raises OSError if unavailable."""
+    name = 'inotify'
+    def __init__(self, root):
+        import ctypes
+        import ctypes.util
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._get_errno = ctypes.get_errno
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise self._error('inotify_init1')
+        self.root = root
+        self._dirs = {}
+        try:
+            self._add_tree(root)
+        except OSError:
+            self.close()
+            raise
+        # Time of the last event batch; after a queue overflow, files modified since are relisted
+        self._last_event = time.time()
+    def _error(self, what, path=''):
+        err = self._get_errno()
+        return OSError(err, f"{what}: {os.strerror(err)}", path or None)
+    def _add_watch(self, folder):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(folder), WATCH_MASK)
+        if wd < 0:
+            err = self._get_errno()
+            if err in (errno.ENOENT, errno.ENOTDIR, errno.EACCES):
+                return
+            # ENOSPC: fs.inotify.max_user_watches reached
+            raise self._error('inotify_add_watch', folder)
+        self._dirs[wd] = folder
+    def _add_tree(self, root):
+        self._add_watch(root)
+        for folder, subdirs, _ in os.walk(root):
+            for d in subdirs:
+                self._add_watch(os.path.join(folder, d))
+    def _files_since(self, root, since_ns):
+        return [path for path, (_, mtime_ns) in walk_audio(root) if mtime_ns >= since_ns]
+    def poll(self, timeout):
+        """Paths reported changed within `timeout` seconds (an empty list if none)."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        chunks = []
+        while True:
+            try:
+                chunk = os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+            if not chunk:
+                break
+            chunks.append(chunk)
+        data = b''.join(chunks)
+        changed = []
+        overflow = False
+        offset = 0
+        while offset + _EVENT.size <= len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            name = os.fsdecode(data[offset + _EVENT.size:offset + _EVENT.size + length].rstrip(b'\0'))
+            offset += _EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                overflow = True
+                continue
+            if mask & IN_IGNORED:
+                self._dirs.pop(wd, None)
+                continue
+            folder = self._dirs.get(wd)
+            if folder is None or not name:
+                continue
+            path = os.path.join(folder, name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    # A folder moved or copied in: watch it and pick up what is already inside
+                    self._add_tree(path)
+                    changed += self._files_since(path, 0)
+            elif is_watched(name):
+                changed.append(path)
+        if overflow:
+            # Events were lost; anything modified since the last good batch may be new
+            changed += self._files_since(self.root, int((self._last_event - 1) * 1e9))
+        self._last_event = time.time()
+        return changed
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+def open_source(root, poll_interval=1.0, log=None):
+    """inotify where available, else a poller."""
+    try:
+        return InotifySource(root)
+    except (OSError, AttributeError) as e:
+        # AttributeError: libc without inotify (not Linux)
+        if log:
+            log(f"inotify unavailable ({e}); polling every {poll_interval:g}s.")
+        return PollSource(root, poll_interval)
+def _track_of(tag):
+    frame = tag.get('TRCK')
+    text = str(frame.text[0]) if frame and getattr(frame, 'text', None) else ''
+    m = re.match(r'\s*(\d+)', text)
+    return int(m.group(1)) if m else None
+class FolderWatcher:
+    """
+    Tags files arriving under the engine's folder until the engine is
+    cancelled. settle: seconds a file must stay unchanged before it is
+    tagged; poll_interval: relisting period when inotify is unavailable;
+    report_every: seconds between throughput/latency summaries.
+    """
+    def __init__(self, engine, settle=2.0, poll_interval=1.0, report_every=60.0):
+        self.engine = engine
+        self.settle = max(0.0, float(settle))
+        self.poll_interval = max(0.05, float(poll_interval))
+        self.report_every = report_every
+        # path -> [first seen, last change, (size, mtime_ns)] for files waiting to settle
+        self._pending = {}
+        # path -> ((size, mtime_ns) after our own write, time written), so its events are ignored
+        self._written = {}
+        # folder -> {path: track number}, read on the first file to arrive in the folder
+        self._tracks = {}
+        self.stats = RunStats()
+        self._window = []
+        self._backup_run = None
+    def _note(self, path, now):
+        sig = stat_sig(path)
+        if sig is None:
+            self._pending.pop(path, None)
+            return
+        written = self._written.get(path)
+        if written and written[0] == sig:
+            return
+        entry = self._pending.get(path)
+        if entry is None:
+            self._pending[path] = [now, now, sig]
+        elif entry[2] != sig:
+            entry[1], entry[2] = now, sig
+    def _prune_written(self, now):
+        """Forget our own writes whose events have had time to arrive (a settle window plus a relisting)."""
+        cutoff = now - self.settle - self.poll_interval
+        for path in [path for path, (_, when) in self._written.items() if when < cutoff]:
+            del self._written[path]
+    def _cover_changed(self, path):
+        folder = os.path.dirname(path)
+        self.engine.forget_cover(folder)
+        self.engine.log(f"Cover changed: {os.path.relpath(path, self.engine.config.folder)}; "
+                        f"files arriving in {os.path.relpath(folder, self.engine.config.folder)} get the new one.")
+    def _settled(self, now):
+        """Pending files unchanged for `settle` seconds, in path order; they leave the pending set."""
+        ready = []
+        for path, entry in list(self._pending.items()):
+            sig = stat_sig(path)
+            if sig is None:
+                del self._pending[path]
+            elif sig != entry[2]:
+                entry[1], entry[2] = now, sig
+            elif now - entry[1] >= self.settle:
+                ready.append((path, entry[0]))
+                del self._pending[path]
+        ready.sort(key=lambda item: item[0].lower())
+        return ready
+    def _folder_tracks(self, folder, arriving):
+        tracks = self._tracks.get(folder)
+        if tracks is None:
+            tracks = self._tracks[folder] = {}
+            t0 = time.perf_counter()
+            try:
+                names = sorted(e.name for e in os.scandir(folder) if is_audio(e.name) and e.is_file())
+            except OSError:
+                names = []
+            for name in names:
+                path = os.path.join(folder, name)
+                if path in self._pending or path in arriving:
+                    continue
+                try:
+                    n = _track_of(self.engine.read_tag(path))
+                except Exception:
+                    n = None
+                if n is not None:
+                    tracks[path] = n
+            self.engine.log(f"Numbering in {folder}: {len(tracks)} numbered tracks, continuing after "
+                            f"{max(tracks.values(), default=0)} ({time.perf_counter() - t0:.2f}s).")
+        return tracks
+    def _number(self, path, arriving):
+        """(n, count) for engine.tag_file so its TRCK continues the folder's numbering; `arriving` is the current batch."""
+        cfg = self.engine.config
+        if not cfg.auto_number:
+            return 1, 1
+        offset = max(1, int(cfg.track_offset or 1))
+        tracks = self._folder_tracks(os.path.dirname(path), arriving)
+        n = tracks.get(path)
+        if n is None:
+            n = tracks[path] = max(max(tracks.values(), default=offset - 1) + 1, offset)
+        count = max(max(tracks.values()), len(tracks))
+        # track_number() adds the offset back
+        return n - offset + 1, count - offset + 1
+    def _tag(self, pool, ready):
+        arriving = {path for path, _ in ready}
+        jobs = [(path, seen, self._number(path, arriving)) for path, seen in ready]
+        total = self.stats.total + len(jobs)
+        tag = self.engine.tag_file
+        if pool:
+            futures = [pool.submit(tag, self.stats.total + k, total, path, number)
+                       for k, (path, _, number) in enumerate(jobs, start=1)]
+            results = (fut.result() for fut in futures)
+        else:
+            results = (tag(self.stats.total + k, total, path, number) for k, (path, _, number) in enumerate(jobs, start=1))
+        for (path, seen, _), res in zip(jobs, results):
+            done = time.time()
+            sig = stat_sig(path)
+            if sig:
+                self._written[path] = (sig, done)
+            self.stats.total += 1
+            self.stats.count(res)
+            if res.backup and self._backup_run:
+                self._backup_run.add(res.backup)
+            if res.timings is not None:
+                self.engine.timer.add_file(res.timings, res.seconds)
+            latency = done - seen
+            self._window.append((latency, res.seconds))
+            if res.ok:
+                verb = 'Unchanged' if res.write == WRITE_SKIPPED else 'Tagged'
+                self.engine.log(f"{verb}: {os.path.relpath(path, self.engine.config.folder)} "
+                                f"({res.seconds * 1000:.1f} ms, {latency:.2f}s after arrival)")
+            else:
+                self.engine.log(res.message)
+    def report(self, elapsed):
+        """Log throughput and latency of the files tagged in the last `elapsed` seconds."""
+        window, self._window = self._window, []
+        latencies = sorted(lat for lat, _ in window)
+        tag_times = sorted(secs for _, secs in window)
+        line = f"Watch: {len(window)} files in {elapsed:.0f}s ({len(window) / elapsed if elapsed else 0:.2f} files/s)"
+        if window:
+            line += (f"; arrival to tagged p50 {percentile(latencies, 0.5):.2f}s, p95 {percentile(latencies, 0.95):.2f}s"
+                     f"; tag time p50 {percentile(tag_times, 0.5) * 1000:.1f} ms, p95 {percentile(tag_times, 0.95) * 1000:.1f} ms")
+        line += f"; {len(self._pending)} settling, {self.stats.total} since start."
+        self.engine.log(line)
+        timer = self.engine.timer
+        timer.finish()
+        self.engine.write_reports(self.stats)
+    def run(self):
+        """Watch until the engine's cancel event is set. Returns the RunStats of every file tagged."""
+        engine = self.engine
+        cfg = engine.config
+        engine.timer = RunTimer()
+        engine.prepare()
+        source = open_source(cfg.folder, self.poll_interval, engine.log)
+        self._backup_run = engine._backup.open_run(cfg.folder) if engine._backup else None
+        if self._backup_run:
+            engine.log(f"Watch: saving the original tags of rewritten files as backup run {self._backup_run.id}.")
+        engine.log(f"Watching {cfg.folder} ({source.name}); files are tagged after {self.settle:g}s without changes.")
+        engine.open_io()
+        workers = engine.pool_size()
+        pool = ThreadPoolExecutor(workers, thread_name_prefix='watch') if workers > 1 else None
+        last_report = time.monotonic()
+        try:
+            while not engine.cancelled():
+                timeout = min(0.5, self.settle / 2) if self._pending else 0.5
+                covers = {}
+                for path in source.poll(timeout):
+                    if is_cover(os.path.basename(path)):
+                        covers[os.path.dirname(path)] = path
+                    else:
+                        self._note(path, time.time())
+                for path in covers.values():
+                    self._cover_changed(path)
+                # After the poll: events of writes made during the last batch are in by now
+                self._prune_written(time.time())
+                ready = self._settled(time.time())
+                if ready:
+                    self._tag(pool, ready)
+                if self.report_every and time.monotonic() - last_report >= self.report_every:
+                    self.report(time.monotonic() - last_report)
+                    last_report = time.monotonic()
+        finally:
+            source.close()
+            if pool:
+                pool.shutdown(wait=True, cancel_futures=True)
+            engine.close_io()
+            self.report(time.monotonic() - last_report)
+            if self._backup_run:
+                self._backup_run.close()
+                if self._backup_run.files:
+                    engine.log(f"Watch: backup run {self._backup_run.id} holds {self._backup_run.files} files; "
+                               f"undo it with --restore {self._backup_run.id}.")
+        return self.stats
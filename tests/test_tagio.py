@@ -0,0 +1,37 @@
+import os
+import struct
+import tempfile
+import unittest
+from unittest import mock
+from tagger import tagio
+from tagger.tagio import Chunk, RiffLayout, write_wav_id3
+def _wav(chunks):
+    body = b'WAVE' + b''.join(cid + struct.pack('<I', len(data)) + data + b'\0' * (len(data) & 1) for cid, data in chunks)
+    return b'RIFF' + struct.pack('<I', len(body)) + body
+class WavSizeLimitTest(unittest.TestCase):
+    """A tag that would push a plain RIFF WAV past 4 GiB is refused before the file is touched."""
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.wav')
+        os.close(fd)
+        self.addCleanup(os.remove, self.path)
+    def _write(self, data, layout):
+        with open(self.path, 'wb') as f:
+            f.write(data)
+        with mock.patch.object(tagio, 'parse_riff', return_value=layout):
+            with self.assertRaisesRegex(ValueError, '4 GiB'):
+                write_wav_id3(self.path, lambda available: b'ID3' + b'\0' * 4096)
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read(), data)
+    def test_tail_chunk_is_not_rewritten(self):
+        data = _wav([(b'fmt ', b'\0' * 16), (b'id3 ', b'ID3old')])
+        # The id3 chunk sits last, just under 4 GiB into the file
+        offset = 0xFFFFFFFF - 100
+        chunks = [Chunk(b'fmt ', 12, 16), Chunk(b'id3 ', offset, 6)]
+        self._write(data, RiffLayout(b'RIFF', offset + 6, offset + 8 + 6, chunks, None))
+    def test_chunk_is_not_appended(self):
+        data = _wav([(b'fmt ', b'\0' * 16), (b'data', b'\0' * 8)])
+        size = 0xFFFFFFFF - 100
+        chunks = [Chunk(b'fmt ', 12, 16), Chunk(b'data', 36, size)]
+        self._write(data, RiffLayout(b'RIFF', 36 + size, 44 + size, chunks, None))
+if __name__ == '__main__':
+    unittest.main()